@@ -0,0 +1,720 @@
+from asyncio import gather, get_running_loop, run as run_async, sleep
+from calendar import monthcalendar, monthrange
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date as date_type
+from itertools import repeat
+from json import dumps
+from os import cpu_count, environ
+from pathlib import Path
+from shutil import copyfile
+from sqlite3 import connect
+from subprocess import run
+from sys import executable
+from tempfile import TemporaryDirectory
+from timeit import default_timer
+from tracemalloc import get_traced_memory
+from tracemalloc import start as start_tracing_memory
+from tracemalloc import stop as stop_tracing_memory
+
+import npbc_aio
+import npbc_core
+import npbc_vectorized
+
+## paper counts to run the benchmarks at
+PAPER_COUNTS = [10, 100, 1000, 5000]
+
+
+## number of repeated calls for the benchmarks of single operations
+REPEATS = 2000
+
+
+## count every statement run on connections opened by npbc_core
+ # npbc_core.connect is swapped for a wrapper that attaches a trace callback to each new connection
+ # a fresh connection manager is used, so that connections opened before the measurement are not counted
+class QueryCounter:
+    def __init__(self):
+        self.connections = 0
+        self.queries = 0
+
+    def connect(self, *args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(self.count)
+        self.connections += 1
+        return connection
+
+    def count(self, statement: str) -> None:
+        self.queries += 1
+
+    def __enter__(self):
+        npbc_core.connect = self.connect
+        npbc_core.CONNECTION_MANAGER = npbc_core.ConnectionManager()
+        return self
+
+    def __exit__(self, *exc_info):
+        npbc_core.CONNECTION_MANAGER.close()
+        npbc_core.connect = connect
+
+
+## the number of times each weekday occurs in a month, the way npbc_core used to count it: from a full monthcalendar matrix
+def legacy_get_number_of_days_per_week(month: int, year: int) -> list[int]:
+    main_calendar = monthcalendar(year, month)
+    number_of_weeks = len(main_calendar)
+    number_of_weekdays = []
+
+    for i, _ in enumerate(npbc_core.WEEKDAY_NAMES):
+        number_of_weekday = number_of_weeks
+
+        if main_calendar[0][i] == 0:
+            number_of_weekday -= 1
+
+        if main_calendar[-1][i] == 0:
+            number_of_weekday -= 1
+
+        number_of_weekdays.append(number_of_weekday)
+
+    return number_of_weekdays
+
+
+## parse an undelivered string the way npbc_core used to: with monthrange calls and a date built for every candidate day
+def legacy_parse_undelivered_string(string: str, month: int, year: int) -> set[date_type]:
+    dates = set()
+
+    for section in npbc_core.SPLIT_REGEX['comma'].split(string.rstrip(',')):
+        if npbc_core.VALIDATE_REGEX['number'].match(section):
+            date = int(section)
+
+            if date > 0 and date <= monthrange(year, month)[1]:
+                dates.add(date_type(year, month, date))
+
+        elif npbc_core.VALIDATE_REGEX['range'].match(section):
+            start, end = [int(date) for date in npbc_core.SPLIT_REGEX['hyphen'].split(section)]
+
+            if (0 < start) and (start <= end) and (end <= monthrange(year, month)[1]):
+                dates.update(
+                    date_type(year, month, day)
+                    for day in range(start, end + 1)
+                )
+
+        elif npbc_core.VALIDATE_REGEX['days'].match(section):
+            weekday = npbc_core.WEEKDAY_NAMES.index(section.capitalize().rstrip('s'))
+
+            dates.update(
+                date_type(year, month, day)
+                for day in range(1, monthrange(year, month)[1] + 1)
+                if date_type(year, month, day).weekday() == weekday
+            )
+
+        elif npbc_core.VALIDATE_REGEX['n-day'].match(section):
+            n, weekday = npbc_core.SPLIT_REGEX['hyphen'].split(section)
+
+            n = int(n)
+
+            if n > 0 and n <= legacy_get_number_of_days_per_week(month, year)[npbc_core.WEEKDAY_NAMES.index(weekday.capitalize())]:
+                weekday = npbc_core.WEEKDAY_NAMES.index(weekday.capitalize())
+
+                valid_dates = [
+                    date_type(year, month, day)
+                    for day in range(1, monthrange(year, month)[1] + 1)
+                    if date_type(year, month, day).weekday() == weekday
+                ]
+
+                dates.add(valid_dates[n - 1])
+
+    return dates
+
+
+## validate an undelivered string the way npbc_core used to: check the whole string, then split it and try every pattern on every section
+def legacy_validate_undelivered_string(string: str) -> bool:
+    if npbc_core.VALIDATE_REGEX['CSVs'].match(string):
+
+        for section in npbc_core.SPLIT_REGEX['comma'].split(string.rstrip(',')):
+            section_validity = False
+
+            for pattern, regex in npbc_core.VALIDATE_REGEX.items():
+                if (not section_validity) and (pattern not in ["CSVs", "costs", "delivery"]) and (regex.match(section)):
+                    section_validity = True
+
+            if not section_validity:
+                return False
+
+        return True
+
+    return False
+
+
+## add a paper the way add_new_paper used to: a lookup for the new paper_id, and 14 separate inserts
+def legacy_add_new_paper(name: str, days_delivered: list[bool], days_cost: list[float]) -> None:
+    with npbc_core.get_connection() as connection:
+        connection.execute("INSERT INTO papers (name) VALUES (?);", (name, ))
+
+        paper_id = connection.execute("SELECT paper_id FROM papers WHERE name = ?;", (name, )).fetchone()[0]
+
+        for day_id, (cost, delivered) in enumerate(zip(days_cost, days_delivered)):
+            connection.execute("INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (?, ?, ?);", (paper_id, day_id, cost))
+            connection.execute("INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (?, ?, ?);", (paper_id, day_id, delivered))
+
+        connection.commit()
+
+
+## get the names, days and costs of every paper the way the getpapers command used to: four whole-table queries, pivoted through dictionaries, before anything is printed
+def legacy_get_papers() -> list[tuple[int, str, str, str]]:
+    papers_id_list = sorted(paper_id for paper_id, in npbc_core.query_database("SELECT paper_id FROM papers;"))
+    papers_names = dict(npbc_core.query_database("SELECT paper_id, name FROM papers;"))
+    papers_days: dict[int, dict[int, int]] = {paper_id: {} for paper_id in papers_id_list}
+    papers_costs: dict[int, dict[int, float]] = {paper_id: {} for paper_id in papers_id_list}
+
+    for paper_id, day_id, delivered in npbc_core.query_database("SELECT paper_id, day_id, delivered FROM papers_days_delivered;"):
+        papers_days[paper_id][day_id] = delivered
+
+    for paper_id, day_id, cost in npbc_core.query_database("SELECT paper_id, day_id, cost FROM papers_days_cost;"):
+        papers_costs[paper_id][day_id] = cost
+
+    return [
+        (
+            paper_id,
+            papers_names[paper_id],
+            ''.join('Y' if papers_days[paper_id][day_id] else 'N' for day_id in range(7)),
+            ';'.join(str(papers_costs[paper_id][day_id]) for day_id in range(7))
+        )
+        for paper_id in papers_id_list
+    ]
+
+
+## set up the DB the way setup_and_connect_DB used to: create the folder and file, read the schema file, and run all of it
+def legacy_setup_and_connect_DB(schema_path: Path) -> None:
+    npbc_core.DATABASE_DIR.mkdir(parents=True, exist_ok=True)
+    npbc_core.DATABASE_PATH.touch(exist_ok=True)
+
+    with npbc_core.get_connection() as connection:
+        connection.executescript(schema_path.read_text())
+        connection.commit()
+
+
+## generate a long undelivered string with the given number of sections, cycling through every kind of section
+def generate_undelivered_string(number_of_sections: int) -> str:
+    weekday_names = [name.lower() for name in npbc_core.WEEKDAY_NAMES]
+
+    return ', '.join(
+        [
+            f"{index % 31 + 1}",
+            f"{index % 28 + 1}-{index % 28 + 4}",
+            f"{weekday_names[index % 7]}s",
+            f"{index % 5 + 1}-{weekday_names[index % 7]}"
+        ][index % 4]
+        for index in range(number_of_sections)
+    )
+
+
+## undelivered strings used by the parsing benchmarks, from short to long
+UNDELIVERED_STRINGS = [
+    '5',
+    '1-5,mondays',
+    '1,3,5-9,2-monday,3-friday,sundays,20-25',
+    ','.join(['mondays', 'tuesdays', '1-3', '2-wednesday', '4-thursday', '30', '31', '15-20'] * 10)
+]
+
+## months used by the calendar and parsing benchmarks: every month of 50 years
+BENCHMARK_MONTHS = [(month, year) for year in range(1990, 2040) for month in range(1, 13)]
+
+
+## time a function without any DB instrumentation, returning the time in milliseconds
+def time_function(function) -> float:
+    start = default_timer()
+    function()
+    return (default_timer() - start) * 1000
+
+
+## create a DB in the given directory, and fill it with the given number of papers
+def create_database(directory: Path, number_of_papers: int) -> None:
+    npbc_core.DATABASE_DIR = directory
+    npbc_core.DATABASE_PATH = directory / 'npbc.db'
+    npbc_core.CONNECTION_MANAGER.close()
+
+    npbc_core.setup_and_connect_DB()
+
+    with connect(npbc_core.DATABASE_PATH) as connection:
+        for paper_number in range(number_of_papers):
+            paper_id = connection.execute(
+                "INSERT INTO papers (name) VALUES (?);",
+                (f"paper{paper_number}", )
+            ).lastrowid
+
+            connection.executemany(
+                "INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (?, ?, ?);",
+                [(paper_id, day_id, (paper_number + day_id) % 10) for day_id in range(7)]
+            )
+
+            connection.executemany(
+                "INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (?, ?, ?);",
+                [(paper_id, day_id, (paper_number + day_id) % 3 != 0) for day_id in range(7)]
+            )
+
+
+## load the cost and delivery data the way calculate_cost_of_all_papers used to: one paper at a time
+def load_papers_one_by_one() -> dict[int, tuple[dict[int, float], dict[int, bool]]]:
+    papers = npbc_core.query_database(
+        npbc_core.generate_sql_query('papers', columns=['paper_id'])
+    )
+
+    return {
+        paper_id: npbc_core.get_cost_and_delivery_data(paper_id)
+        for paper_id, in papers
+    }
+
+
+## time a function, and count the connections and queries it makes
+def measure(function) -> tuple[float, int, int, object]:
+    with QueryCounter() as counter:
+        start = default_timer()
+        result = function()
+        elapsed = default_timer() - start
+
+    return elapsed, counter.connections, counter.queries, result
+
+
+## compare loading paper data one paper at a time against the bulk loader
+def benchmark_paper_loading() -> None:
+    print("papers | loader | connections | queries | time (ms)")
+
+    for number_of_papers in PAPER_COUNTS:
+        with TemporaryDirectory() as directory:
+            create_database(Path(directory), number_of_papers)
+
+            one_by_one = measure(load_papers_one_by_one)
+            bulk = measure(npbc_core.get_cost_and_delivery_data_of_all_papers)
+
+            assert one_by_one[3] == bulk[3]
+
+            for name, (elapsed, connections, queries, _) in (('one by one', one_by_one), ('bulk', bulk)):
+                print(f"{number_of_papers} | {name} | {connections} | {queries} | {elapsed * 1000:.2f}")
+
+
+## run a query the way npbc_core used to: with a new connection for every call
+def query_with_new_connection(query: str) -> list[tuple]:
+    with npbc_core.connect(npbc_core.DATABASE_PATH) as connection:
+        return connection.execute(query).fetchall()
+
+
+## compare opening a connection for every query against reusing the shared connection
+def benchmark_connections() -> None:
+    print(f"\n{REPEATS} queries | connections | queries | time (ms)")
+
+    with TemporaryDirectory() as directory:
+        create_database(Path(directory), 100)
+        query = npbc_core.generate_sql_query('papers_days_cost', columns=['day_id', 'cost'], conditions={'paper_id': 1})
+
+        for name, function in (
+            ('connect per call', lambda: [query_with_new_connection(query) for _ in range(REPEATS)]),
+            ('shared connection', lambda: [npbc_core.query_database(query) for _ in range(REPEATS)])
+        ):
+            elapsed, connections, queries, _ = measure(function)
+            print(f"{name} | {connections} | {queries} | {elapsed * 1000:.2f}")
+
+
+## compare getudl/getlogs style lookups built with values in the SQL text against parameterized lookups
+ # every lookup is for a different paper, month and year, so the SQL text of the old queries is never repeated
+def benchmark_parameterized_queries() -> None:
+    print(f"\n{REPEATS} lookups | time (ms)")
+
+    with TemporaryDirectory() as directory:
+        create_database(Path(directory), 100)
+
+        with npbc_core.get_connection() as connection:
+            connection.executemany(
+                "INSERT INTO undelivered_strings (year, month, paper_id, string) VALUES (?, ?, ?, ?);",
+                [(2000 + index // 1200, index % 12 + 1, index % 100 + 1, '1-5') for index in range(REPEATS)]
+            )
+
+        lookups = [
+            {'paper_id': index % 100 + 1, 'month': index % 12 + 1, 'year': 2000 + index // 1200}
+            for index in range(REPEATS)
+        ]
+
+        for name, function in (
+            ('values in SQL text', lambda: [
+                npbc_core.query_database(npbc_core.generate_sql_query('undelivered_strings', conditions=conditions))
+                for conditions in lookups
+            ]),
+            ('parameterized', lambda: [
+                npbc_core.query_database(*npbc_core.generate_parameterized_query('undelivered_strings', conditions=conditions))
+                for conditions in lookups
+            ])
+        ):
+            elapsed, _, _, _ = measure(function)
+            print(f"{name} | {elapsed * 1000:.2f}")
+
+
+## compare billing many months one month at a time against the vectorized engine
+def benchmark_vectorized_billing() -> None:
+    print("\npapers | months | engine | time (ms)")
+
+    months = [(month, year) for year in range(2000, 2010) for month in range(1, 13)]
+    undelivered_strings = {
+        (month, year): {paper_id: 'mondays,1-3' for paper_id in range(1, 1001, 7)}
+        for month, year in months
+    }
+
+    for number_of_papers in PAPER_COUNTS[:-1]:
+        with TemporaryDirectory() as directory:
+            create_database(Path(directory), number_of_papers)
+
+            scalar = measure(lambda: [
+                npbc_core.calculate_cost_of_all_papers(undelivered_strings[(month, year)], month, year)
+                for month, year in months
+            ])
+            vectorized = measure(lambda: npbc_vectorized.calculate_cost_of_all_papers_for_months(months, undelivered_strings))
+
+            assert scalar[3] == vectorized[3]
+
+            for name, (elapsed, _, _, _) in (('scalar', scalar), ('vectorized', vectorized)):
+                print(f"{number_of_papers} | {len(months)} | {name} | {elapsed * 1000:.2f}")
+
+
+## compare calculating a month from scratch against serving the stored bills, when none, one or all of them are stale
+def benchmark_bills() -> None:
+    print("\npapers | bills | queries | time (ms)")
+
+    for number_of_papers in PAPER_COUNTS:
+        with TemporaryDirectory() as directory:
+            create_database(Path(directory), number_of_papers)
+
+            without_bills = measure(lambda: npbc_core.calculate_cost_of_all_papers_from_masks(
+                npbc_core.get_undelivered_masks(1, 2022),
+                1,
+                2022
+            ))
+            cold = measure(lambda: npbc_core.calculate_cost_of_all_papers(None, 1, 2022))
+            warm = measure(lambda: npbc_core.calculate_cost_of_all_papers(None, 1, 2022))
+
+            npbc_core.add_undelivered_string(1, 'mondays', 1, 2022)
+            one_stale = measure(lambda: npbc_core.calculate_cost_of_all_papers(None, 1, 2022))
+
+            assert without_bills[3] == cold[3] == warm[3]
+            assert one_stale[3] == npbc_core.calculate_cost_of_all_papers({1: 'mondays'}, 1, 2022)
+
+            for name, (elapsed, _, queries, _) in (('not used', without_bills), ('all stale', cold), ('one stale', one_stale), ('none stale', warm)):
+                print(f"{number_of_papers} | {name} | {queries} | {elapsed * 1000:.2f}")
+
+
+## compare adding undelivered entries one at a time (like separate addudl runs) against adding them in bulk from a JSON lines file
+ # adding one at a time is only timed for the smaller counts, because it needs a commit for every entry
+def benchmark_bulk_undelivered_strings() -> None:
+    print("\nentries | method | time (ms)")
+
+    for number_of_entries in (1000, 10000, 100000):
+        entries = [
+            (paper_id % 1000 + 1, f"{day}", month, 2022)
+            for paper_id, (day, month) in enumerate(
+                ((entry % 28 + 1, entry % 12 + 1) for entry in range(number_of_entries))
+            )
+        ]
+        lines = [
+            dumps({'key': paper_id, 'month': month, 'year': year, 'undelivered': undelivered_string})
+            for paper_id, undelivered_string, month, year in entries
+        ]
+
+        methods = [
+            ('bulk', lambda: npbc_core.add_undelivered_strings(npbc_core.read_undelivered_entries_from_jsonl(lines)))
+        ]
+
+        if number_of_entries <= 10000:
+            methods.insert(0, ('one at a time', lambda: [npbc_core.add_undelivered_string(*entry) for entry in entries]))
+
+        results = []
+
+        for name, function in methods:
+            with TemporaryDirectory() as directory:
+                create_database(Path(directory), 1000)
+
+                print(f"{number_of_entries} | {name} | {time_function(function):.2f}")
+
+                results.append(npbc_core.query_database("SELECT paper_id, month, year, string, mask FROM undelivered_strings ORDER BY paper_id, year, month;"))
+
+        assert all(result == results[0] for result in results)
+
+
+## compare adding papers one at a time (old and new add_new_paper) against importing them in bulk from a CSV file, and time exporting them
+def benchmark_paper_import() -> None:
+    print("\npapers | method | time (ms)")
+
+    for number_of_papers in PAPER_COUNTS[1:] + [20000]:
+        papers = [
+            (f"paper{paper_number}", [(paper_number + day_id) % 3 != 0 for day_id in range(7)], [float((paper_number + day_id) % 10) for day_id in range(7)])
+            for paper_number in range(number_of_papers)
+        ]
+        lines = ['name,days,costs'] + [
+            f"{name},{''.join('Y' if delivered else 'N' for delivered in days_delivered)},{';'.join(str(cost) for cost in days_cost)}"
+            for name, days_delivered, days_cost in papers
+        ]
+
+        results = []
+
+        for name, function in (
+            ('legacy one at a time', lambda: [legacy_add_new_paper(*paper) for paper in papers]),
+            ('one at a time', lambda: [npbc_core.add_new_paper(*paper) for paper in papers]),
+            ('bulk import', lambda: npbc_core.add_new_papers(npbc_core.read_papers_from_csv(lines)))
+        ):
+            with TemporaryDirectory() as directory:
+                create_database(Path(directory), 0)
+
+                print(f"{number_of_papers} | {name} | {time_function(function):.2f}")
+
+                results.append(npbc_core.get_cost_and_delivery_data_of_all_papers())
+
+                if name == 'bulk import':
+                    print(f"{number_of_papers} | export | {time_function(lambda: sum(1 for _ in npbc_core.iterate_papers())):.2f}")
+
+        assert all(result == results[0] for result in results)
+
+
+## compare setting up a DB that is already current the old way (running the whole schema) and the new way (reading the schema version)
+ # then time whole CLI runs of "getpapers", with the home folder pointed at a temporary directory
+def benchmark_startup() -> None:
+    print("\nstartup | time (ms)")
+
+    with TemporaryDirectory() as directory:
+        create_database(Path(directory), 100)
+
+        # the old schema file, which was the SQL of every migration
+        schema_path = Path(directory) / 'schema.sql'
+        schema_path.write_text('\n'.join(migration for migration in npbc_core.MIGRATIONS if isinstance(migration, str)))
+
+        for name, function in (
+            ('legacy setup', lambda: legacy_setup_and_connect_DB(schema_path)),
+            ('versioned setup', npbc_core.setup_and_connect_DB)
+        ):
+            function()
+            print(f"{name} | {min(time_function(function) for _ in range(REPEATS // 10)):.3f}")
+
+    with TemporaryDirectory() as directory:
+        environment = {**environ, 'HOME': directory, 'USERPROFILE': directory}
+        command = [executable, str(Path(__file__).parent / 'npbc_cli.py'), 'getpapers', '-n']
+
+        # the first run creates the DB
+        run(command, env=environment, capture_output=True, check=True)
+
+        times = sorted(
+            time_function(lambda: run(command, env=environment, capture_output=True, check=True))
+            for _ in range(20)
+        )
+
+        print(f"CLI getpapers (median of {len(times)}) | {times[len(times) // 2]:.1f}")
+
+
+## compare calling the core functions from an event loop directly against awaiting their async versions, many at once
+ # the longest time the event loop went without running is measured by a task that wakes up every millisecond
+def benchmark_async() -> None:
+    print("\nwork | method | time (ms) | longest event loop stall (ms)")
+
+    async def measure_stall(work) -> tuple[float, float]:
+        longest_stall = 0.0
+        done = False
+
+        async def heartbeat() -> None:
+            nonlocal longest_stall
+            last = default_timer()
+
+            while not done:
+                await sleep(0.001)
+                longest_stall = max(longest_stall, default_timer() - last)
+                last = default_timer()
+
+        heartbeat_task = get_running_loop().create_task(heartbeat())
+        await sleep(0.01)
+
+        start = default_timer()
+        await work()
+        elapsed = default_timer() - start
+
+        done = True
+        await heartbeat_task
+
+        return elapsed * 1000, longest_stall * 1000
+
+    async def blocking_calculations() -> None:
+        for _ in range(100):
+            npbc_core.calculate_cost_of_all_papers(None, 1, 2022)
+
+    async def async_calculations() -> None:
+        await gather(*(npbc_aio.calculate_cost_of_all_papers(None, 1, 2022) for _ in range(100)))
+
+    async def blocking_strings() -> None:
+        for paper_id in range(1, 1001):
+            npbc_core.add_undelivered_string(paper_id, '1-5', 2, 2022)
+
+    async def async_strings() -> None:
+        await gather(*(npbc_aio.add_undelivered_string(paper_id, '1-5', 3, 2022) for paper_id in range(1, 1001)))
+
+    with TemporaryDirectory() as directory:
+        create_database(Path(directory), 1000)
+
+        for work, method, function in (
+            ('100 calculations', 'blocking', blocking_calculations),
+            ('100 calculations', 'async', async_calculations),
+            ('1000 undelivered strings', 'blocking', blocking_strings),
+            ('1000 undelivered strings', 'async', async_strings)
+        ):
+            elapsed, longest_stall = run_async(measure_stall(function))
+            print(f"{work} | {method} | {elapsed:.2f} | {longest_stall:.2f}")
+
+        assert npbc_core.get_undelivered_masks(2, 2022) == npbc_core.get_undelivered_masks(3, 2022)
+
+
+## time calculating a month for many households' DBs (like batch-calculate), one DB at a time and with a pool of processes
+ # every run gets fresh copies of the DBs, so that no run reuses the bills stored by another
+def benchmark_batch_calculate() -> None:
+    print("\nDBs | papers per DB | workers | time (ms) | total time in DBs (ms)")
+
+    number_of_databases = 16
+
+    with TemporaryDirectory() as directory:
+        template = Path(directory) / 'template'
+        template.mkdir()
+        create_database(template, 1000)
+        npbc_core.CONNECTION_MANAGER.close()
+
+        for workers in sorted({1, 2, cpu_count() or 1}):
+            shards = Path(directory) / f"{workers}_workers"
+            shards.mkdir()
+
+            for database_number in range(number_of_databases):
+                copyfile(template / 'npbc.db', shards / f"household{database_number}.db")
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                start = default_timer()
+                results = list(executor.map(npbc_core.calculate_database, sorted(shards.glob('*.db')), repeat(1), repeat(2022)))
+                elapsed = default_timer() - start
+
+            assert len({total for total, _, _ in results}) == 1
+
+            print(f"{number_of_databases} | 1000 | {workers} | {elapsed * 1000:.2f} | {sum(database_elapsed for _, _, database_elapsed in results) * 1000:.2f}")
+
+
+## compare the calendar arithmetic module against the calendar calls npbc_core used to make
+def benchmark_calendar() -> None:
+    print(f"\n{len(BENCHMARK_MONTHS)} months | implementation | time (ms)")
+
+    assert [legacy_get_number_of_days_per_week(month, year) for month, year in BENCHMARK_MONTHS] == [npbc_core.get_number_of_days_per_week(month, year) for month, year in BENCHMARK_MONTHS]
+
+    print(f"days per week | monthcalendar | {time_function(lambda: [legacy_get_number_of_days_per_week(month, year) for month, year in BENCHMARK_MONTHS]):.2f}")
+    print(f"days per week | npbc_calendar | {time_function(lambda: [npbc_core.get_number_of_days_per_week(month, year) for month, year in BENCHMARK_MONTHS]):.2f}")
+
+
+## compare the old set-of-dates parsing and billing against the day mask parser and bit counting
+def benchmark_parsing() -> None:
+    print(f"\n{len(BENCHMARK_MONTHS)} months | operation | implementation | time (ms)")
+
+    cost_and_delivery_data = (
+        {0: 1, 1: 2, 2: 3, 3: 4, 4: 5, 5: 6, 6: 7},
+        {0: True, 1: True, 2: True, 3: True, 4: True, 5: True, 6: False}
+    )
+
+    for string in UNDELIVERED_STRINGS:
+        assert all(
+            legacy_parse_undelivered_string(string, month, year) == npbc_core.parse_undelivered_string(string, month, year)
+            for month, year in BENCHMARK_MONTHS
+        )
+
+        print(f"{len(string)} characters | parse | set of dates | {time_function(lambda: [legacy_parse_undelivered_string(string, month, year) for month, year in BENCHMARK_MONTHS]):.2f}")
+        print(f"{len(string)} characters | parse | day mask | {time_function(lambda: [npbc_core.parse_undelivered_string(string, month, year) for month, year in BENCHMARK_MONTHS]):.2f}")
+
+        legacy_dates = [(month, year, set(legacy_parse_undelivered_string(string, month, year))) for month, year in BENCHMARK_MONTHS]
+        masked_dates = [(month, year, npbc_core.parse_undelivered_string(string, month, year)) for month, year in BENCHMARK_MONTHS]
+
+        print(f"{len(string)} characters | bill | set of dates | {time_function(lambda: [npbc_core.calculate_cost_of_one_paper(npbc_core.get_number_of_days_per_week(month, year), dates, cost_and_delivery_data) for month, year, dates in legacy_dates]):.2f}")
+        print(f"{len(string)} characters | bill | day mask | {time_function(lambda: [npbc_core.calculate_cost_of_one_paper(npbc_core.get_number_of_days_per_week(month, year), dates, cost_and_delivery_data) for month, year, dates in masked_dates]):.2f}")
+
+## compare validating and then parsing with the old split-and-try-every-pattern code against the single-scan tokenizer
+def benchmark_validation() -> None:
+    print("\nsections | implementation | validate + parse 100 times (ms)")
+
+    for number_of_sections in [1, 10, 100, 500]:
+        string = generate_undelivered_string(number_of_sections)
+
+        assert legacy_validate_undelivered_string(string) and npbc_core.validate_undelivered_string(string)
+        assert legacy_parse_undelivered_string(string, 1, 2022) == npbc_core.parse_undelivered_string(string, 1, 2022)
+
+        print(f"{number_of_sections} | split and match | {time_function(lambda: [legacy_validate_undelivered_string(string) and legacy_parse_undelivered_string(string, 1, 2022) for _ in range(100)]):.2f}")
+        print(f"{number_of_sections} | single scan | {time_function(lambda: [npbc_core.validate_undelivered_string(string) and npbc_core.parse_undelivered_string(string, 1, 2022) for _ in range(100)]):.2f}")
+
+
+## measure what the metrics hooks cost: each kind of hook on its own while metrics are off, and calculating a month with metrics off and on
+ # with metrics off, a counter is a call to a method that does nothing, and a timed stage only checks whether timing or metrics are on
+def benchmark_metrics() -> None:
+    print("\nmeasurement | metrics | time (us)")
+
+    number_of_calls = 100000
+
+    def stage() -> None:
+        with npbc_core.TimedStage('compute'):
+            pass
+
+    for metrics in ('off', 'on'):
+        if metrics == 'on':
+            npbc_core.enable_metrics()
+
+        print(f"counter | {metrics} | {time_function(lambda: [npbc_core.METRICS.inc('npbc_calculations_total') for _ in range(number_of_calls)]) * 1000 / number_of_calls:.3f}")
+        print(f"timed stage | {metrics} | {time_function(lambda: [stage() for _ in range(number_of_calls)]) * 1000 / number_of_calls:.3f}")
+
+        npbc_core.disable_metrics()
+
+    with TemporaryDirectory() as directory:
+        create_database(Path(directory), 1000)
+        npbc_core.calculate_cost_of_all_papers(None, 1, 2022)
+
+        for metrics in ('off', 'on', 'off', 'on'):
+            if metrics == 'on':
+                npbc_core.enable_metrics()
+
+            print(f"calculate 1000 papers (stored bills) | {metrics} | {time_function(lambda: [npbc_core.calculate_cost_of_all_papers(None, 1, 2022) for _ in range(100)]) * 10:.1f}")
+            print(f"calculate 1000 papers (from masks) | {metrics} | {time_function(lambda: [npbc_core.calculate_cost_of_all_papers_from_masks({}, 1, 2022) for _ in range(20)]) * 50:.1f}")
+
+            npbc_core.disable_metrics()
+
+
+## compare listing every paper (like "getpapers -n -d -p") the old way, pivoted in Python, against get_papers, streamed from one query
+ # each paper is formatted like a printed line and thrown away, and the peak memory (of Python objects) is measured with tracemalloc
+def benchmark_getpapers() -> None:
+    print("\npapers | method | time (ms) | peak memory (KiB)")
+
+    def list_papers(papers) -> None:
+        for paper_id, *values in papers:
+            f"{paper_id}: {', '.join(values)}"
+
+    for number_of_papers in [1000, 10000, 100000]:
+        with TemporaryDirectory() as directory:
+            create_database(Path(directory), number_of_papers)
+
+            assert legacy_get_papers() == list(npbc_core.get_papers())
+
+            for method, get_papers in (
+                ('pivoted in Python', legacy_get_papers),
+                ('streamed', npbc_core.get_papers)
+            ):
+                elapsed = time_function(lambda: list_papers(get_papers()))
+
+                # tracing memory slows everything down, so it is measured on a run of its own
+                start_tracing_memory()
+                list_papers(get_papers())
+                _, peak = get_traced_memory()
+                stop_tracing_memory()
+
+                print(f"{number_of_papers} | {method} | {elapsed:.1f} | {peak / 1024:.0f}")
+
+
+if __name__ == '__main__':
+    benchmark_paper_loading()
+    benchmark_connections()
+    benchmark_parameterized_queries()
+    benchmark_vectorized_billing()
+    benchmark_bills()
+    benchmark_bulk_undelivered_strings()
+    benchmark_paper_import()
+    benchmark_startup()
+    benchmark_async()
+    benchmark_batch_calculate()
+    benchmark_calendar()
+    benchmark_parsing()
+    benchmark_validation()
+    benchmark_metrics()
+    benchmark_getpapers()
@@ -0,0 +1,223 @@
+## benchmark suite for the hot paths of npbc, on a synthetic DB of a configurable size
+ # results are saved as JSON, and can be compared against a baseline saved by an earlier run, to catch slowdowns
+ # bench_core.py compares old and new implementations of single changes, while this times the code as it is now
+ #
+ # usage:
+ #   python bench_suite.py --output baseline.json
+ #   python bench_suite.py --baseline baseline.json --output results.json
+ # the comparison exits with status 1 if any benchmark is slower than the baseline by more than the threshold
+
+from argparse import ArgumentParser
+from argparse import Namespace as arg_namespace
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from json import dumps, loads
+from pathlib import Path
+from platform import python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from timeit import default_timer
+from typing import Callable
+
+import npbc_cli
+import npbc_core
+
+## default size of the synthetic DB
+DEFAULT_PAPERS = 1000
+DEFAULT_YEARS = 3
+
+## default number of times each benchmark is run. the median is compared, and the minimum is kept for reference
+DEFAULT_REPEATS = 20
+
+## how much slower than the baseline a benchmark may be before it is flagged, as a fraction of the baseline
+ # timings on a shared machine vary by a few percent between runs, so this is well above that
+DEFAULT_THRESHOLD = 0.25
+
+## the month that is calculated and logged by the benchmarks
+ # the generated history is whole years, ending with this month
+BENCHMARK_MONTH = (12, 2021)
+
+## undelivered strings for the parsing benchmarks, with every kind of section, from short to long
+UNDELIVERED_STRINGS = [
+    '5',
+    '1-5,mondays',
+    '1,3,5-9,2-monday,3-friday,sundays,20-25',
+    ','.join(['mondays', 'tuesdays', '1-3', '2-wednesday', '4-thursday', '30', '31', '15-20'] * 10)
+]
+
+
+## get an undelivered string for a paper and month of the synthetic DB
+ # the strings vary in kind of section, like real ones. the longest one is left out, since nobody types that much for one month
+def get_synthetic_string(paper_number: int, month_number: int) -> str:
+    return UNDELIVERED_STRINGS[(paper_number + month_number) % (len(UNDELIVERED_STRINGS) - 1)]
+
+
+## fill a new DB with papers, undelivered strings for every paper and month of some years, and the log of every one of those months
+ # the years end with the benchmark month, and every paper has an undelivered string in every other month
+ # the DB is made in the given directory, and npbc_core is pointed at it
+def generate_database(directory: Path, number_of_papers: int, number_of_years: int) -> None:
+    npbc_core.set_database_path(directory / 'npbc.db')
+    npbc_core.setup_and_connect_DB()
+
+    npbc_core.add_new_papers(
+        (
+            f"paper{paper_number}",
+            [(paper_number + day_id) % 3 != 0 for day_id in range(7)],
+            [float((paper_number + day_id) % 10) for day_id in range(7)]
+        )
+        for paper_number in range(number_of_papers)
+    )
+
+    _, last_year = BENCHMARK_MONTH
+    months = list(npbc_core.get_months_in_range(
+        datetime(last_year - number_of_years + 1, 1, 1).date(),
+        datetime(last_year, 12, 1).date()
+    ))
+
+    npbc_core.add_undelivered_strings(
+        (paper_number + 1, get_synthetic_string(paper_number, month_number), month, year)
+        for month_number, (month, year) in enumerate(months)
+        for paper_number in range(number_of_papers)
+        if (paper_number + month_number) % 2 == 0
+    )
+
+    for month, year in months:
+        npbc_core.save_results(npbc_core.calculate_cost_of_all_papers(None, month, year)[2], month, year)
+
+
+## run a function some times, and get the median and minimum time it took, in milliseconds
+def time_function(function: Callable[[], object], repeats: int) -> dict[str, float]:
+    times = []
+
+    for _ in range(repeats):
+        start = default_timer()
+        function()
+        times.append((default_timer() - start) * 1000)
+
+    return {
+        'median_ms': median(times),
+        'min_ms': min(times),
+        'repeats': repeats
+    }
+
+
+## run a CLI command with its output thrown away
+def run_quietly(command: Callable[[arg_namespace], None], arguments: list[str]) -> Callable[[], None]:
+    args = npbc_cli.define_and_read_args(arguments)
+
+    def run() -> None:
+        with redirect_stdout(StringIO()):
+            command(args)
+
+    return run
+
+
+## time every hot path on the current DB, and get {benchmark name: timings}
+def run_benchmarks(repeats: int) -> dict[str, dict[str, float]]:
+    month, year = BENCHMARK_MONTH
+    number_of_days_per_week = npbc_core.get_number_of_days_per_week(month, year)
+    cost_and_delivery_data = npbc_core.get_cost_and_delivery_data(1)
+    undelivered_dates = [npbc_core.parse_undelivered_string(string, month, year) for string in UNDELIVERED_STRINGS]
+    undelivered_masks = npbc_core.get_undelivered_masks(month, year)
+    results = npbc_core.calculate_cost_of_all_papers(None, month, year)
+
+    benchmarks: dict[str, Callable[[], object]] = {
+        'validate_undelivered_string': lambda: [npbc_core.validate_undelivered_string(string) for string in UNDELIVERED_STRINGS],
+        'parse_undelivered_string': lambda: [npbc_core.parse_undelivered_string(string, month, year) for string in UNDELIVERED_STRINGS],
+        'calculate_cost_of_one_paper': lambda: [npbc_core.calculate_cost_of_one_paper(number_of_days_per_week, dates, cost_and_delivery_data) for dates in undelivered_dates],
+
+        # with the stored bills, and without them (every paper is calculated from its stored mask)
+        'calculate_cost_of_all_papers': lambda: npbc_core.calculate_cost_of_all_papers(None, month, year),
+        'calculate_cost_of_all_papers (no bills)': lambda: npbc_core.calculate_cost_of_all_papers_from_masks(undelivered_masks, month, year),
+
+        'getpapers': run_quietly(npbc_cli.getpapers, ['getpapers', '-n', '-d', '-p']),
+        'getlogs (one paper)': run_quietly(npbc_cli.getlogs, ['getlogs', '-k', '1']),
+        'getlogs (one month)': run_quietly(npbc_cli.getlogs, ['getlogs', '-k', '1', '-m', str(month), '-y', str(year)]),
+
+        # last, since every run adds to the log that getlogs reads
+        'save_results': lambda: npbc_core.save_results(results[2], month, year)
+    }
+
+    timings = {}
+
+    for name, function in benchmarks.items():
+
+        # one run first, so that caches are warm and nothing is measured on its first use
+        function()
+        timings[name] = time_function(function, repeats)
+
+    return timings
+
+
+## compare results against a baseline, print the comparison, and get the names of the benchmarks that got slower by more than the threshold
+ # benchmarks that are only in one of them are listed, but not flagged
+def compare_results(results: dict, baseline: dict, threshold: float) -> list[str]:
+    slower = []
+
+    if results['scale'] != baseline['scale']:
+        print(f"Warning: the baseline was run at a different scale ({baseline['scale']}), so the comparison may not be meaningful.")
+
+    print("benchmark | baseline (ms) | now (ms) | change")
+
+    for name, timings in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print(f"{name} | - | {timings['median_ms']:.3f} | new")
+            continue
+
+        baseline_median = baseline['benchmarks'][name]['median_ms']
+        change = timings['median_ms'] / baseline_median - 1 if baseline_median else 0
+
+        flag = ''
+
+        if change > threshold:
+            slower.append(name)
+            flag = ' SLOWER'
+
+        print(f"{name} | {baseline_median:.3f} | {timings['median_ms']:.3f} | {change:+.0%}{flag}")
+
+    for name in baseline['benchmarks'].keys() - results['benchmarks'].keys():
+        print(f"{name} | {baseline['benchmarks'][name]['median_ms']:.3f} | - | removed")
+
+    return slower
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Time the hot paths of npbc on a synthetic DB, and compare them against a baseline.")
+    parser.add_argument('--papers', type=int, default=DEFAULT_PAPERS, help="Number of papers in the DB.")
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS, help="Number of years of undelivered strings and logs in the DB.")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="Number of times to run each benchmark.")
+    parser.add_argument('--output', type=Path, metavar='PATH', help="File to save the results to, as JSON.")
+    parser.add_argument('--baseline', type=Path, metavar='PATH', help="Results of an earlier run to compare against.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Fraction by which a benchmark may be slower than the baseline before it is flagged.")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        start = default_timer()
+        generate_database(Path(directory), args.papers, args.years)
+        print(f"Generated a DB with {args.papers} papers and {args.years} years of history in {default_timer() - start:.1f} s.")
+
+        results = {
+            'scale': {'papers': args.papers, 'years': args.years},
+            'python': python_version(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'benchmarks': run_benchmarks(args.repeats)
+        }
+
+        npbc_core.CONNECTION_MANAGER.close()
+
+    if args.output:
+        args.output.write_text(dumps(results, indent=4))
+
+    if args.baseline:
+        slower = compare_results(results, loads(args.baseline.read_text()), args.threshold)
+
+        if slower:
+            print(f"\n{len(slower)} benchmark(s) slower than the baseline: {', '.join(slower)}")
+            raise SystemExit(1)
+
+    else:
+        print("benchmark | median (ms) | min (ms)")
+
+        for name, timings in results['benchmarks'].items():
+            print(f"{name} | {timings['median_ms']:.3f} | {timings['min_ms']:.3f}")
@@ -0,0 +1,28 @@
+from pytest import fixture
+
+import npbc_core
+from npbc_core import ConnectionManager, add_new_paper, setup_and_connect_DB
+
+
+## point the core module at a fresh DB in a temporary directory
+@fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'DATABASE_DIR', tmp_path)
+    monkeypatch.setattr(npbc_core, 'DATABASE_PATH', tmp_path / 'npbc.db')
+    monkeypatch.setattr(npbc_core, 'CONNECTION_MANAGER', ConnectionManager())
+
+    setup_and_connect_DB()
+
+    yield tmp_path / 'npbc.db'
+
+    npbc_core.CONNECTION_MANAGER.close()
+
+
+## a DB with a few papers in it
+@fixture
+def papers_database(database):
+    add_new_paper('paper1', [True, True, True, True, True, True, True], [1, 2, 3, 4, 5, 6, 7])
+    add_new_paper('paper2', [False, False, True, True, True, False, True], [0, 0, 2, 2, 5, 0, 1])
+    add_new_paper('paper3', [False, False, False, False, False, False, False], [0, 0, 0, 0, 0, 0, 0])
+
+    return database
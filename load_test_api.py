@@ -0,0 +1,120 @@
+from argparse import ArgumentParser
+from atexit import register as register_exit_handler
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from os import environ
+from pathlib import Path
+from socket import socket
+from subprocess import DEVNULL, Popen
+from sys import executable
+from tempfile import TemporaryDirectory
+from time import sleep
+from timeit import default_timer
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+## requests made by the load test, as (name, method, path, JSON body)
+ # the undelivered strings are added to a month that is never calculated, so that the reads measure the same work throughout
+ # each addudl request is for a different paper (see load_test), so that no string grows with the number of requests
+ENDPOINTS = [
+    ('calculate', 'GET', '/calculate?month=1&year=2022', None),
+    ('getpapers', 'GET', '/getpapers', None),
+    ('getlogs', 'GET', '/getlogs?month=1&year=2022', None),
+    ('addudl', 'POST', '/addudl', {'key': 1, 'undelivered': '5', 'month': 1, 'year': 2000})
+]
+
+
+## get a percentile of some latencies, by the nearest rank
+def get_percentile(latencies: list[float], percentile: float) -> float:
+    latencies = sorted(latencies)
+    return latencies[max(0, round(percentile / 100 * len(latencies)) - 1)]
+
+
+## make a request, and return how long it took, in milliseconds
+def time_request(url: str, method: str, body: dict | None) -> float:
+    request = Request(
+        url,
+        method=method,
+        data=dumps(body).encode() if body is not None else None,
+        headers={'Content-Type': 'application/json'}
+    )
+
+    start = default_timer()
+
+    with urlopen(request) as response:
+        response.read()
+
+    return (default_timer() - start) * 1000
+
+
+## make a number of requests to one endpoint from many threads at once, and print the requests per second and latencies
+def load_test(base_url: str, name: str, method: str, path: str, body: dict | None, number_of_requests: int, concurrency: int) -> None:
+
+    # one request first, so that loading the papers isn't counted
+    time_request(base_url + path, method, body)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = default_timer()
+        latencies = list(executor.map(
+            lambda request_number: time_request(base_url + path, method, body and dict(body, key=request_number + 2)),
+            range(number_of_requests)
+        ))
+        elapsed = default_timer() - start
+
+    print(f"{name} | {number_of_requests / elapsed:.0f} | {get_percentile(latencies, 50):.2f} | {get_percentile(latencies, 99):.2f}")
+
+
+## start the API server on a fresh DB with some papers, in its own process, and return its URL
+ # the server runs in a separate process so that the threads making requests don't compete with it for the GIL
+ # the DB is made in <directory>/.npbc, and the server is given the directory as its home, which is where it looks for the DB
+def start_local_server(directory: Path, number_of_papers: int, threads: int) -> str:
+    from bench_core import create_database
+    from npbc_core import UndeliveredDates, save_results
+
+    create_database(directory / '.npbc', number_of_papers)
+
+    # log a month of results, so that getlogs has something to return
+    save_results({paper_id: UndeliveredDates(0b101, 1, 2022) for paper_id in range(1, number_of_papers + 1)}, 1, 2022)
+
+    # find a free port
+    with socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        port = free_socket.getsockname()[1]
+
+    server = Popen(
+        [executable, 'npbc_api.py', '--port', str(port), '--threads', str(threads)],
+        cwd=Path(__file__).parent,
+        env={**environ, 'HOME': str(directory), 'USERPROFILE': str(directory)},
+        stderr=DEVNULL
+    )
+
+    register_exit_handler(server.terminate)
+
+    # wait until the server answers
+    for _ in range(100):
+        try:
+            time_request(f"http://127.0.0.1:{port}/getpapers", 'GET', None)
+            break
+
+        except URLError:
+            sleep(0.1)
+
+    return f"http://127.0.0.1:{port}"
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Load test the API, and report requests per second and latencies for each endpoint.")
+    parser.add_argument('--url', help="URL of a running server (addudl adds strings to its DB). If not given, a server is started on a new DB.")
+    parser.add_argument('--papers', type=int, default=1000, help="Number of papers in the new DB.")
+    parser.add_argument('--threads', type=int, default=8, help="Number of threads of the started server.")
+    parser.add_argument('--requests', type=int, default=2000, help="Number of requests to make to each endpoint.")
+    parser.add_argument('--concurrency', type=int, default=16, help="Number of requests to make at once.")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        base_url = args.url.rstrip('/') if args.url else start_local_server(Path(directory), args.papers, args.threads)
+
+        print("endpoint | requests per second | p50 (ms) | p99 (ms)")
+
+        for name, method, path, body in ENDPOINTS:
+            load_test(base_url, name, method, path, body, args.requests, args.concurrency)
@@ -0,0 +1,161 @@
+## asyncio versions of the core functions, for use from an event loop
+ # the DB work (and the parsing and calculating that goes with it) runs on a dedicated pool of threads, so it never blocks the event loop
+ # each thread of the pool keeps its own connection from the core module's connection manager
+ # functions that only build queries (generate_sql_query, generate_parameterized_query) don't touch the DB, so they are used straight from npbc_core
+
+from asyncio import (AbstractEventLoop, Future, Semaphore, Task,
+                     get_running_loop, wait)
+from collections.abc import Set
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_type
+from functools import partial
+from typing import Callable, TypeVar
+from weakref import WeakKeyDictionary
+
+import npbc_core
+from npbc_core import validate_month_and_year, validate_undelivered_string
+
+## number of threads doing DB work at once
+ # SQLite only has one writer at a time, so more threads mostly help reads
+MAX_WORKERS = 4
+
+## number of calls that may be waiting for (or using) the threads at once, across all functions here
+ # calls past this wait on the event loop, so a flood of calls can't queue up an unbounded amount of work
+MAX_PENDING = 64
+
+
+## the pool of threads that does the DB work of every event loop
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='npbc')
+
+Result = TypeVar('Result')
+
+
+## what this module keeps for each event loop, since asyncio objects can only be used from the loop they were made on
+ # calculations maps (month, year, writes) to the calculation in progress, so that identical calculations running at the same time are only done once
+ # writes counts the writes made through this module, so that a calculation started before a write is never shared with one asked for after it
+ # last_write is the latest of those writes. each write waits for the one before it, and a calculation waits for the latest one, so that it includes every write asked for before it
+ # pending_strings are undelivered strings waiting to be written together, with the futures of the calls that added them
+class LoopState:
+    def __init__(self):
+        self.semaphore = Semaphore(MAX_PENDING)
+        self.calculations: dict[tuple[int, int, int], Task] = {}
+        self.writes = 0
+        self.last_write: Task | None = None
+        self.pending_strings: list[tuple[tuple[int, str, int, int], Future]] = []
+
+
+## the state of each running event loop, which is dropped with the loop
+LOOP_STATES: WeakKeyDictionary[AbstractEventLoop, LoopState] = WeakKeyDictionary()
+
+
+## get the state of the running event loop, creating it the first time
+def get_loop_state() -> LoopState:
+    loop = get_running_loop()
+
+    if loop not in LOOP_STATES:
+        LOOP_STATES[loop] = LoopState()
+
+    return LOOP_STATES[loop]
+
+
+## run a function on the pool of threads, once there is room for it
+async def run_in_executor(function: Callable[..., Result], *args, **kwargs) -> Result:
+    async with get_loop_state().semaphore:
+        return await get_running_loop().run_in_executor(EXECUTOR, partial(function, *args, **kwargs))
+
+
+## run a query, and get all the rows it returns
+async def query_database(query: str, parameters: tuple[int | str, ...] = ()) -> list[tuple]:
+    return await run_in_executor(npbc_core.query_database, query, parameters)
+
+
+## run a function on the pool of threads, once a write has finished (whether or not it worked)
+async def run_after_write(write: Task | None, function: Callable[..., Result], *args, **kwargs) -> Result:
+    if write is not None:
+        await wait([write])
+
+    return await run_in_executor(function, *args, **kwargs)
+
+
+## calculate the cost of all papers for the full month, like npbc_core.calculate_cost_of_all_papers
+ # when neither undelivered strings nor cost and delivery data are given (so the stored bills and strings are used), calls for the same month that run at the same time share one calculation
+ # those callers get the same dictionaries, so they must not change them
+async def calculate_cost_of_all_papers(undelivered_strings: dict[int, str] | None, month: int, year: int, cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]] | None = None) -> tuple[dict[int, float], float, dict[int, Set[date_type]]]:
+    if undelivered_strings is not None or cost_and_delivery_data is not None:
+        return await run_in_executor(npbc_core.calculate_cost_of_all_papers, undelivered_strings, month, year, cost_and_delivery_data=cost_and_delivery_data)
+
+    state = get_loop_state()
+    key = (month, year, state.writes)
+
+    if key not in state.calculations:
+        calculation = get_running_loop().create_task(
+            run_after_write(state.last_write, npbc_core.calculate_cost_of_all_papers, None, month, year)
+        )
+
+        state.calculations[key] = calculation
+        calculation.add_done_callback(lambda _: state.calculations.pop(key, None))
+
+    return await state.calculations[key]
+
+
+## write all the undelivered strings added since the last batch, in one transaction, once the write before it has finished
+ # every string was validated when it was added, so the batch can only fail as a whole (for example, if the DB can't be written)
+async def write_pending_strings(state: LoopState, previous_write: Task | None) -> None:
+    if previous_write is not None:
+        await wait([previous_write])
+
+    # strings added while waiting are part of the batch too
+    batch, state.pending_strings = state.pending_strings, []
+
+    try:
+        feedback = await run_in_executor(npbc_core.add_undelivered_strings, [entry for entry, _ in batch])
+
+    except Exception as error:
+        for _, future in batch:
+            future.set_exception(error)
+
+        return
+
+    for _, future in batch:
+        future.set_result((True, "Undelivered string added.") if feedback[0] else feedback)
+
+
+## record a string for date(s) a paper was not delivered, like npbc_core.add_undelivered_string
+ # strings added at the same time (before the event loop gets to write them) are written together, in one transaction, in the order they were added
+async def add_undelivered_string(paper_id: int, undelivered_string: str, month: int, year: int) -> tuple[bool, str]:
+
+    # if the string is not valid, return an error message
+    if not validate_undelivered_string(undelivered_string):
+        return False, "Invalid undelivered string."
+
+    # an invalid month would fail the whole batch, so it is rejected here
+    if not validate_month_and_year(month, year)[0]:
+        return False, "Invalid month and/or year."
+
+    state = get_loop_state()
+    future = get_running_loop().create_future()
+
+    state.pending_strings.append(((paper_id, undelivered_string, month, year), future))
+    state.writes += 1
+
+    # the first string of a batch starts writing it, once everything that's ready to run has had a chance to add to it
+    if len(state.pending_strings) == 1:
+        state.last_write = get_running_loop().create_task(write_pending_strings(state, state.last_write))
+
+    return await future
+
+
+## add a new paper, like npbc_core.add_new_paper
+async def add_new_paper(name: str, days_delivered: list[bool], days_cost: list[float]) -> tuple[bool, str]:
+    state = get_loop_state()
+    state.writes += 1
+    state.last_write = get_running_loop().create_task(
+        run_after_write(state.last_write, npbc_core.add_new_paper, name, days_delivered, days_cost)
+    )
+
+    return await state.last_write
+
+
+## save the results of undelivered dates to the DB, like npbc_core.save_results
+async def save_results(undelivered_dates: dict[int, Set[date_type]], month: int, year: int) -> None:
+    await run_in_executor(npbc_core.save_results, undelivered_dates, month, year)
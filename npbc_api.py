@@ -0,0 +1,359 @@
+from argparse import ArgumentParser
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+from typing import Iterator
+
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from waitress import serve
+
+import npbc_core
+from npbc_core import (WEEKDAY_NAMES, add_undelivered_strings,
+                       calculate_cost_of_all_papers_from_bills,
+                       count_calculation, enable_metrics,
+                       generate_parameterized_query,
+                       get_cost_and_delivery_data_of_all_papers,
+                       get_papers_version, get_previous_month,
+                       get_undelivered_entry, iterate_log_entries,
+                       query_database, set_database_path, setup_and_connect_DB,
+                       start_sql_trace, validate_month_and_year)
+
+## default address and number of worker threads of the server
+ # each worker thread gets its own connection to the DB from the core module's connection manager, which it keeps for as long as the server runs
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_THREADS = 8
+
+
+app = Flask(__name__)
+
+# responses are encoded in the order they are built, which is also faster than sorting every key
+app.json.sort_keys = False  # type: ignore
+
+
+## the papers, kept in memory between requests
+ # they are loaded again only when the version of the papers in the DB changes (see get_papers_version), so a paper edited with the CLI is picked up by the next request
+ # the names are used to label bills, and the cost and delivery data to calculate the papers without an up to date bill
+ # the response to getpapers is encoded once for each version, since it can only change with the papers
+ # everything is replaced together, so a request never sees half of a reload
+class WarmPapers:
+    def __init__(self):
+        self.lock = Lock()
+        self.version: int | None = None
+        self.papers: tuple[int, dict[int, str], dict[int, tuple[dict[int, float], dict[int, bool]]], str] = (-1, {}, {}, '')
+
+    ## get (the version they were loaded at, {paper_id: name}, the cost and delivery data of each paper, the body of the response to getpapers), loading them again if they are out of date
+    def get(self) -> tuple[int, dict[int, str], dict[int, tuple[dict[int, float], dict[int, bool]]], str]:
+        version = get_papers_version()
+
+        if version != self.version:
+
+            # only one thread loads the papers, and any others waiting for it use what it loaded
+            with self.lock:
+                if version != self.version:
+
+                    # the version is read before the papers, so if they change while loading, the next request loads them again
+                    names = dict(query_database(*generate_parameterized_query('papers', columns=['paper_id', 'name'])))
+                    cost_and_delivery_data = get_cost_and_delivery_data_of_all_papers()
+
+                    # days and costs are lists in the order of the weekdays, starting with Monday
+                    papers = [
+                        {
+                            'paper_id': paper_id,
+                            'name': names.get(paper_id),
+                            'days': [bool(delivery_data.get(day_id)) for day_id, _ in enumerate(WEEKDAY_NAMES)],
+                            'costs': [cost_data.get(day_id, 0) for day_id, _ in enumerate(WEEKDAY_NAMES)]
+                        }
+                        for paper_id, (cost_data, delivery_data) in sorted(cost_and_delivery_data.items())
+                    ]
+
+                    self.papers = version, names, cost_and_delivery_data, app.json.dumps({'success': True, 'papers': papers})
+                    self.version = version
+
+        return self.papers
+
+
+## the papers kept in memory by this server
+WARM_PAPERS = WarmPapers()
+
+
+## start timing a request, if metrics are on
+@app.before_request
+def start_timing():
+    if npbc_core.METRICS.enabled:
+        g.start = perf_counter()
+
+
+## record the time a request took, by endpoint, in the same metric as the time of CLI commands
+@app.after_request
+def record_time(response):
+    if 'start' in g:
+        npbc_core.METRICS.observe('npbc_command_seconds', perf_counter() - g.start, command=request.endpoint or 'unknown')
+
+    return response
+
+
+## send an error message, in the same format as the core functions' feedback
+def error_response(message: str, status: int = 400):
+    return jsonify(success=False, message=message), status
+
+
+## get the days of the month in a day mask, in order
+def get_days(mask: int) -> list[int]:
+    return [
+        day
+        for day in range(1, mask.bit_length() + 1)
+        if mask >> (day - 1) & 1
+    ]
+
+
+## get an integer from the query string, or None if it isn't given
+ # a value that isn't an integer raises ValueError, so that a bad filter is an error instead of being left out
+def get_int_arg(name: str) -> int | None:
+    value = request.args.get(name)
+
+    if value is None:
+        return None
+
+    return int(value)
+
+
+## get the month and year from the query string, in the same way the CLI does
+ # default to the previous month if no month and no year is given
+ # default to the current month if no month is given and year is given
+ # default to the current year if no year is given and month is given
+def get_month_and_year() -> tuple[bool, str, int, int]:
+    try:
+        month = get_int_arg('month')
+        year = get_int_arg('year')
+
+    except ValueError:
+        return False, "Invalid month and/or year.", 0, 0
+
+    if month is None and year is None:
+        previous_month = get_previous_month()
+        return True, '', previous_month.month, previous_month.year
+
+    feedback = validate_month_and_year(month, year)
+
+    return *feedback, month if month is not None else datetime.now().month, year if year is not None else datetime.now().year
+
+
+## calculate the cost of all papers for a month
+ # the bills stored in the DB are used (see calculate_cost_of_all_papers_from_bills), so only papers that changed since the month was last calculated are calculated again
+ # those are calculated from the papers kept in memory, so only the bills and undelivered strings of the month are read from the DB
+ # the undelivered dates of each paper are given as days of the month. the results are not logged
+@app.get('/calculate')
+def calculate():
+    success, message, month, year = get_month_and_year()
+
+    if not success:
+        return error_response(message)
+
+    version, names, cost_and_delivery_data, _ = WARM_PAPERS.get()
+
+    costs, total, undelivered_dates = calculate_cost_of_all_papers_from_bills(month, year, cost_and_delivery_data=cost_and_delivery_data, papers_version=version)
+
+    count_calculation(costs)
+
+    return jsonify(
+        success=True,
+        month=month,
+        year=year,
+        total=total,
+        papers=[
+            {
+                'paper_id': paper_id,
+                'name': names.get(paper_id),
+                'cost': cost,
+                'undelivered': get_days(undelivered_dates[paper_id].mask) # type: ignore
+            }
+            for paper_id, cost in costs.items()
+        ]
+    )
+
+
+## add undelivered strings, from one entry or a list of them
+ # entries have the same keys as the lines of a JSON lines file given to "npbc addudl --file": "key", "undelivered", and optionally "month" and "year"
+ # a missing month or year is the current one. nothing is added if any entry is invalid
+@app.post('/addudl')
+def addudl():
+    body = request.get_json(silent=True)
+    entries = body if isinstance(body, list) else [body]
+
+    try:
+        entries = [
+            get_undelivered_entry(entry if isinstance(entry, dict) else {}, entry_number)
+            for entry_number, entry in enumerate(entries, start=1)
+        ]
+
+    # the entries are numbered like the lines of a file, so the message says "line"
+    except ValueError as error:
+        return error_response(str(error))
+
+    success, message = add_undelivered_strings(
+        (
+            paper_id,
+            undelivered_string,
+            month if month is not None else datetime.now().month,
+            year if year is not None else datetime.now().year
+        )
+        for paper_id, undelivered_string, month, year in entries
+    )
+
+    if not success:
+        return error_response(message)
+
+    return jsonify(success=True, message=message)
+
+
+## get all papers, with their names, delivery days and costs, from the papers kept in memory
+ # days and costs are lists in the order of the weekdays, starting with Monday
+@app.get('/getpapers')
+def getpapers():
+    *_, papers_response = WARM_PAPERS.get()
+
+    return app.response_class(papers_response, mimetype='application/json')
+
+
+## get the log of undelivered dates
+ # the query string may filter it by "key" (the paper_id), "month" and "year", in any combination
+ # it may also ask for a page of the log: at most "limit" entries, after the entry with the entry_id "after" (like the CLI's --limit and --after)
+ # each entry has the days a paper was not delivered, and the time it was saved (in seconds since the epoch)
+ # the entries are sent as they are read from the DB, so a long log is never held in memory all at once
+@app.get('/getlogs')
+def getlogs():
+    try:
+        paper_id = get_int_arg('key')
+
+    except ValueError:
+        return error_response("Invalid key.")
+
+    success, message, _, _ = get_month_and_year()
+
+    if not success:
+        return error_response(message)
+
+    try:
+        limit = get_int_arg('limit')
+        after = get_int_arg('after')
+
+    except ValueError:
+        return error_response("Invalid limit and/or after.")
+
+    if limit is not None and limit < 1:
+        return error_response("The limit must be at least 1.")
+
+    # unlike calculate, a missing month or year is not filled in, so that it isn't filtered on
+    month = get_int_arg('month')
+    year = get_int_arg('year')
+
+    conditions = {
+        column: value
+        for column, value in (
+            ('paper_id', paper_id),
+            ('month', month),
+            ('year', year)
+        )
+        if value is not None
+    }
+
+    logs = iterate_log_entries(
+        'undelivered_dates',
+        ['entry_id', 'year', 'month', 'paper_id', 'timestamp', 'mask'],
+        conditions=conditions,
+        after=after,
+        limit=limit
+    )
+
+    # the response is the same JSON object as if it were built all at once, written out one entry at a time
+    # the cursor is closed even if the client goes away before the end
+    def generate_logs() -> Iterator[str]:
+        try:
+            yield '{"success": true, "logs": ['
+
+            for number, (entry_id, year, month, paper_id, timestamp, mask) in enumerate(logs):
+                entry = app.json.dumps({
+                    'entry_id': entry_id,
+                    'year': year,
+                    'month': month,
+                    'paper_id': paper_id,
+                    'timestamp': timestamp,
+                    'undelivered': get_days(mask)
+                })
+
+                yield f", {entry}" if number else entry
+
+            yield ']}'
+
+        finally:
+            logs.close()
+
+    return Response(stream_with_context(generate_logs()), mimetype='application/json')
+
+
+## get the statistics of every SQL statement run since the server started, from the most time spent to the least, and the query plan of each one
+ # only available if the server was started with --trace-sql. statements are counted across all worker threads
+ # each plan has its lines, and whether it scans a whole table
+@app.get('/sqltrace')
+def sqltrace():
+    tracer = npbc_core.SQL_TRACER
+
+    if tracer is None:
+        return error_response("SQL tracing is off. Start the server with --trace-sql to turn it on.", 404)
+
+    return jsonify(
+        success=True,
+        statements=tracer.get_report(),
+        plans=[
+            {
+                'statement': statement,
+                'plan': plan,
+                'full_scan': scans
+            }
+            for statement, (plan, scans) in tracer.explain_query_plans().items()
+        ]
+    )
+
+
+## get the metrics recorded since the server started, in the Prometheus text format
+ # only available if the server was started with --metrics
+@app.get('/metrics')
+def metrics():
+    registry = npbc_core.METRICS
+
+    if not registry.enabled:
+        return error_response("Metrics are off. Start the server with --metrics to turn them on.", 404)
+
+    return app.response_class(registry.format(), mimetype='text/plain; version=0.0.4')  # type: ignore
+
+
+## run the API server
+ # the DB is set up and the papers are loaded before the server starts, so the first request doesn't wait for them
+def main() -> None:
+    parser = ArgumentParser(description="Serve the newspaper bill calculator as a JSON API.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help="Number of requests to handle at once.")
+    parser.add_argument('--db', type=str, metavar='PATH', help="Database file to use, instead of the one in the .npbc folder of your home directory.")
+    parser.add_argument('--trace-sql', help="Trace every SQL statement the server runs, and report them at /sqltrace.", action='store_true')
+    parser.add_argument('--metrics', help="Record metrics (calculations, papers billed, parse failures, time per stage and per request), and serve them at /metrics.", action='store_true')
+    args = parser.parse_args()
+
+    if args.db:
+        set_database_path(args.db)
+
+    if args.trace_sql:
+        start_sql_trace()
+
+    if args.metrics:
+        enable_metrics()
+
+    setup_and_connect_DB()
+    WARM_PAPERS.get()
+
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+## calendar arithmetic for the billing code and the undelivered string parser
+ # everything here is computed from closed-form arithmetic or small precomputed tables, and is valid for years 1 to 9999 (proleptic Gregorian, like datetime)
+ # weekdays are numbered from 0 (Monday) to 6 (Sunday), like datetime.date.weekday()
+ # day masks are integers where bit (n - 1) is set if day n of the month is included
+
+
+## number of days in each month of a year that is not a leap year
+MONTH_LENGTHS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+## offsets used by Sakamoto's method to find the weekday of the first day of each month
+MONTH_OFFSETS = (0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4)
+
+
+## check whether a year is a leap year
+def is_leap_year(year: int) -> bool:
+    return (year % 4 == 0) and ((year % 100 != 0) or (year % 400 == 0))
+
+
+## get the number of days in a month
+def get_month_length(month: int, year: int) -> int:
+    if month == 2 and is_leap_year(year):
+        return 29
+
+    return MONTH_LENGTHS[month - 1]
+
+
+## get the weekday of the first day of a month
+ # Sakamoto's method gives 0 for Sunday, so it is shifted to make 0 Monday
+def get_first_weekday(month: int, year: int) -> int:
+    if month < 3:
+        year -= 1
+
+    sunday_based_weekday = (year + year // 4 - year // 100 + year // 400 + MONTH_OFFSETS[month - 1] + 1) % 7
+
+    return (sunday_based_weekday + 6) % 7
+
+
+## get the first day of the month (1 to 7) that falls on a given weekday
+def get_first_day_of_weekday(weekday: int, first_weekday: int) -> int:
+    return (weekday - first_weekday) % 7 + 1
+
+
+## generate a list of number of times each weekday occurs in a given month
+ # the list is ordered by weekday, so the first item is for Monday
+def get_number_of_days_per_week(month: int, year: int) -> list[int]:
+    first_weekday = get_first_weekday(month, year)
+    month_length = get_month_length(month, year)
+
+    return [
+        (month_length - get_first_day_of_weekday(weekday, first_weekday)) // 7 + 1
+        for weekday in range(7)
+    ]
+
+
+## precomputed day masks for each weekday
+ # indexed by the weekday of the first day of the month, then the length of the month minus 28, then the weekday
+ # a month's masks only depend on which weekday it starts on and how long it is, so 7 × 4 entries cover every month
+WEEKDAY_MASKS = tuple(
+    tuple(
+        tuple(
+            sum(
+                1 << (day - 1)
+                for day in range(get_first_day_of_weekday(weekday, first_weekday), month_length + 1, 7)
+            )
+            for weekday in range(7)
+        )
+        for month_length in range(28, 32)
+    )
+    for first_weekday in range(7)
+)
+
+
+## get the day masks of each weekday in a month
+ # the tuple is ordered by weekday, so the first mask has every Monday of the month
+def get_weekday_masks(month: int, year: int) -> tuple[int, ...]:
+    return WEEKDAY_MASKS[get_first_weekday(month, year)][get_month_length(month, year) - 28]
+
+
+## get a day mask with every day of a month
+def get_month_mask(month: int, year: int) -> int:
+    return (1 << get_month_length(month, year)) - 1
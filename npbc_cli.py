@@ -1,172 +1,318 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from argparse import Namespace as arg_namespace
+from datetime import date as date_type
 from datetime import datetime
-
-from colorama import Fore, Style
-from pyperclip import copy as copy_to_clipboard
-
-from npbc_core import (VALIDATE_REGEX, WEEKDAY_NAMES, add_new_paper,
-                       add_undelivered_string, calculate_cost_of_all_papers,
-                       delete_existing_paper, delete_undelivered_string,
-                       edit_existing_paper, extract_days_and_costs,
-                       format_output, generate_sql_query, get_previous_month,
-                       query_database, save_results, setup_and_connect_DB,
-                       validate_month_and_year, validate_undelivered_string)
+from itertools import chain
+from sys import stdin, stdout
+
+
+## names of all the commands, in the order they are listed in the help
+COMMANDS = (
+    'calculate',
+    'batch-calculate',
+    'addudl',
+    'deludl',
+    'getudl',
+    'editpaper',
+    'addpaper',
+    'delpaper',
+    'importpapers',
+    'exportpapers',
+    'getpapers',
+    'getlogs',
+    'daemon',
+    'update'
+)
+
+## options of the main parser that take a value, which is not the command even if it doesn't start with a hyphen
+MAIN_OPTIONS_WITH_VALUES = ('--db', '--profile', '--metrics')
 
 
 ## setup parsers
-def define_and_read_args() -> arg_namespace:
+ # only the subparser of the command being run is built, since building all of them (and their help) is a large part of the CLI's startup time
+ # if there is no valid command (for example, with only --help), all of them are built so that they are listed
+def define_and_read_args(arguments: list[str] | None = None) -> arg_namespace:
+    if arguments is None:
+        from sys import argv
+
+        arguments = argv[1:]
+
+    # the command is the first argument that isn't a flag or the value of an option of the main parser
+    command = next((
+        argument
+        for index, argument in enumerate(arguments)
+        if not argument.startswith('-') and (index == 0 or arguments[index - 1] not in MAIN_OPTIONS_WITH_VALUES)
+    ), None)
+    build_all = command not in COMMANDS
 
     # main parser for all commands
     main_parser = ArgumentParser(
         prog="npbc",
         description="Calculates your monthly newspaper bill."
     )
+    main_parser.add_argument('--db', type=str, metavar='PATH', help="Database file to use, instead of the one in the .npbc folder of your home directory. It is created if it doesn't exist.")
+    main_parser.add_argument('--profile', type=str, metavar='PATH', help="Profile the command with cProfile, and save the stats to this file (read them with pstats or a viewer like snakeviz).")
+    main_parser.add_argument('--timings', help="Print how long each stage of the command took (loading papers, parsing, calculating, etc.) when it finishes.", action='store_true')
+    main_parser.add_argument('--metrics', type=str, metavar='PATH', help="Record metrics (calculations, papers billed, parse failures, time per stage and per command) and write them to this file in the Prometheus text format. With the daemon, the file is written after every command it runs.")
+    main_parser.add_argument('--trace-sql', help="Print every SQL statement the command ran, with how often it ran, how long it took and how many rows it returned, and the query plan of each one when it finishes.", action='store_true')
     functions = main_parser.add_subparsers(required=True)
 
 
     # calculate subparser
-    calculate_parser = functions.add_parser(
-        'calculate',
-        help="Calculate the bill for one month. Previous month will be used if month or year flags are not set."
-    )
+    if build_all or command == 'calculate':
+        calculate_parser = functions.add_parser(
+            'calculate',
+            help="Calculate the bill for one month. Previous month will be used if month or year flags are not set."
+        )
 
-    calculate_parser.set_defaults(func=calculate)
-    calculate_parser.add_argument('-m', '--month', type=int, help="Month to calculate bill for. Must be between 1 and 12.")
-    calculate_parser.add_argument('-y', '--year', type=int, help="Year to calculate bill for. Must be between 1 and 9999.")
-    calculate_parser.add_argument('-c', '--nocopy', help="Don't copy the result of the calculation to the clipboard.", action='store_true')
-    calculate_parser.add_argument('-l', '--nolog', help="Don't log the result of the calculation.", action='store_true')
+        calculate_parser.set_defaults(func=calculate)
+        calculate_parser.add_argument('-m', '--month', type=int, help="Month to calculate bill for. Must be between 1 and 12.")
+        calculate_parser.add_argument('-y', '--year', type=int, help="Year to calculate bill for. Must be between 1 and 9999.")
+        calculate_parser.add_argument('-c', '--nocopy', help="Don't copy the result of the calculation to the clipboard.", action='store_true')
+        calculate_parser.add_argument('-l', '--nolog', help="Don't log the result of the calculation.", action='store_true')
+        calculate_parser.add_argument('-f', '--from', dest='from_month', type=parse_month, metavar='YYYY-MM', help="First month of a range of months to calculate bills for, as YYYY-MM. Must be used with --to, and not with the month or year flags.")
+        calculate_parser.add_argument('-t', '--to', dest='to_month', type=parse_month, metavar='YYYY-MM', help="Last month of a range of months to calculate bills for, as YYYY-MM. Must be used with --from, and not with the month or year flags.")
+
+    # batch calculate subparser
+    if build_all or command == 'batch-calculate':
+        batch_calculate_parser = functions.add_parser(
+            'batch-calculate',
+            help="Calculate the bill for one month for every database (*.db) in a folder, such as one for each household, in parallel. Previous month will be used if month or year flags are not set."
+        )
+
+        batch_calculate_parser.set_defaults(func=batch_calculate)
+        batch_calculate_parser.add_argument('-d', '--db-dir', type=str, metavar='PATH', help="Folder of databases to calculate bills for.", required=True)
+        batch_calculate_parser.add_argument('-m', '--month', type=int, help="Month to calculate bills for. Must be between 1 and 12.")
+        batch_calculate_parser.add_argument('-y', '--year', type=int, help="Year to calculate bills for. Must be between 1 and 9999.")
+        batch_calculate_parser.add_argument('-l', '--nolog', help="Don't log the results of the calculations.", action='store_true')
+        batch_calculate_parser.add_argument('-w', '--workers', type=int, help="Number of databases to calculate at once. Defaults to the number of processors.")
 
     # add undelivered string subparser
-    addudl_parser = functions.add_parser(
-        'addudl',
-        help="Store a date when paper(s) were not delivered. Previous month will be used if month or year flags are not set."
-    )
+    if build_all or command == 'addudl':
+        addudl_parser = functions.add_parser(
+            'addudl',
+            help="Store a date when paper(s) were not delivered. Previous month will be used if month or year flags are not set."
+        )
 
-    addudl_parser.set_defaults(func=addudl)
-    addudl_parser.add_argument('-m', '--month', type=int, help="Month to register undelivered incident(s) for. Must be between 1 and 12.")
-    addudl_parser.add_argument('-y', '--year', type=int, help="Year to register undelivered incident(s) for. Must be between 1 and 9999.")
-    addudl_parser.add_argument('-k', '--key', type=str, help="Key of paper to register undelivered incident(s) for.", required=True)
-    addudl_parser.add_argument('-u', '--undelivered', type=str, help="Dates when you did not receive any papers.", required=True)
+        addudl_parser.set_defaults(func=addudl)
+        addudl_parser.add_argument('-m', '--month', type=int, help="Month to register undelivered incident(s) for. Must be between 1 and 12.")
+        addudl_parser.add_argument('-y', '--year', type=int, help="Year to register undelivered incident(s) for. Must be between 1 and 9999.")
+        addudl_parser.add_argument('-k', '--key', type=str, help="Key of paper to register undelivered incident(s) for. Required unless --file is used.")
+        addudl_parser.add_argument('-u', '--undelivered', type=str, help="Dates when you did not receive any papers. Required unless --file is used.")
+        addudl_parser.add_argument('-f', '--file', type=str, metavar='PATH', help="CSV or JSON lines file of entries to register, with key, undelivered, and optionally month and year for each. Use - to read JSON lines from standard input. The month and year flags are used for entries without them.")
+        addudl_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Format of the file. Files ending in .csv are read as CSV, and anything else as JSON lines, if this is not set.")
 
     # delete undelivered string subparser
-    deludl_parser = functions.add_parser(
-        'deludl',
-        help="Delete a stored date when paper(s) were not delivered. Previous month will be used if month or year flags are not set."
-    )
+    if build_all or command == 'deludl':
+        deludl_parser = functions.add_parser(
+            'deludl',
+            help="Delete a stored date when paper(s) were not delivered. Previous month will be used if month or year flags are not set."
+        )
 
-    deludl_parser.set_defaults(func=deludl)
-    deludl_parser.add_argument('-k', '--key', type=str, help="Key of paper to unregister undelivered incident(s) for.", required=True)
-    deludl_parser.add_argument('-m', '--month', type=int, help="Month to unregister undelivered incident(s) for. Must be between 1 and 12.", required=True)
-    deludl_parser.add_argument('-y', '--year', type=int, help="Year to unregister undelivered incident(s) for. Must be between 1 and 9999.", required=True)
+        deludl_parser.set_defaults(func=deludl)
+        deludl_parser.add_argument('-k', '--key', type=str, help="Key of paper to unregister undelivered incident(s) for.", required=True)
+        deludl_parser.add_argument('-m', '--month', type=int, help="Month to unregister undelivered incident(s) for. Must be between 1 and 12.", required=True)
+        deludl_parser.add_argument('-y', '--year', type=int, help="Year to unregister undelivered incident(s) for. Must be between 1 and 9999.", required=True)
 
     # get undelivered string subparser
-    getudl_parser = functions.add_parser(
-        'getudl',
-        help="Get a list of all stored date strings when paper(s) were not delivered."
-    )
+    if build_all or command == 'getudl':
+        getudl_parser = functions.add_parser(
+            'getudl',
+            help="Get a list of all stored date strings when paper(s) were not delivered."
+        )
 
-    getudl_parser.set_defaults(func=getudl)
-    getudl_parser.add_argument('-k', '--key', type=str, help="Key for paper.")
-    getudl_parser.add_argument('-m', '--month', type=int, help="Month. Must be between 1 and 12.")
-    getudl_parser.add_argument('-y', '--year', type=int, help="Year. Must be between 1 and 9999.")
-    getudl_parser.add_argument('-u', '--undelivered', type=str, help="Dates when you did not receive any papers.")
+        getudl_parser.set_defaults(func=getudl)
+        getudl_parser.add_argument('-k', '--key', type=str, help="Key for paper.")
+        getudl_parser.add_argument('-m', '--month', type=int, help="Month. Must be between 1 and 12.")
+        getudl_parser.add_argument('-y', '--year', type=int, help="Year. Must be between 1 and 9999.")
+        getudl_parser.add_argument('-u', '--undelivered', type=str, help="Dates when you did not receive any papers.")
+        add_log_paging_arguments(getudl_parser)
 
     # edit paper subparser
-    editpaper_parser = functions.add_parser(
-        'editpaper',
-        help="Edit a newspaper\'s name, days delivered, and/or price."
-    )
+    if build_all or command == 'editpaper':
+        editpaper_parser = functions.add_parser(
+            'editpaper',
+            help="Edit a newspaper\'s name, days delivered, and/or price."
+        )
 
-    editpaper_parser.set_defaults(func=editpaper)
-    editpaper_parser.add_argument('-n', '--name', type=str, help="Name for paper to be edited.")
-    editpaper_parser.add_argument('-d', '--days', type=str, help="Number of days the paper to be edited is delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't. No separator required.")
-    editpaper_parser.add_argument('-p', '--price', type=str, help="Daywise prices of paper to be edited. Monday is the first day. Values must be separated by semicolons, and 0s are ignored.")
-    editpaper_parser.add_argument('-k', '--key', type=str, help="Key for paper to be edited.", required=True)
+        editpaper_parser.set_defaults(func=editpaper)
+        editpaper_parser.add_argument('-n', '--name', type=str, help="Name for paper to be edited.")
+        editpaper_parser.add_argument('-d', '--days', type=str, help="Number of days the paper to be edited is delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't. No separator required.")
+        editpaper_parser.add_argument('-p', '--price', type=str, help="Daywise prices of paper to be edited. Monday is the first day. Values must be separated by semicolons, and 0s are ignored.")
+        editpaper_parser.add_argument('-k', '--key', type=str, help="Key for paper to be edited.", required=True)
 
     # add paper subparser
-    addpaper_parser = functions.add_parser(
-        'addpaper',
-        help="Add a new newspaper to the list of newspapers."
-    )
+    if build_all or command == 'addpaper':
+        addpaper_parser = functions.add_parser(
+            'addpaper',
+            help="Add a new newspaper to the list of newspapers."
+        )
 
-    addpaper_parser.set_defaults(func=addpaper)
-    addpaper_parser.add_argument('-n', '--name', type=str, help="Name for paper to be added.", required=True)
-    addpaper_parser.add_argument('-d', '--days', type=str, help="Number of days the paper to be added is delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't. No separator required.", required=True)
-    addpaper_parser.add_argument('-p', '--price', type=str, help="Daywise prices of paper to be added. Monday is the first day. Values must be separated by semicolons, and 0s are ignored.", required=True)
+        addpaper_parser.set_defaults(func=addpaper)
+        addpaper_parser.add_argument('-n', '--name', type=str, help="Name for paper to be added.", required=True)
+        addpaper_parser.add_argument('-d', '--days', type=str, help="Number of days the paper to be added is delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't. No separator required.", required=True)
+        addpaper_parser.add_argument('-p', '--price', type=str, help="Daywise prices of paper to be added. Monday is the first day. Values must be separated by semicolons, and 0s are ignored.", required=True)
 
     # delete paper subparser
-    delpaper_parser = functions.add_parser(
-        'delpaper',
-        help="Delete a newspaper from the list of newspapers."
-    )
+    if build_all or command == 'delpaper':
+        delpaper_parser = functions.add_parser(
+            'delpaper',
+            help="Delete a newspaper from the list of newspapers."
+        )
+
+        delpaper_parser.set_defaults(func=delpaper)
+        delpaper_parser.add_argument('-k', '--key', type=str, help="Key for paper to be deleted.", required=True)
+
+    # import papers subparser
+    if build_all or command == 'importpapers':
+        importpapers_parser = functions.add_parser(
+            'importpapers',
+            help="Add many newspapers at once from a CSV or JSON lines file."
+        )
+
+        importpapers_parser.set_defaults(func=importpapers)
+        importpapers_parser.add_argument('-f', '--file', type=str, metavar='PATH', help="File of papers to add, with name, days and costs for each (like the output of exportpapers). Days are given like 'YYNNYYN' and costs as seven values separated by semicolons, Monday first. Use - to read JSON lines from standard input.", required=True)
+        importpapers_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Format of the file. Files ending in .csv are read as CSV, and anything else as JSON lines, if this is not set.")
+
+    # export papers subparser
+    if build_all or command == 'exportpapers':
+        exportpapers_parser = functions.add_parser(
+            'exportpapers',
+            help="Write all newspapers to a CSV or JSON lines file."
+        )
 
-    delpaper_parser.set_defaults(func=delpaper)
-    delpaper_parser.add_argument('-k', '--key', type=str, help="Key for paper to be deleted.", required=True)
+        exportpapers_parser.set_defaults(func=exportpapers)
+        exportpapers_parser.add_argument('-f', '--file', type=str, metavar='PATH', help="File to write the papers to. Standard output is used if this is not set, or is -.")
+        exportpapers_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Format of the file. Files ending in .csv are written as CSV, and anything else as JSON lines, if this is not set.")
 
     # get paper subparser
-    getpapers_parser = functions.add_parser(
-        'getpapers',
-        help="Get all newspapers."
-    )
+    if build_all or command == 'getpapers':
+        getpapers_parser = functions.add_parser(
+            'getpapers',
+            help="Get all newspapers."
+        )
 
-    getpapers_parser.set_defaults(func=getpapers)
-    getpapers_parser.add_argument('-n', '--names', help="Get the names of the newspapers.", action='store_true')
-    getpapers_parser.add_argument('-d', '--days', help="Get the days the newspapers are delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't.", action='store_true')
-    getpapers_parser.add_argument('-p', '--prices', help="Get the daywise prices of the newspapers. Monday is the first day. Values must be separated by semicolons.", action='store_true')
+        getpapers_parser.set_defaults(func=getpapers)
+        getpapers_parser.add_argument('-n', '--names', help="Get the names of the newspapers.", action='store_true')
+        getpapers_parser.add_argument('-d', '--days', help="Get the days the newspapers are delivered. Monday is the first day, and all seven weekdays are required. A 'Y' means it is delivered, and an 'N' means it isn't.", action='store_true')
+        getpapers_parser.add_argument('-p', '--prices', help="Get the daywise prices of the newspapers. Monday is the first day. Values must be separated by semicolons.", action='store_true')
 
     # get undelivered logs subparser
-    getlogs_parser = functions.add_parser(
-        'getlogs',
-        help="Get the log of all undelivered dates."
-    )
+    if build_all or command == 'getlogs':
+        getlogs_parser = functions.add_parser(
+            'getlogs',
+            help="Get the log of all undelivered dates."
+        )
 
-    getlogs_parser.set_defaults(func=getlogs)
-    getlogs_parser.add_argument('-m', '--month', type=int, help="Month. Must be between 1 and 12.")
-    getlogs_parser.add_argument('-y', '--year', type=int, help="Year. Must be between 1 and 9999.")
-    getlogs_parser.add_argument('-k', '--key', type=str, help="Key for paper.", required=True)
+        getlogs_parser.set_defaults(func=getlogs)
+        getlogs_parser.add_argument('-m', '--month', type=int, help="Month. Must be between 1 and 12.")
+        getlogs_parser.add_argument('-y', '--year', type=int, help="Year. Must be between 1 and 9999.")
+        getlogs_parser.add_argument('-k', '--key', type=str, help="Key for paper.", required=True)
+        add_log_paging_arguments(getlogs_parser)
+
+    # daemon subparser
+    if build_all or command == 'daemon':
+        daemon_parser = functions.add_parser(
+            'daemon',
+            help="Run in the background, and run the commands of other calls to npbc, so that they don't each have to start up. Commands are run as usual when the daemon isn't running."
+        )
+
+        daemon_parser.set_defaults(func=daemon)
 
     # update application subparser
-    update_parser = functions.add_parser(
-        'update',
-        help="Update the application."
-    )
+    if build_all or command == 'update':
+        update_parser = functions.add_parser(
+            'update',
+            help="Update the application."
+        )
 
-    update_parser.set_defaults(func=update)
+        update_parser.set_defaults(func=update)
 
 
-    return main_parser.parse_args()
+    return main_parser.parse_args(arguments)
+
+
+## parse a month given as YYYY-MM on the command line
+ # the date returned is the first day of that month
+def parse_month(string: str) -> date_type:
+    try:
+        return datetime.strptime(string.strip(), r'%Y-%m').date()
+
+    except ValueError:
+        raise ArgumentTypeError(f"Invalid month: {string}. Months must be given as YYYY-MM.")
+
+
+## add the flags that filter a log by a range of months, and page through it, to the parser of a command that prints a log
+def add_log_paging_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument('--since', type=parse_month, metavar='YYYY-MM', help="First month to get entries for, as YYYY-MM.")
+    parser.add_argument('--until', type=parse_month, metavar='YYYY-MM', help="Last month to get entries for, as YYYY-MM.")
+    parser.add_argument('--after', type=int, metavar='ENTRY_ID', help="Only get entries after this entry_id, like the last one of the previous page.")
+    parser.add_argument('--limit', type=int, help="Maximum number of entries to get. Must be at least 1.")
+
+
+## check the paging flags of a command that prints a log, and print why they are invalid if they are
+def validate_log_paging(args: arg_namespace) -> bool:
+    if args.limit is not None and args.limit < 1:
+        status_print(False, "The limit must be at least 1.")
+        return False
+
+    if args.since and args.until and args.since > args.until:
+        status_print(False, "The start of the range must not be after the end.")
+        return False
+
+    return True
+
+
+## after the last row of a page of a log has been printed, say how to get the next page, if the page was full
+def print_next_page_hint(args: arg_namespace, number_of_rows: int, last_entry_id: int) -> None:
+    if args.limit is not None and number_of_rows == args.limit:
+        print(f"To get the next page, use --after {last_entry_id}.")
+
+
+## get the format of the file given to a command, from the format flag, or the file's extension if it isn't set
+ # files ending in .csv are CSV, and anything else (including standard input and output) is JSON lines
+def get_file_format(args: arg_namespace) -> str:
+    if args.format:
+        return args.format
+
+    if args.file and args.file.lower().endswith('.csv'):
+        return 'csv'
+
+    return 'jsonl'
 
 
 ## print out a coloured status message using Colorama
 def status_print(status: bool, message: str) -> None:
+    from colorama import Fore, Style
+
     if status:
         print(f"{Fore.GREEN}{Style.BRIGHT}{message}{Style.RESET_ALL}\n")
     else:
         print(f"{Fore.RED}{Style.BRIGHT}{message}{Style.RESET_ALL}\n")
 
-## calculate the cost for a given month and year
+## get the month and year to calculate bills for, from the month and year flags
  # default to the previous month if no month and no year is given
  # default to the current month if no month is given and year is given
  # default to the current year if no year is given and month is given
-def calculate(args: arg_namespace) -> None:
+ # if they are not valid, an error message is printed and None is returned
+def get_month_and_year(args: arg_namespace) -> tuple[int, int] | None:
+    from npbc_core import get_previous_month, validate_month_and_year
 
-    # deal with month and year
-    if args.month or args.year:
+    if args.month is not None or args.year is not None:
 
         feedback = validate_month_and_year(args.month, args.year)
 
         if not feedback[0]:
             status_print(*feedback)
-            return
+            return None
 
-        if args.month:
+        if args.month is not None:
             month = args.month
         
         else:
             month = datetime.now().month
 
-        if args.year:
+        if args.year is not None:
             year = args.year
 
         else:
@@ -177,27 +323,31 @@ def calculate(args: arg_namespace) -> None:
         month = previous_month.month
         year = previous_month.year
 
-    # look for undelivered strings in the database
-    existing_strings = query_database(
-        generate_sql_query(
-            'undelivered_strings',
-            columns=['paper_id', 'string'],
-            conditions={
-                'month': month,
-                'year': year
-            }
-        )
-    )
+    return month, year
+
 
-    # associate undelivered strings with their paper_id
-    undelivered_strings: dict[int, str] = {
-        paper_id: undelivered_string
-        for paper_id, undelivered_string in existing_strings
-    }
+## calculate the cost for a given month and year (see get_month_and_year for the defaults)
+def calculate(args: arg_namespace) -> None:
+    from npbc_core import (TimedStage, calculate_cost_of_all_papers,
+                           format_output, save_results)
+
+    # a range of months is calculated separately
+    if args.from_month or args.to_month:
+        calculate_range(args)
+        return
+
+    # deal with month and year
+    month_and_year = get_month_and_year(args)
+
+    if month_and_year is None:
+        return
+
+    month, year = month_and_year
 
     # calculate the cost for each paper, as well as the total cost
+    # the undelivered strings stored for the month are used, without parsing them again
     costs, total, undelivered_dates = calculate_cost_of_all_papers(
-        undelivered_strings,
+        None,
         month,
         year
     )
@@ -206,8 +356,12 @@ def calculate(args: arg_namespace) -> None:
     formatted = format_output(costs, total, month, year)
 
     # unless the user specifies so, copy the results to the clipboard
+    # the clipboard module is only imported when it is used
     if not args.nocopy:
-        copy_to_clipboard(formatted)
+        with TimedStage('clipboard'):
+            from pyperclip import copy as copy_to_clipboard
+
+            copy_to_clipboard(formatted)
 
         formatted += '\nSummary copied to clipboard.'
 
@@ -222,9 +376,142 @@ def calculate(args: arg_namespace) -> None:
     print(f"SUMMARY:\n{formatted}")
 
 
+## calculate the cost for every month in a range
+ # paper data is loaded once, and each month is printed (and logged) as soon as it is calculated
+def calculate_range(args: arg_namespace) -> None:
+    from contextlib import closing
+
+    from npbc_core import (TimedStage, calculate_cost_for_range,
+                           format_output, save_results)
+
+    # both ends of the range are needed, and the range can't be mixed with a single month
+    if not (args.from_month and args.to_month) or args.month is not None or args.year is not None:
+        status_print(False, "Both --from and --to must be given for a range, without the month or year flags.")
+        return
+
+    if args.from_month > args.to_month:
+        status_print(False, "The start of the range must not be after the end.")
+        return
+
+    # the summaries are only kept if they need to be copied
+    summaries = []
+
+    # the range is closed even if a month fails, so its cursor isn't left open while the error is handled
+    with closing(calculate_cost_for_range(args.from_month, args.to_month)) as results:
+        for month, year, costs, total, undelivered_dates in results:
+
+            # format the results
+            formatted = format_output(costs, total, month, year)
+
+            if not args.nocopy:
+                summaries.append(formatted)
+
+            # unless the user specifies so, log the results to the database
+            if not args.nolog:
+                save_results(undelivered_dates, month, year)
+
+            # print the results
+            print(f"SUMMARY:\n{formatted}")
+
+    # success is only reported once every month has been calculated (and logged)
+    status_print(True, "Success!")
+
+    # unless the user specifies so, copy the results to the clipboard
+    # the clipboard module is only imported when it is used
+    if not args.nocopy:
+        with TimedStage('clipboard'):
+            from pyperclip import copy as copy_to_clipboard
+
+            copy_to_clipboard('\n'.join(summaries))
+
+        print('Summary copied to clipboard.')
+
+    if not args.nolog:
+        print('Log saved to file.')
+
+
+## calculate the cost for a given month and year for every database in a folder, and print one combined report
+ # files that aren't npbc databases (see is_npbc_database) are skipped with a warning, before anything opens them for writing, so they aren't set up or migrated
+ # each database is calculated in a separate process (see calculate_database), so the databases are calculated in parallel, across processors
+ # the report has the summary of each database (in order of their names) with the time it took, and the total of all of them
+def batch_calculate(args: arg_namespace) -> None:
+    from concurrent.futures import ProcessPoolExecutor
+    from pathlib import Path
+    from timeit import default_timer
+
+    from npbc_core import calculate_database, is_npbc_database
+
+    month_and_year = get_month_and_year(args)
+
+    if month_and_year is None:
+        return
+
+    month, year = month_and_year
+
+    if args.workers is not None and args.workers < 1:
+        status_print(False, "The number of workers must be at least 1.")
+        return
+
+    database_paths = []
+
+    for database_path in sorted(Path(args.db_dir).glob('*.db')):
+        if is_npbc_database(database_path):
+            database_paths.append(database_path)
+
+        else:
+            status_print(False, f"Skipping {database_path.name}, which is not an npbc database.")
+
+    if not database_paths:
+        status_print(False, f"No databases found in {args.db_dir}.")
+        return
+
+    start = default_timer()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        calculations = [
+            executor.submit(calculate_database, database_path, month, year, not args.nolog)
+            for database_path in database_paths
+        ]
+
+        # a database that can't be calculated is reported, without stopping the others
+        for database_path, calculation in zip(database_paths, calculations):
+            try:
+                results.append((database_path, *calculation.result()))
+
+            except Exception as error:
+                status_print(False, f"Could not calculate {database_path.name}: {error}")
+
+    elapsed = default_timer() - start
+
+    if not results:
+        return
+
+    status_print(True, "Success!")
+
+    for database_path, total, formatted, database_elapsed in results:
+        print(f"{database_path.stem} ({database_elapsed * 1000:.1f} ms)\n{formatted}")
+
+    print(f"**GRAND TOTAL**: {sum(total for _, total, _, _ in results)}")
+    print(f"{len(results)} databases calculated in {elapsed * 1000:.1f} ms ({sum(database_elapsed for _, _, _, database_elapsed in results) * 1000:.1f} ms in total across databases).")
+
+    if not args.nolog:
+        print('Logs saved to each database.')
+
+
 ## add undelivered strings to the database
  # default to the current month if no month and/or no year is given
 def addudl(args: arg_namespace):
+    from npbc_core import add_undelivered_string, validate_month_and_year
+
+    # entries from a file are added separately
+    if args.file:
+        addudl_from_file(args)
+        return
+
+    if not (args.key and args.undelivered):
+        status_print(False, "Both --key and --undelivered must be given, unless --file is used.")
+        return
 
     # validate the month and year
     feedback = validate_month_and_year(args.month, args.year)
@@ -232,14 +519,14 @@ def addudl(args: arg_namespace):
     if feedback[0]:
 
         # if no month is given, default to the current month
-        if args.month:
+        if args.month is not None:
             month = args.month
 
         else:
             month = datetime.now().month
 
         # if no year is given, default to the current year
-        if args.year:
+        if args.year is not None:
             year = args.year
 
         else:
@@ -256,8 +543,58 @@ def addudl(args: arg_namespace):
     status_print(*feedback)
 
 
+## add undelivered strings from a CSV or JSON lines file (or standard input) to the database
+ # entries are read and validated one at a time, and all of them are written at once
+ # entries without a month or year use the month and year flags, and default to the current month like addudl
+def addudl_from_file(args: arg_namespace) -> None:
+    from npbc_core import (add_undelivered_strings,
+                           read_undelivered_entries_from_csv,
+                           read_undelivered_entries_from_jsonl,
+                           validate_month_and_year)
+
+    if args.key or args.undelivered:
+        status_print(False, "--file can't be used with --key or --undelivered.")
+        return
+
+    # validate the month and year
+    feedback = validate_month_and_year(args.month, args.year)
+
+    if not feedback[0]:
+        status_print(*feedback)
+        return
+
+    default_month = args.month if args.month is not None else datetime.now().month
+    default_year = args.year if args.year is not None else datetime.now().year
+
+    # choose how to read the file
+    read_entries = read_undelivered_entries_from_csv if get_file_format(args) == 'csv' else read_undelivered_entries_from_jsonl
+
+    try:
+        file = stdin if args.file == '-' else open(args.file, newline='')
+
+    except OSError as error:
+        status_print(False, f"Could not read {args.file}: {error.strerror}.")
+        return
+
+    with file:
+        feedback = add_undelivered_strings(
+            (
+                (
+                    paper_id,
+                    undelivered_string,
+                    month if month is not None else default_month,
+                    year if year is not None else default_year
+                )
+                for paper_id, undelivered_string, month, year in read_entries(file)
+            )
+        )
+
+    status_print(*feedback)
+
+
 ## delete undelivered strings from the database
 def deludl(args: arg_namespace) -> None:
+    from npbc_core import delete_undelivered_string, validate_month_and_year
 
     # validate the month and year
     feedback = validate_month_and_year(args.month, args.year)
@@ -278,6 +615,10 @@ def deludl(args: arg_namespace) -> None:
  # filter by whichever parameter the user provides. they as many as they want.
  # available parameters: month, year, key, string
 def getudl(args: arg_namespace) -> None:
+    from colorama import Fore, Style
+
+    from npbc_core import (iterate_log_entries, validate_month_and_year,
+                           validate_undelivered_string)
 
     # validate the month and year
     feedback = validate_month_and_year(args.month, args.year)
@@ -285,42 +626,52 @@ def getudl(args: arg_namespace) -> None:
     if not feedback[0]:
         status_print(*feedback)
         return
+
+    if not validate_log_paging(args):
+        return
     
     conditions = {}
 
     if args.key:
         conditions['paper_id'] = args.key
 
-    if args.month:
+    if args.month is not None:
         conditions['month'] = args.month
 
-    if args.year:
+    if args.year is not None:
         conditions['year'] = args.year
 
     if args.undelivered:
-        conditions['strings'] = str(args.undelivered).lower().strip()
+        conditions['string'] = str(args.undelivered).lower().strip()
 
-        if not validate_undelivered_string(conditions['strings']):
+        if not validate_undelivered_string(conditions['string']):
             status_print(False, "Invalid undelivered string.")
             return
 
-    # if the undelivered strings exist, fetch them
-    undelivered_strings = query_database(
-        generate_sql_query(
-            'undelivered_strings',
-            conditions=conditions
-        )
+    # the undelivered strings are printed as they are read from the DB, so the first one is read to know if there are any
+    undelivered_strings = iterate_log_entries(
+        'undelivered_strings',
+        ['entry_id', 'year', 'month', 'paper_id', 'string'],
+        conditions=conditions,
+        after=args.after,
+        since=args.since,
+        until=args.until,
+        limit=args.limit
     )
 
+    first_string = next(undelivered_strings, None)
+
     # if there were undelivered strings, print them
-    if undelivered_strings:
+    if first_string:
         status_print(True, 'Found undelivered strings.')
 
         print(f"{Fore.YELLOW}entry_id{Style.RESET_ALL} | {Fore.YELLOW}year{Style.RESET_ALL} | {Fore.YELLOW}month{Style.RESET_ALL} | {Fore.YELLOW}paper_id{Style.RESET_ALL} | {Fore.YELLOW}string{Style.RESET_ALL}")
-        
-        for string in undelivered_strings:
+
+        for number_of_rows, string in enumerate(chain([first_string], undelivered_strings), start=1):
             print('|'.join([str(item) for item in string]))
 
+        print_next_page_hint(args, number_of_rows, string[0])
+
     # otherwise, print that there were no undelivered strings
     else:
         status_print(False, 'No undelivered strings found.')
@@ -328,6 +679,9 @@ def getudl(args: arg_namespace) -> None:
 
 ## edit the data for one paper
 def editpaper(args: arg_namespace) -> None:
+    from npbc_core import (VALIDATE_REGEX, edit_existing_paper,
+                           extract_days_and_costs)
+
     feedback = True, ""
     days, costs = "", ""
 
@@ -359,6 +713,8 @@ def editpaper(args: arg_namespace) -> None:
 
 ## add a new paper to the database
 def addpaper(args: arg_namespace) -> None:
+    from npbc_core import VALIDATE_REGEX, add_new_paper, extract_days_and_costs
+
     feedback = True, ""
     days, costs = "", ""
 
@@ -390,6 +746,7 @@ def addpaper(args: arg_namespace) -> None:
 
 ## delete a paper from the database
 def delpaper(args: arg_namespace) -> None:
+    from npbc_core import delete_existing_paper
 
     # attempt to delete the paper
     feedback = delete_existing_paper(
@@ -399,138 +756,104 @@ def delpaper(args: arg_namespace) -> None:
     status_print(*feedback)
 
 
-## get a list of all papers in the database
- # filter by whichever parameter the user provides. they may use as many as they want (but keys are always printed)
- # available parameters: name, days, costs
- # the output is provided as a formatted table, printed to the standard output
-def getpapers(args: arg_namespace) -> None:
-    headers = ['paper_id']
-
-    # fetch a list of all papers' IDs
-    papers_id_list = [
-        paper_id
-        for paper_id, in query_database(
-            generate_sql_query(
-                'papers',
-                columns=['paper_id']
-            )
-        )
-    ]
+## add papers from a CSV or JSON lines file (or standard input) to the database
+ # papers are read and validated one at a time, and all of them are added in one transaction
+def importpapers(args: arg_namespace) -> None:
+    from npbc_core import (add_new_papers, read_papers_from_csv,
+                           read_papers_from_jsonl)
 
-    # initialize lists for the data
-    paper_name_list, paper_days_list, paper_costs_list = [], [], []
+    # choose how to read the file
+    read_papers = read_papers_from_csv if get_file_format(args) == 'csv' else read_papers_from_jsonl
 
-    # sort the papers' IDs (for the sake of consistency)
-    papers_id_list.sort()
+    try:
+        file = stdin if args.file == '-' else open(args.file, newline='')
 
-    # if the user wants names, fetch that data and add it to the list
-    if args.names:
+    except OSError as error:
+        status_print(False, f"Could not read {args.file}: {error.strerror}.")
+        return
 
-        # first get a dictionary of {paper_id: paper_name}
-        papers_names = {
-            paper_id: paper_name
-            for paper_id, paper_name in query_database(
-                generate_sql_query(
-                    'papers',
-                    columns=['paper_id', 'name']
-                )
-            )
-        }
+    with file:
+        feedback = add_new_papers(read_papers(file))
 
-        # then use the sorted IDs list to create a sorted names list
-        paper_name_list = [
-            papers_names[paper_id]
-            for paper_id in papers_id_list
-        ]
+    status_print(*feedback)
 
-        headers.append('name')
 
-    # if the user wants delivery days, fetch that data and add it to the list
-    if args.days:
+## write all papers in the database to a CSV or JSON lines file (or standard output)
+ # papers are written as they are read from the database, in the format importpapers reads
+def exportpapers(args: arg_namespace) -> None:
+    from csv import writer as csv_writer
+    from json import dumps
 
-        # initialize a dictionary of {paper_id: {day_id: delivery}}
-        papers_days = {
-            paper_id: {}
-            for paper_id in papers_id_list
-        }
-
-        # then get the data for each paper
-        for paper_id, day_id, delivered in query_database(
-            generate_sql_query(
-                'papers_days_delivered',
-                columns=['paper_id', 'day_id', 'delivered']
-            )
-        ):
-            papers_days[paper_id][day_id] = delivered
-
-        # format the data so that it matches the regex pattern /^[YN]{7}$/, the same way the user must input this data
-        paper_days_list = [
-            ''.join([
-                'Y' if int(papers_days[paper_id][day_id]) == 1 else 'N'
-                for day_id, _ in enumerate(WEEKDAY_NAMES)
-            ])
-            for paper_id in papers_id_list
-        ]
+    from npbc_core import iterate_papers
 
-        headers.append('days')
+    to_file = args.file not in (None, '-')
 
-    # if the user wants costs, fetch that data and add it to the list
-    if args.prices:
+    try:
+        file = open(args.file, 'w', newline='') if to_file else stdout
 
-        # initialize a dictionary of {paper_id: {day_id: price}}
-        papers_costs = {
-            paper_id: {}
-            for paper_id in papers_id_list
-        }
+    except OSError as error:
+        status_print(False, f"Could not write {args.file}: {error.strerror}.")
+        return
 
-        # then get the data for each paper
-        for paper_id, day_id, cost in query_database(
-            generate_sql_query(
-                'papers_days_cost',
-                columns=['paper_id', 'day_id', 'cost']
-            )
-        ):
-            papers_costs[paper_id][day_id] = cost
-
-        # format the data so that it matches the regex pattern /^[x](;[x]){6}$/, where /x/ is a number that may be either a floating point or an integer, the same way the user must input this data.
-        paper_costs_list = [
-            ';'.join([
-                str(papers_costs[paper_id][day_id])
-                for day_id, _ in enumerate(WEEKDAY_NAMES)
-            ])
-            for paper_id in papers_id_list
-        ]
+    try:
+        if get_file_format(args) == 'csv':
+            writer = csv_writer(file)
+            writer.writerow(['paper_id', 'name', 'days', 'costs'])
+            writer.writerows(iterate_papers())
 
-        headers.append('costs')
+        else:
+            for paper_id, name, days, costs in iterate_papers():
+                file.write(f"{dumps({'paper_id': paper_id, 'name': name, 'days': days, 'costs': costs})}\n")
 
-    # print the headers
-    print(' | '.join([
-        f"{Fore.YELLOW}{header}{Style.RESET_ALL}"
-        for header in headers
-    ]))
+    finally:
+        if to_file:
+            file.close()
 
-    # print the data
-    for index, paper_id in enumerate(papers_id_list):
-        print(f"{paper_id}: ", end='')
-        
-        values = []
+    # only print a message if it won't be mixed into the exported papers
+    if to_file:
+        status_print(True, f"Papers exported to {args.file}.")
 
-        if args.names:
-            values.append(paper_name_list[index])
 
-        if args.days:
-            values.append(paper_days_list[index])
+## get a list of all papers in the database
+ # filter by whichever parameter the user provides. they may use as many as they want (but keys are always printed)
+ # available parameters: name, days, costs
+ # the output is provided as a formatted table, printed to the standard output
+def getpapers(args: arg_namespace) -> None:
+    from colorama import Fore, Style
 
-        if args.prices:
-            values.append(paper_costs_list[index])
+    from npbc_core import get_papers
+
+    # the days and costs are in the same format the user must input them in (/^[YN]{7}$/ and /^[x](;[x]){6}$/, where /x/ is a number)
+    columns = [
+        column
+        for column, wanted in (
+            ('name', args.names),
+            ('days', args.days),
+            ('costs', args.prices)
+        )
+        if wanted
+    ]
+
+    # print the headers
+    print(' | '.join([
+        f"{Fore.YELLOW}{header}{Style.RESET_ALL}"
+        for header in ['paper_id', *columns]
+    ]))
 
-        print(', '.join(values))
+    # print each paper as it is read from the DB, in order of their IDs (for the sake of consistency)
+    for paper_id, *values in get_papers(['paper_id', *columns]):
+        print(f"{paper_id}: {', '.join(values)}")
 
 
 ## get a log of all deliveries for a paper
  # the user may specify parameters to filter the output by. they may use as many as they want, or none
  # available parameters: paper_id, month, year
 def getlogs(args: arg_namespace) -> None:
+    from colorama import Fore, Style
+
+    from npbc_core import (UndeliveredDates, iterate_log_entries,
+                           validate_month_and_year)
+
     
     # validate the month and year
     feedback = validate_month_and_year(args.month, args.year)
@@ -538,6 +861,9 @@ def getlogs(args: arg_namespace) -> None:
     if not feedback[0]:
         status_print(*feedback)
         return
+
+    if not validate_log_paging(args):
+        return
         
     conditions = {}
 
@@ -545,34 +871,86 @@ def getlogs(args: arg_namespace) -> None:
     if args.key:
         conditions['paper_id'] = args.key
 
-    if args.month:
+    if args.month is not None:
         conditions['month'] = args.month
 
-    if args.year:
+    if args.year is not None:
         conditions['year'] = args.year
 
-    # fetch the data
-    undelivered_dates = query_database(
-        generate_sql_query(
-            'undelivered_dates',
-            conditions=conditions
-        )
+    # the data is printed as it is read from the DB, so the first entry is read to know if there is any
+    undelivered_dates = iterate_log_entries(
+        'undelivered_dates',
+        ['entry_id', 'year', 'month', 'paper_id', 'timestamp', 'mask'],
+        conditions=conditions,
+        after=args.after,
+        since=args.since,
+        until=args.until,
+        limit=args.limit
     )
 
+    first_entry = next(undelivered_dates, None)
+
     # if data was found, print it
-    if undelivered_dates:
+    if first_entry:
         status_print(True, 'Success!')
 
-        print(f"{Fore.YELLOW}entry_id{Style.RESET_ALL} | {Fore.YELLOW}year{Style.RESET_ALL} | {Fore.YELLOW}month{Style.RESET_ALL} | {Fore.YELLOW}paper_id{Style.RESET_ALL} | {Fore.YELLOW}dates{Style.RESET_ALL}")
+        print(f"{Fore.YELLOW}entry_id{Style.RESET_ALL} | {Fore.YELLOW}year{Style.RESET_ALL} | {Fore.YELLOW}month{Style.RESET_ALL} | {Fore.YELLOW}paper_id{Style.RESET_ALL} | {Fore.YELLOW}timestamp{Style.RESET_ALL} | {Fore.YELLOW}dates{Style.RESET_ALL}")
+
+        # the dates are stored as a day mask, and the timestamp as seconds since the epoch
+        for number_of_rows, (entry_id, year, month, paper_id, timestamp, mask) in enumerate(chain([first_entry], undelivered_dates), start=1):
+            print(' | '.join([
+                str(entry_id),
+                str(year),
+                str(month),
+                str(paper_id),
+                datetime.fromtimestamp(timestamp).strftime(r'%d/%m/%Y %I:%M:%S %p'),
+                ','.join(
+                    undelivered_date.strftime(r'%d')
+                    for undelivered_date in UndeliveredDates(mask, month, year)
+                )
+            ]))
 
-        for date in undelivered_dates:
-            print(', '.join(date))
+        print_next_page_hint(args, number_of_rows, entry_id)
 
     # if no data was found, print an error message
     else:
         status_print(False, 'No results found.')
 
 
+## run the daemon, until it is interrupted
+def daemon(args: arg_namespace) -> None:
+    from npbc_daemon import SOCKET_PATH, serve
+
+    # commands sent to the daemon are always for the default database
+    if args.db:
+        status_print(False, "The daemon can only be run with the default database.")
+        return
+
+    status_print(True, f"Starting the daemon on {SOCKET_PATH}. Press Ctrl+C to stop it.")
+    status_print(*serve(metrics_path=args.metrics))
+
+
+## check whether a command can be sent to the daemon
+ # commands that read from the standard input, or stream to the standard output, are run in this process so that they don't have to be buffered
+ # so are commands for another database, commands being profiled, timed, traced or measured, and the commands that run the daemon or replace the application
+def can_run_in_daemon(args: arg_namespace) -> bool:
+    if args.func in (daemon, update):
+        return False
+
+    # the daemon only uses the default database
+    if args.db:
+        return False
+
+    # profiling, timing, tracing and metrics measure this process, not the daemon
+    if args.profile or args.timings or args.trace_sql or args.metrics:
+        return False
+
+    if getattr(args, 'file', None) == '-':
+        return False
+
+    return not (args.func is exportpapers and args.file is None)
+
+
 ## update the application
  # under normal operation, this function should never run
  # if the update CLI argument is provided, this script will never run and the updater will be run instead
@@ -581,11 +959,132 @@ def update(args: arg_namespace) -> None:
 
 
 ## run the application
+ # if the daemon is running, it runs the command instead, so this process doesn't need to import the core or connect to the DB
 def main() -> None:
-    setup_and_connect_DB()
-    args = define_and_read_args()
-    args.func(args)
+    from sys import argv
+
+    # the arguments are read first, so that --help and argument errors don't need the DB (or the daemon)
+    args = define_and_read_args(argv[1:])
+
+    if can_run_in_daemon(args):
+        from npbc_daemon import run_in_daemon
+
+        reply = run_in_daemon(argv[1:])
+
+        if reply is not None:
+            output, error = reply
+            stdout.write(output)
+
+            if error:
+                raise SystemExit(error)
+
+            return
+
+    from npbc_core import set_database_path
+
+    if args.db:
+        set_database_path(args.db)
+
+    run_command(args)
+
+
+## set up the DB and run a command, profiling it, timing its stages, tracing its SQL and recording its metrics if asked to
+ # the profile and metrics are saved, and the timings and SQL trace printed (to the standard error, so they don't mix with the command's output), even if the command fails
+def run_command(args: arg_namespace) -> None:
+    from time import perf_counter
+
+    from npbc_core import (TimedStage, enable_metrics, setup_and_connect_DB,
+                           start_sql_trace, start_stage_timings,
+                           stop_sql_trace, stop_stage_timings)
+
+    # setting up the DB is traced too, since it runs on every command
+    if args.trace_sql:
+        start_sql_trace()
+
+    if args.metrics:
+        metrics = enable_metrics()
+
+    if args.timings:
+        start_stage_timings()
+
+    start = perf_counter()
+
+    if args.profile:
+        from cProfile import Profile
+
+        profiler = Profile()
+        profiler.enable()
+
+    try:
+        with TimedStage('set up DB'):
+            setup_and_connect_DB()
+
+        args.func(args)
+
+    finally:
+        if args.profile:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+        # the daemon writes the metrics of each command it runs, so its own time isn't a command's
+        if args.metrics:
+            if args.func is not daemon:
+                metrics.observe('npbc_command_seconds', perf_counter() - start, command=args.func.__name__.replace('_', '-'))
+
+            metrics.write(args.metrics)
+
+        if args.timings:
+            print_stage_timings(stop_stage_timings(), perf_counter() - start)
+
+        if args.trace_sql:
+            print_sql_trace(stop_sql_trace())  # type: ignore
+
+
+## print the time spent in each stage of a command, and in the rest of it, out of its total time (in seconds)
+def print_stage_timings(timings: dict[str, float], total: float) -> None:
+    from sys import stderr
+
+    timings['other'] = max(total - sum(timings.values()), 0)
+    width = max(len(stage) for stage in timings)
+
+    print("\nTIMINGS:", file=stderr)
+
+    for stage, seconds in timings.items():
+        print(f"{stage:<{width}}  {seconds * 1000:9.3f} ms  {seconds / total if total else 0:6.1%}", file=stderr)
+
+    print(f"{'total':<{width}}  {total * 1000:9.3f} ms", file=stderr)
+
+
+## print the statistics of every SQL statement a tracer recorded, from the most time spent to the least, and their query plans
+ # "calls" are the calls from Python, and "runs" are what SQLite reported running (each row of an executemany, and the statements of triggers, count as runs)
+ # plans that scan a whole table are flagged, since they get slower as the table grows
+def print_sql_trace(tracer) -> None:
+    from sys import stderr
+
+    print("\nSQL TRACE:", file=stderr)
+    print("calls | runs | total (ms) | mean (ms) | rows | statement", file=stderr)
+
+    for statistics in tracer.get_report():
+        print(f"{statistics['calls']} | {statistics['runs']} | {statistics['total_ms']:.3f} | {statistics['mean_ms']:.3f} | {statistics['rows']} | {statistics['statement']}", file=stderr)
+
+    print("\nQUERY PLANS:", file=stderr)
+
+    for statement, (plan, scans) in tracer.explain_query_plans().items():
+        print(f"{'[FULL SCAN] ' if scans else ''}{statement}", file=stderr)
+
+        for detail in plan:
+            print(f"    {detail}", file=stderr)
 
 
 if __name__ == '__main__':
+
+    import sys
+
+    # in a packaged application, the processes started by batch-calculate run this file too, and must run their task instead of the CLI
+    # multiprocessing is slow to import, so it is only imported when the application is packaged
+    if getattr(sys, 'frozen', False):
+        from multiprocessing import freeze_support
+
+        freeze_support()
+
     main()
@@ -1,76 +1,912 @@
-from sqlite3 import connect
+from atexit import register as register_exit_handler
+from collections.abc import Set
+from csv import DictReader
+from sqlite3 import (Connection, Cursor, DatabaseError, IntegrityError,
+                     OperationalError, complete_statement, connect)
+from threading import Lock, local
+from time import perf_counter
 from calendar import day_name as weekday_names_iterable
-from calendar import monthrange, monthcalendar
 from datetime import date as date_type, datetime, timedelta
+from itertools import chain, groupby
+from json import JSONDecodeError, loads
 from pathlib import Path
-from re import compile as compile_regex
+from re import Pattern, compile as compile_regex
+from typing import Callable, Iterable, Iterator
+from weakref import finalize
 
-## paths for the folder containing schema and database files
- # during normal use, the DB will be in ~/.npbc (where ~ is the user's home directory) and the schema will be bundled with the executable
- # during development, the DB and schema will both be in "data"
+from npbc_calendar import (get_month_length, get_number_of_days_per_week,
+                           get_weekday_masks)
+
+## paths for the folder containing the database file
+ # during normal use, the DB will be in ~/.npbc (where ~ is the user's home directory)
+ # during development, the DB will be in "data"
+ # the schema is part of this module (see MIGRATIONS), so there is no schema file
 
 DATABASE_DIR = Path().home() / '.npbc'  # normal use path
 # DATABASE_DIR = Path('data')  # development path
 
 DATABASE_PATH = DATABASE_DIR / 'npbc.db'
 
-SCHEMA_PATH = Path(__file__).parent / 'schema.sql'  # normal use path
-# SCHEMA_PATH = DATABASE_DIR / 'schema.sql'  # development path
+
+## version of the undelivered string parser
+ # the day mask of each undelivered string is stored with the version of the parser that made it
+ # increase this whenever a change to the parser could give a different mask for the same string, so that stored masks are parsed again
+PARSER_VERSION = 1
 
 
 ## list constant for names of weekdays
 WEEKDAY_NAMES = list(weekday_names_iterable)
 
 
+## a regex that is only compiled the first time it is used
+ # compiling every regex when this module is imported would slow down every run of the CLI, including the ones that never use them
+ # it can be used just like a compiled pattern (match, split, etc.)
+class LazyRegex:
+    __slots__ = ('pattern', 'compiled')
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.compiled: Pattern | None = None
+
+    ## this is only called for attributes of the compiled pattern, since the slots are found first
+    def __getattr__(self, name: str):
+        if self.compiled is None:
+            self.compiled = compile_regex(self.pattern)
+
+        return getattr(self.compiled, name)
+
+
 ## regex for validating user input
 VALIDATE_REGEX = {
     # match for a list of comma separated values. each value must be/contain digits, or letters, or hyphens. spaces are allowed between values and commas. any number of values are allowed, but at least one must be present.
-    'CSVs': compile_regex(r'^[-\w]+( *, *[-\w]+)*( *,)?$'),
+    'CSVs': LazyRegex(r'^[-\w]+( *, *[-\w]+)*( *,)?$'),
 
     # match for a single number. must be one or two digits
-    'number': compile_regex(r'^[\d]{1,2}?$'),
+    'number': LazyRegex(r'^[\d]{1,2}?$'),
 
     # match for a range of numbers. each number must be one or two digits. numbers are separated by a hyphen. spaces are allowed between numbers and the hyphen.
-    'range': compile_regex(r'^\d{1,2} *- *\d{1,2}$'),
+    'range': LazyRegex(r'^\d{1,2} *- *\d{1,2}$'),
 
     # match for weekday name. day must appear as "daynames" (example: "mondays"). all lowercase.
-    'days': compile_regex(f"^{'|'.join([day_name.lower() + 's' for day_name in WEEKDAY_NAMES])}$"),
+    'days': LazyRegex(f"^{'|'.join([day_name.lower() + 's' for day_name in WEEKDAY_NAMES])}$"),
 
     # match for nth weekday name. day must appear as "n-dayname" (example: "1-monday"). all lowercase. must be one digit.
-    'n-day': compile_regex(f"^\\d *- *({'|'.join([day_name.lower() for day_name in WEEKDAY_NAMES])})$"),
+    'n-day': LazyRegex(f"^\\d *- *({'|'.join([day_name.lower() for day_name in WEEKDAY_NAMES])})$"),
 
     # match for real values, delimited by semicolons. each value must be either an integer or a float with a decimal point. spaces are allowed between values and semicolons, and up to 7 (but at least 1) values are allowed.
-    'costs': compile_regex(r'^\d+(\.\d+)?( *; *\d+(\.\d+)?){0,6} *;?$'),
+    'costs': LazyRegex(r'^\d+(\.\d+)?( *; *\d+(\.\d+)?){0,6} *;?$'),
 
     # match for seven values, each of which must be a 'Y' or an 'N'. there are no delimiters.
-    'delivery': compile_regex(r'^[YN]{7}$')
+    'delivery': LazyRegex(r'^[YN]{7}$')
 }
 
 ## regex for splitting strings
 SPLIT_REGEX = {
     # split on hyphens. spaces are allowed between hyphens and values.
-    'hyphen': compile_regex(r' *- *'),
+    'hyphen': LazyRegex(r' *- *'),
     
     # split on semicolons. spaces are allowed between hyphens and values.
-    'semicolon': compile_regex(r' *; *'),
+    'semicolon': LazyRegex(r' *; *'),
 
     # split on commas. spaces are allowed between commas and values.
-    'comma': compile_regex(r' *, *')
+    'comma': LazyRegex(r' *, *')
+}
+
+
+## dictionary of the index of each weekday, by its lowercase name
+WEEKDAY_INDICES = {
+    day_name.lower(): index
+    for index, day_name in enumerate(WEEKDAY_NAMES)
+}
+
+## grammar for one section of an undelivered string, and the comma after it
+ # each kind of section has named groups, and the name of the last group that matched identifies the kind of section
+ #   "15" (a single day) ends with the 'number' group
+ #   "5-17" (a range of days) ends with the 'range_end' group
+ #   "mondays" (every day that is a certain weekday) ends with the 'weekdays' group
+ #   "2-monday" (the nth occurrence of a weekday) ends with the 'weekday' group
+ # a section must be followed either by a comma and the next section (spaces are allowed around the comma), or by the end of the string (a single trailing comma is allowed)
+UNDELIVERED_SECTION_REGEX = LazyRegex(
+    r'(?:(?P<range_start>\d{1,2})-(?P<range_end>\d{1,2})'
+    f"|(?P<n>\\d)-(?P<weekday>{'|'.join(WEEKDAY_INDICES)})"
+    f"|(?P<weekdays>{'|'.join(WEEKDAY_INDICES)})s"
+    r'|(?P<number>\d{1,2}))'
+    r'(?: *, *(?=[^ ,])|,?\Z)'
+)
+
+
+## the metrics recorded at the hot paths, as {name: (type, help)}
+ # npbc_stage_seconds has a "stage" label (see TimedStage). the load papers, fetch strings, load bills, save bills, save results and set up DB stages are the DB's latency
+ # npbc_command_seconds has a "command" label, with the name of the CLI command (or API endpoint) that was run
+METRICS_HELP = {
+    'npbc_calculations_total': ('counter', "Months of bills calculated."),
+    'npbc_papers_billed_total': ('counter', "Bills of papers calculated, across all months."),
+    'npbc_parse_failures_total': ('counter', "Undelivered strings that passed validation but could not be parsed."),
+    'npbc_stage_seconds': ('histogram', "Time spent in each stage of the work, in seconds."),
+    'npbc_command_seconds': ('histogram', "Time taken by each command, in seconds.")
+}
+
+## upper bounds of the buckets of every histogram, in seconds
+ # most stages take under a millisecond, and a command that takes seconds is worth knowing about
+HISTOGRAM_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+## metrics that are thrown away, which are used unless metrics are turned on (see enable_metrics)
+ # each hook is a call that does nothing, so the hot paths cost the same as without metrics
+class NoMetrics:
+    enabled = False
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        pass
+
+
+## counters and histograms, kept in memory, and formatted in the Prometheus text format
+ # metrics are identified by name and labels, and are created the first time they are used
+ # metrics may be recorded from many threads (like the API server's), so they are updated under a lock
+class MetricsRegistry(NoMetrics):
+    enabled = True
+
+    def __init__(self):
+        self.lock = Lock()
+
+        # {(name, labels): value}
+        self.counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+
+        # {(name, labels): [count in each bucket (not cumulative), sum, count]}
+        self.histograms: dict[tuple[str, tuple[tuple[str, str], ...]], list] = {}
+
+    ## add to a counter
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = name, tuple(sorted(labels.items()))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    ## add a value to a histogram
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = name, tuple(sorted(labels.items()))
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(HISTOGRAM_BUCKETS), 0.0, 0]
+
+            histogram = self.histograms[key]
+
+            # values past the last bucket are only in the count (the +Inf bucket)
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+
+            histogram[1] += value
+            histogram[2] += 1
+
+    ## format every metric in the Prometheus text format (version 0.0.4), with the samples of each metric together
+    def format(self) -> str:
+        with self.lock:
+            samples: dict[str, list[str]] = {}
+
+            for (name, labels), value in sorted(self.counters.items()):
+                samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+
+            for (name, labels), (bucket_counts, total, count) in sorted(self.histograms.items()):
+                lines = samples.setdefault(name, [])
+                cumulative = 0
+
+                for bound, bucket_count in zip(HISTOGRAM_BUCKETS, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        output = []
+
+        for name, lines in samples.items():
+            if name in METRICS_HELP:
+                metric_type, help_text = METRICS_HELP[name]
+                output.append(f"# HELP {name} {help_text}")
+                output.append(f"# TYPE {name} {metric_type}")
+
+            output.extend(lines)
+
+        return '\n'.join(output) + '\n' if output else ''
+
+    ## write every metric to a file, in the Prometheus text format
+     # the file is replaced all at once, so that a collector reading it (like node_exporter's textfile collector) never sees half of it
+    def write(self, path: Path) -> None:
+        path = Path(path)
+        temporary_path = path.with_name(f".{path.name}.tmp")
+
+        temporary_path.write_text(self.format())
+        temporary_path.replace(path)
+
+
+## characters that are escaped in the values of labels
+LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+
+## format the labels of a sample, escaping their values
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        f"{label}=\"{value.translate(LABEL_ESCAPES)}\""
+        for label, value in labels
+    ) + '}'
+
+
+## the metrics of this process. nothing is recorded unless metrics are turned on
+METRICS: NoMetrics = NoMetrics()
+
+
+## start recording metrics, from zero, and get the registry they are recorded in
+def enable_metrics() -> MetricsRegistry:
+    global METRICS
+    METRICS = MetricsRegistry()
+
+    return METRICS
+
+
+## stop recording metrics
+def disable_metrics() -> None:
+    global METRICS
+    METRICS = NoMetrics()
+
+
+## total time spent in each stage of the work (loading papers, parsing, etc.), in seconds, by name, in the order the stages first ran
+ # this is None while timing is off (the default), so that timing a stage costs almost nothing unless it was asked for
+ # stages are timed for the whole process, so this is only meant for one command at a time (for example, "npbc --timings calculate")
+STAGE_TIMINGS: dict[str, float] | None = None
+
+
+## start timing stages, from zero
+def start_stage_timings() -> None:
+    global STAGE_TIMINGS
+    STAGE_TIMINGS = {}
+
+
+## stop timing stages, and get the time spent in each one, in seconds
+def stop_stage_timings() -> dict[str, float]:
+    global STAGE_TIMINGS
+    timings, STAGE_TIMINGS = STAGE_TIMINGS or {}, None
+
+    return timings
+
+
+## time a stage of the work, adding to its total in STAGE_TIMINGS if timing is on, and to the npbc_stage_seconds histogram if metrics are on
+ # used as "with TimedStage('parse'): ...". stages should not be nested, so that their times add up to the time of the command
+class TimedStage:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        if STAGE_TIMINGS is not None or METRICS.enabled:
+            self.start = perf_counter()
+
+    def __exit__(self, *_) -> None:
+        if STAGE_TIMINGS is not None or METRICS.enabled:
+            elapsed = perf_counter() - self.start
+
+            if STAGE_TIMINGS is not None:
+                STAGE_TIMINGS[self.stage] = STAGE_TIMINGS.get(self.stage, 0) + elapsed
+
+            METRICS.observe('npbc_stage_seconds', elapsed, stage=self.stage)
+
+
+## literal values in SQL text (strings and numbers), which are replaced with "?" so that statements that only differ by their values are counted together
+SQL_LITERAL_REGEX = LazyRegex(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?\b")
+
+## whitespace in SQL text, which is collapsed to one space
+SQL_WHITESPACE_REGEX = LazyRegex(r'\s+')
+
+
+## normalize the text of an SQL statement, so that every run of the same statement has the same text
+def normalize_sql(statement: str) -> str:
+    return SQL_WHITESPACE_REGEX.sub(' ', SQL_LITERAL_REGEX.sub('?', statement)).strip()
+
+
+## statistics of the SQL statements run on traced connections, by normalized statement
+ # statements run through execute and executemany are timed (including fetching their rows, since SQLite finds rows as they are fetched), and their rows are counted
+ # the trace callback of each connection also counts every statement SQLite runs, which includes each row of an executemany, and the statements of triggers (which sqlite3 reports with the text of the statement that fired them)
+ # connections may be used from many threads (like the API server's), so the statistics are updated under a lock
+class SQLTracer:
+    def __init__(self):
+        self.lock = Lock()
+
+        # {statement: [calls, seconds, rows, runs reported by SQLite]}
+        self.statistics: dict[str, list] = {}
+
+        # {statement: (SQL text, parameters)} of the first call of each statement, to explain its query plan with
+        self.examples: dict[str, tuple[str, tuple]] = {}
+
+    ## get the statistics of a statement, creating them the first time
+    def get_statistics(self, statement: str) -> list:
+        if statement not in self.statistics:
+            self.statistics[statement] = [0, 0.0, 0, 0]
+
+        return self.statistics[statement]
+
+    ## record a call of a statement from Python, with its SQL text and parameters
+     # the parameters are None if there are none to explain it with (like an executemany with no rows, or a script)
+    def record_call(self, sql: str, parameters: tuple | None, seconds: float) -> str:
+        statement = normalize_sql(sql)
+
+        with self.lock:
+            statistics = self.get_statistics(statement)
+            statistics[0] += 1
+            statistics[1] += seconds
+
+            if parameters is not None:
+                self.examples.setdefault(statement, (sql, tuple(parameters)))
+
+        return statement
+
+    ## record time spent fetching the rows of a statement, and how many were fetched
+    def record_rows(self, statement: str, rows: int, seconds: float) -> None:
+        with self.lock:
+            statistics = self.get_statistics(statement)
+            statistics[1] += seconds
+            statistics[2] += rows
+
+    ## the trace callback of traced connections, called by SQLite with the text of each statement it runs (with its values filled in)
+     # query plans are explained on the same connections, so they are left out
+    def trace(self, sql: str) -> None:
+        if sql.startswith('EXPLAIN'):
+            return
+
+        statement = normalize_sql(sql)
+
+        with self.lock:
+            self.get_statistics(statement)[3] += 1
+
+    ## get the statistics of every statement, as dictionaries, from the most time spent to the least
+    def get_report(self) -> list[dict[str, str | int | float]]:
+        with self.lock:
+            statistics = sorted(self.statistics.items(), key=lambda item: item[1][1], reverse=True)
+
+        return [
+            {
+                'statement': statement,
+                'calls': calls,
+                'runs': runs,
+                'total_ms': seconds * 1000,
+                'mean_ms': seconds * 1000 / calls if calls else 0,
+                'rows': rows
+            }
+            for statement, (calls, seconds, rows, runs) in statistics
+        ]
+
+    ## explain the query plan of every statement called from Python, with the parameters of its first call
+     # returns {statement: (lines of the plan, whether it scans a whole table)}. a plan line starting with "SCAN" reads every row of a table (or of an index, if it says so)
+     # statements that can't be explained (like PRAGMA, or a table that no longer exists) are left out
+    def explain_query_plans(self, connection: Connection | None = None) -> dict[str, tuple[list[str], bool]]:
+        connection = get_connection(connection)
+
+        with self.lock:
+            examples = list(self.examples.items())
+
+        plans = {}
+
+        for statement, (sql, parameters) in examples:
+            try:
+                plan = [
+                    detail
+                    for _, _, _, detail in Connection.execute(connection, f"EXPLAIN QUERY PLAN {sql}", parameters)
+                ]
+
+            except (DatabaseError, ValueError):
+                continue
+
+            if plan:
+                plans[statement] = plan, any(detail.startswith('SCAN') for detail in plan)
+
+        return plans
+
+
+## a cursor that records the rows fetched from it, and the time spent fetching them, with an SQLTracer
+ # every other attribute is the wrapped cursor's
+class TracedCursor:
+    def __init__(self, cursor, tracer: SQLTracer, statement: str):
+        self.cursor = cursor
+        self.tracer = tracer
+        self.statement = statement
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return self
+
+    ## fetch rows with one of the cursor's fetch methods, and record them
+     # fetchmany and fetchall return a list of rows, and fetchone returns one row (or None)
+    def fetch(self, method: Callable, *args):
+        start = perf_counter()
+        rows = method(*args)
+        self.tracer.record_rows(self.statement, len(rows) if isinstance(rows, list) else int(rows is not None), perf_counter() - start)
+
+        return rows
+
+    def __next__(self):
+        row = self.fetch(self.cursor.fetchone)
+
+        if row is None:
+            raise StopIteration
+
+        return row
+
+    def fetchone(self):
+        return self.fetch(self.cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self.fetch(self.cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self.fetch(self.cursor.fetchall)
+
+
+## a connection whose statements are recorded with an SQLTracer (see open_connection)
+ # statements run with execute and executemany are timed, and their rows counted. scripts and commits are timed as they are
+class TracedConnection(Connection):
+    tracer: SQLTracer
+
+    def execute(self, sql: str, parameters=(), /):
+        start = perf_counter()
+        cursor = super().execute(sql, parameters)
+        statement = self.tracer.record_call(sql, parameters, perf_counter() - start)
+
+        return TracedCursor(cursor, self.tracer, statement)
+
+    def executemany(self, sql: str, parameters, /):
+        parameters = iter(parameters)
+        first = next(parameters, None)
+
+        start = perf_counter()
+        cursor = super().executemany(sql, parameters if first is None else chain([first], parameters))
+        self.tracer.record_call(sql, first, perf_counter() - start)
+
+        return cursor
+
+    def executescript(self, script: str, /):
+        start = perf_counter()
+        cursor = super().executescript(script)
+        self.tracer.record_call(script, None, perf_counter() - start)
+
+        return cursor
+
+    def commit(self) -> None:
+        start = perf_counter()
+        super().commit()
+        self.tracer.record_call('COMMIT', None, perf_counter() - start)
+
+
+## the tracer of the SQL run on connections opened from now on, or None if SQL isn't being traced (the default)
+SQL_TRACER: SQLTracer | None = None
+
+
+## start tracing the SQL run on the shared connections, and get the tracer
+ # the shared connections are closed, so that they are opened again with tracing
+def start_sql_trace() -> SQLTracer:
+    global SQL_TRACER
+
+    SQL_TRACER = SQLTracer()
+    CONNECTION_MANAGER.close()
+
+    return SQL_TRACER
+
+
+## stop tracing the SQL run on the shared connections, and get the tracer, which keeps the statistics so far
+def stop_sql_trace() -> SQLTracer | None:
+    global SQL_TRACER
+
+    tracer, SQL_TRACER = SQL_TRACER, None
+    CONNECTION_MANAGER.close()
+
+    return tracer
+
+
+## settings applied once to every connection, when it is opened
+ # WAL lets readers and a writer work at the same time, and NORMAL sync is safe with WAL
+ # a negative cache_size is in KiB, so this is a 16 MiB page cache; mmap_size is in bytes (256 MiB)
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16384,
+    'mmap_size': 268435456
 }
 
+## number of prepared statements each connection keeps cached
+ # statements from generate_parameterized_query only differ by table, columns and condition names, so a small cache holds all of them
+STATEMENT_CACHE_SIZE = 256
+
+
+## open a connection to a DB, with the settings every connection uses
+ # connections are only used by the thread that opened them, but the connection manager may close them from any thread
+ # while SQL is being traced (see start_sql_trace), the connection records its statements with the tracer
+def open_connection(database_path: Path) -> Connection:
+    if SQL_TRACER is None:
+        connection = connect(database_path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+
+    else:
+        connection = connect(database_path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE, factory=TracedConnection)
+        connection.tracer = SQL_TRACER  # type: ignore
+        connection.set_trace_callback(SQL_TRACER.trace)
+
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        connection.execute(f"PRAGMA {pragma} = {value};")
+
+    return connection
+
+
+## the connection of one thread, kept in that thread's local data by a connection manager
+ # a thread's local data is let go of when the thread exits, and then the connection is closed, and the manager forgets it
+ # (sqlite3 connections can't be referred to weakly, so this is what the manager's finalizer watches instead)
+class ThreadConnection:
+    def __init__(self, connection: Connection, forget: Callable[[Connection], None]):
+        self.connection = connection
+        finalize(self, forget, connection)
+
+
+## hand out long-lived connections to the DB, instead of opening one for every query
+ # each thread gets its own connection, which is opened and configured the first time that thread asks for one, and reused after that
+ # sqlite3 connections should not be used by two threads at once, so this is what makes the core functions safe to call from many threads
+ # the connection of a thread that has exited is closed, so short-lived threads (like those of a worker pool) don't leave connections open
+ # if no path is given, DATABASE_PATH is used (it is read when the connection is opened, not when the manager is created)
+class ConnectionManager:
+    def __init__(self, database_path: Path | None = None):
+        self.database_path = database_path
+        self.threads = local()
+        self.connections: set[Connection] = set()
+        self.lock = Lock()
+
+    ## get the connection for the current thread, opening it if needed
+    def get_connection(self) -> Connection:
+        thread_connection = getattr(self.threads, 'connection', None)
+
+        if thread_connection is None:
+            connection = open_connection(self.database_path or DATABASE_PATH)
+            self.threads.connection = ThreadConnection(connection, self.forget)
+
+            with self.lock:
+                self.connections.add(connection)
+
+            return connection
+
+        return thread_connection.connection
+
+    ## close a connection, and stop keeping track of it (once the thread it belonged to has exited)
+    def forget(self, connection: Connection) -> None:
+        with self.lock:
+            self.connections.discard(connection)
+
+        connection.close()
+
+    ## close every connection this manager has opened, in all threads
+    def close(self) -> None:
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+
+            self.connections.clear()
+
+        # the next call to get_connection (in any thread) will open a new connection
+        self.threads = local()
+
+
+## the connection manager used by default for the whole process
+CONNECTION_MANAGER = ConnectionManager()
+register_exit_handler(lambda: CONNECTION_MANAGER.close())
+
+
+## use a different DB for the rest of the session (for example, the DB of another household)
+ # every shared connection to the old DB is closed, so the functions here use the new one unless they are passed a connection
+ # to use another DB for a single call instead, pass a connection from open_connection (after setting it up with setup_and_connect_DB)
+def set_database_path(database_path: Path) -> None:
+    global DATABASE_DIR, DATABASE_PATH
+
+    CONNECTION_MANAGER.close()
+
+    DATABASE_PATH = Path(database_path)
+    DATABASE_DIR = DATABASE_PATH.parent
+
+
+## get a connection to use for a DB operation
+ # if the caller passed in a connection explicitly, use that. otherwise, use the shared connection for this thread
+def get_connection(connection: Connection | None = None) -> Connection:
+    if connection is not None:
+        return connection
+
+    return CONNECTION_MANAGER.get_connection()
+
+
+## run each statement of an SQL script, in whatever transaction the connection is in
+ # executescript commits before it runs, so it can't be used inside a migration's transaction
+def execute_script(connection: Connection, script: str) -> None:
+    statement = ''
+
+    for line in script.splitlines(keepends=True):
+        statement += line
+
+        # a trigger has semicolons inside it, so a statement only ends once SQLite says it is complete
+        if complete_statement(statement):
+            connection.execute(statement)
+            statement = ''
+
+
+## migration 2: store the day mask of each undelivered string, with the version of the parser that made it
+ # DBs from before versioning may already have these columns
+def add_undelivered_string_masks(connection: Connection) -> None:
+    existing_columns = {
+        column_name
+        for _, column_name, *_ in connection.execute("PRAGMA table_info(undelivered_strings);")
+    }
+
+    for column_name in ('mask', 'parser_version'):
+        if column_name not in existing_columns:
+            connection.execute(f"ALTER TABLE undelivered_strings ADD COLUMN {column_name} INTEGER;")
+
+
+## format of the timestamps that undelivered dates used to be logged with, before they were logged as epoch timestamps
+LEGACY_TIMESTAMP_FORMAT = r'%d/%m/%Y %I:%M:%S %p'
+
+
+## migration 4: log undelivered dates as one day mask per paper and month
+ # the old log has a text list of days and a text timestamp for every time results were saved
+ # it is rebuilt with a day mask and an epoch timestamp, keeping only the latest entry for each paper and month
+ # DBs from before versioning may already have the new log
+def migrate_undelivered_dates(connection: Connection) -> None:
+    existing_columns = {
+        column_name
+        for _, column_name, *_ in connection.execute("PRAGMA table_info(undelivered_dates);")
+    }
+
+    if 'dates' not in existing_columns:
+        return
+
+    latest_entries: dict[tuple[int, int, int], tuple[int, int]] = {}
+
+    for timestamp, year, month, paper_id, dates in connection.execute(
+        "SELECT timestamp, year, month, paper_id, dates FROM undelivered_dates ORDER BY entry_id;"
+    ):
+        latest_entries[(paper_id, year, month)] = (
+            int(datetime.strptime(timestamp, LEGACY_TIMESTAMP_FORMAT).timestamp()),
+            sum(
+                1 << (int(day) - 1)
+                for day in set(dates.split(','))
+                if day.strip()
+            )
+        )
+
+    connection.execute("DROP TABLE undelivered_dates;")
+
+    execute_script(connection, """
+        CREATE TABLE undelivered_dates (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            paper_id INTEGER NOT NULL,
+            mask INTEGER NOT NULL,
+            FOREIGN KEY (paper_id) REFERENCES papers(paper_id),
+            CONSTRAINT unique_paper_month_log UNIQUE (paper_id, year, month)
+        );
+    """)
+
+    connection.executemany(
+        "INSERT INTO undelivered_dates (timestamp, year, month, paper_id, mask) VALUES (?, ?, ?, ?, ?);",
+        (
+            (timestamp, year, month, paper_id, mask)
+            for (paper_id, year, month), (timestamp, mask) in latest_entries.items()
+        )
+    )
+
+
+## the schema of the DB, as the migrations that build it, in order
+ # migration n takes a DB from version n - 1 to version n, and the version is stored in the DB as "PRAGMA user_version"
+ # a migration is either SQL, or a function that is given the connection. each one runs in its own transaction, together with setting the new version
+ # DBs made before versioning have version 0, and may already have some of the tables and columns, so the first migrations only add what is missing
+ # never change a migration that has been released. add a new one instead
+MIGRATIONS: list[str | Callable[[Connection], None]] = [
+
+    # 1: papers, their delivery days and costs, undelivered strings, and the undelivered dates log
+    """
+        CREATE TABLE IF NOT EXISTS papers (
+            paper_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            CONSTRAINT unique_paper_name UNIQUE (name)
+        );
+        CREATE TABLE IF NOT EXISTS papers_days_delivered (
+            paper_id INTEGER NOT NULL,
+            day_id INTEGER NOT NULL,
+            delivered INTEGER NOT NULL,
+            FOREIGN KEY(paper_id) REFERENCES papers(paper_id),
+            CONSTRAINT unique_paper_day UNIQUE (paper_id, day_id)
+        );
+        CREATE TABLE IF NOT EXISTS papers_days_cost(
+            paper_id INTEGER NOT NULL,
+            day_id INTEGER NOT NULL,
+            cost INTEGER,
+            FOREIGN KEY(paper_id) REFERENCES papers(paper_id),
+            CONSTRAINT unique_paper_day UNIQUE (paper_id, day_id)
+        );
+        CREATE TABLE IF NOT EXISTS undelivered_strings (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            paper_id INTEGER NOT NULL,
+            string TEXT NOT NULL,
+            FOREIGN KEY (paper_id) REFERENCES papers(paper_id)
+        );
+        CREATE TABLE IF NOT EXISTS undelivered_dates (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            paper_id INTEGER NOT NULL,
+            dates TEXT NOT NULL,
+            FOREIGN KEY (paper_id) REFERENCES papers(paper_id)
+        );
+        CREATE INDEX IF NOT EXISTS search_strings ON undelivered_strings(year, month);
+        CREATE INDEX IF NOT EXISTS paper_names ON papers(name);
+    """,
+
+    # 2: day masks of undelivered strings
+    add_undelivered_string_masks,
+
+    # 3: stored bills, which are marked stale by triggers whenever anything they were calculated from changes
+    """
+        CREATE TABLE IF NOT EXISTS bills (
+            paper_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            cost NOT NULL, -- no type, so that costs are stored exactly as they were calculated (integer or real)
+            stale INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (paper_id) REFERENCES papers(paper_id),
+            CONSTRAINT unique_paper_month UNIQUE (paper_id, year, month)
+        );
+        CREATE INDEX IF NOT EXISTS search_bills ON bills(year, month);
+        CREATE TRIGGER IF NOT EXISTS stale_bills_cost_insert AFTER INSERT ON papers_days_cost BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = NEW.paper_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_cost_update AFTER UPDATE ON papers_days_cost BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id IN (OLD.paper_id, NEW.paper_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_cost_delete AFTER DELETE ON papers_days_cost BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = OLD.paper_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_delivered_insert AFTER INSERT ON papers_days_delivered BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = NEW.paper_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_delivered_update AFTER UPDATE ON papers_days_delivered BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id IN (OLD.paper_id, NEW.paper_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_delivered_delete AFTER DELETE ON papers_days_delivered BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = OLD.paper_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_string_insert AFTER INSERT ON undelivered_strings BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = NEW.paper_id AND year = NEW.year AND month = NEW.month;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_string_update AFTER UPDATE ON undelivered_strings
+        WHEN OLD.string IS NOT NEW.string OR OLD.mask IS NOT NEW.mask OR OLD.paper_id IS NOT NEW.paper_id OR OLD.year IS NOT NEW.year OR OLD.month IS NOT NEW.month BEGIN
+            UPDATE bills SET stale = 1 WHERE (paper_id = OLD.paper_id AND year = OLD.year AND month = OLD.month) OR (paper_id = NEW.paper_id AND year = NEW.year AND month = NEW.month);
+        END;
+        CREATE TRIGGER IF NOT EXISTS stale_bills_string_delete AFTER DELETE ON undelivered_strings BEGIN
+            UPDATE bills SET stale = 1 WHERE paper_id = OLD.paper_id AND year = OLD.year AND month = OLD.month;
+        END;
+        CREATE TRIGGER IF NOT EXISTS delete_bills_paper_delete AFTER DELETE ON papers BEGIN
+            DELETE FROM bills WHERE paper_id = OLD.paper_id;
+        END;
+    """,
+
+    # 4: undelivered dates log with one day mask per paper and month
+    migrate_undelivered_dates,
+
+    # 5: a counter that goes up whenever a paper, or its cost or delivery data, changes, so that papers kept in memory can tell when they are out of date
+    # cost and delivery rows are only ever inserted along with their paper, so inserting them doesn't need a trigger of its own
+    """
+        CREATE TABLE IF NOT EXISTS papers_version (
+            version INTEGER NOT NULL
+        );
+        INSERT INTO papers_version (version) SELECT 0 WHERE NOT EXISTS (SELECT * FROM papers_version);
+        CREATE TRIGGER IF NOT EXISTS papers_version_insert AFTER INSERT ON papers BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_update AFTER UPDATE ON papers BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_delete AFTER DELETE ON papers BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_cost_update AFTER UPDATE ON papers_days_cost BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_cost_delete AFTER DELETE ON papers_days_cost BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_delivered_update AFTER UPDATE ON papers_days_delivered BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_version_delivered_delete AFTER DELETE ON papers_days_delivered BEGIN
+            UPDATE papers_version SET version = version + 1;
+        END;
+    """,
+
+    # 6: an index for finding the undelivered strings of a paper in a range of months (see iterate_log_entries)
+    # the log of undelivered dates already has one, from its unique (paper_id, year, month) constraint
+    # these are ordered by month first, so they don't give the entries of a paper in order of entry_id (see 7)
+    """
+        CREATE INDEX IF NOT EXISTS paper_strings ON undelivered_strings(paper_id, year, month);
+    """,
+
+    # 7: indices for paging through the entries of a paper in order of entry_id (see iterate_log_entries)
+    # every index ends with the rowid (entry_id), so these are indices on (paper_id, entry_id)
+    # "paper_id = ? AND entry_id > ? ORDER BY entry_id LIMIT ?" is then a seek, with no sorting
+    """
+        CREATE INDEX IF NOT EXISTS paper_string_entries ON undelivered_strings(paper_id);
+        CREATE INDEX IF NOT EXISTS paper_date_entries ON undelivered_dates(paper_id);
+    """
+]
+
+## the version of the schema this code uses
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+## bring the DB up to the current version of the schema, by running the migrations it doesn't have yet
+ # each migration runs in its own transaction, which also sets the new version, so a failed migration leaves the DB at the last version that worked
+ # the version is read again once the transaction has the write lock, so two processes starting at once won't both run a migration
+def migrate_DB(connection: Connection) -> None:
+    while True:
+        connection.execute("BEGIN IMMEDIATE;")
+
+        try:
+            version = connection.execute("PRAGMA user_version;").fetchone()[0]
+
+            if version >= SCHEMA_VERSION:
+                connection.commit()
+                return
+
+            migration = MIGRATIONS[version]
+
+            if isinstance(migration, str):
+                execute_script(connection, migration)
+
+            else:
+                migration(connection)
+
+            connection.execute(f"PRAGMA user_version = {version + 1};")
+            connection.commit()
+
+        except Exception:
+            connection.rollback()
+            raise
+
 
 ## ensure DB exists and it's set up with the schema
-def setup_and_connect_DB() -> None:
-    DATABASE_DIR.mkdir(parents=True, exist_ok=True)
-    DATABASE_PATH.touch(exist_ok=True)
+ # if the DB is already at the current version, this is a single pragma read
+def setup_and_connect_DB(connection: Connection | None = None) -> None:
+    try:
+        connection = get_connection(connection)
 
-    with connect(DATABASE_PATH) as connection:
-        connection.executescript(SCHEMA_PATH.read_text())
-        connection.commit()
+    # the DB is created when it is first connected to, but its folder must already exist
+    except OperationalError:
+        DATABASE_DIR.mkdir(parents=True, exist_ok=True)
+        connection = get_connection(connection)
+
+    if connection.execute("PRAGMA user_version;").fetchone()[0] < SCHEMA_VERSION:
+        migrate_DB(connection)
 
 
-## generate a "SELECT" SQL query
+## generate a "SELECT" SQL query, with the values of the conditions written into the SQL text
  # use params to specify columns to select, and "WHERE" conditions
+ # values are not quoted or escaped, and every distinct value gives a new statement that SQLite must parse again. prefer generate_parameterized_query
 def generate_sql_query(table_name: str, conditions: dict[str, int | str] | None = None, columns: list[str] | None = None) -> str:
     sql_query = f"SELECT"
     
@@ -93,138 +929,248 @@ def generate_sql_query(table_name: str, conditions: dict[str, int | str] | None
     return f"{sql_query};"
 
 
+## generate a "SELECT" SQL query, with a "?" placeholder in place of each condition value
+ # use params to specify columns to select, and "WHERE" conditions
+ # the values are returned separately, in the same order as the placeholders, to be bound when the query is executed
+ # the SQL text only depends on the table, columns and condition names, so repeated lookups reuse the same cached statement
+def generate_parameterized_query(table_name: str, conditions: dict[str, int | str] | None = None, columns: list[str] | None = None) -> tuple[str, tuple[int | str, ...]]:
+    sql_query = f"SELECT"
+
+    if columns:
+        sql_query += f" {', '.join(columns)}"
+
+    else:
+        sql_query += f" *"
+
+    sql_query += f" FROM {table_name}"
+
+    if conditions:
+        conditions_segment = ' AND '.join([
+            f"{parameter_name} = ?"
+            for parameter_name in conditions
+        ])
+
+        sql_query += f" WHERE {conditions_segment}"
+
+        return f"{sql_query};", tuple(conditions.values())
+
+    return f"{sql_query};", ()
+
+
+## get the entries of a log (undelivered_strings or undelivered_dates) that match some conditions, in order of entry_id
+ # the conditions are values of columns, like the conditions of generate_parameterized_query
+ # only entries after the given entry_id, of months from since to until (both inclusive, only their month and year are used), are returned, up to the limit. each of these is optional
+ # paging by the last entry_id seen (instead of an offset) means every page starts with an index lookup, however many pages came before it
+ # the rows are read from the cursor as they are needed, so the log doesn't have to fit in memory
+def iterate_log_entries(table_name: str, columns: list[str], conditions: dict[str, int | str] | None = None, after: int | None = None, since: date_type | None = None, until: date_type | None = None, limit: int | None = None, connection: Connection | None = None) -> Cursor:
+    clauses = [f"{column} = ?" for column in conditions or {}]
+    parameters: list[int | str] = list((conditions or {}).values())
+
+    if after is not None:
+        clauses.append("entry_id > ?")
+        parameters.append(after)
+
+    # the year is compared on its own as well, so that an index on the year can be used
+    if since is not None:
+        clauses.append("year >= ? AND year * 12 + month >= ?")
+        parameters.extend((since.year, since.year * 12 + since.month))
+
+    if until is not None:
+        clauses.append("year <= ? AND year * 12 + month <= ?")
+        parameters.extend((until.year, until.year * 12 + until.month))
+
+    query = f"SELECT {', '.join(columns)} FROM {table_name}"
+
+    if clauses:
+        query += f" WHERE {' AND '.join(clauses)}"
+
+    query += " ORDER BY entry_id"
+
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    return get_connection(connection).execute(f"{query};", parameters)
+
+
 ## execute a "SELECT" SQL query and return the results
-def query_database(query: str) -> list[tuple]:
-    with connect(DATABASE_PATH) as connection:
-        return connection.execute(query).fetchall()
+ # any parameters are bound to the placeholders in the query
+def query_database(query: str, parameters: tuple[int | str, ...] = (), connection: Connection | None = None) -> list[tuple]:
+    with get_connection(connection) as connection:
+        return connection.execute(query, parameters).fetchall()
     
     return []
 
 
-## generate a list of number of times each weekday occurs in a given month
- # the list will be in the same order as WEEKDAY_NAMES (so the first day should be Monday)
-def get_number_of_days_per_week(month: int, year: int) -> list[int]:
-    main_calendar = monthcalendar(year, month)
-    number_of_weeks = len(main_calendar)
-    number_of_weekdays = []
+## split a string that specifies when a given paper was not delivered into typed tokens, in a single scan
+ # each section is matched against the grammar where the previous one ended, so the string is only read once
+ # each token is a tuple of the kind of section and two numbers:
+ #   ('number', day, day)
+ #   ('range', first day, last day)
+ #   ('weekdays', weekday, 0)
+ #   ('n-day', n, weekday)
+ # if any part of the string does not match the grammar (or the string is empty), None is returned
+def tokenize_undelivered_string(string: str) -> list[tuple[str, int, int]] | None:
+    if not string:
+        return None
 
-    for i, _ in enumerate(WEEKDAY_NAMES):
-        number_of_weekday = number_of_weeks
+    tokens = []
+    position = 0
+    match_section = UNDELIVERED_SECTION_REGEX.match
 
-        if main_calendar[0][i] == 0:
-            number_of_weekday -= 1
-        
-        if main_calendar[-1][i] == 0:
-            number_of_weekday -= 1
+    while position < len(string):
+        section = match_section(string, position)
 
-        number_of_weekdays.append(number_of_weekday)
+        if section is None:
+            return None
 
-    return number_of_weekdays
+        kind = section.lastgroup
 
+        if kind == 'number':
+            day = int(section['number'])
+            tokens.append(('number', day, day))
 
-## validate a string that specifies when a given paper was not delivered
- # first check to see that it meets the comma-separated requirements
- # then check against each of the other acceptable patterns in the regex dictionary
-def validate_undelivered_string(string: str) -> bool:
-    if VALIDATE_REGEX['CSVs'].match(string):
-        
-        for section in SPLIT_REGEX['comma'].split(string.rstrip(',')):
-            section_validity = False
+        elif kind == 'range_end':
+            tokens.append(('range', int(section['range_start']), int(section['range_end'])))
 
-            for pattern, regex in VALIDATE_REGEX.items():
-                if (not section_validity) and (pattern not in ["CSVs", "costs", "delivery"]) and (regex.match(section)):
-                    section_validity = True
+        elif kind == 'weekdays':
+            tokens.append(('weekdays', WEEKDAY_INDICES[section['weekdays']], 0))
 
-            if not section_validity:
-                return False
-        
-        return True
-    
-    return False
+        else:
+            tokens.append(('n-day', int(section['n']), WEEKDAY_INDICES[section['weekday']]))
 
+        position = section.end()
 
-## parse a string that specifies when a given paper was not delivered
- # each CSV section states some set of dates
- # this function will return a set of dates that uniquely identifies each date mentioned across all the CSVs
-def parse_undelivered_string(string: str, month: int, year: int) -> set[date_type]:
-    dates = set()
+    return tokens
 
-    for section in SPLIT_REGEX['comma'].split(string.rstrip(',')):
 
-        # if the date is simply a number, it's a single day. so we just identify that date
-        if VALIDATE_REGEX['number'].match(section):
-            date = int(section)
+## validate a string that specifies when a given paper was not delivered
+ # the string is valid if every section of it matches the grammar
+def validate_undelivered_string(string: str) -> bool:
+    return tokenize_undelivered_string(string) is not None
 
-            if date > 0 and date <= monthrange(year, month)[1]:
-                dates.add(date_type(year, month, date))
 
-        # if the date is a range of numbers, it's a range of days. we identify all the dates in that range, bounds inclusive
-        elif VALIDATE_REGEX['range'].match(section):
-            start, end = [int(date) for date in SPLIT_REGEX['hyphen'].split(section)]
+## a set of dates in one month when a paper was not delivered, stored as a day mask
+ # bit (n - 1) of the mask is set if the paper was not delivered on day n of the month
+ # it behaves like a read-only set of dates, but the date objects are only created if it is iterated over
+class UndeliveredDates(Set):
+    __slots__ = ('mask', 'month', 'year')
 
-            if (0 < start) and (start <= end) and (end <= monthrange(year, month)[1]):
-                dates.update(
-                    date_type(year, month, day)
-                    for day in range(start, end + 1)
-                )
+    def __init__(self, mask: int, month: int, year: int):
+        self.mask = mask
+        self.month = month
+        self.year = year
 
-        # if the date is the plural of a weekday name, we identify all dates in that month which are the given weekday
-        elif VALIDATE_REGEX['days'].match(section):
-            weekday = WEEKDAY_NAMES.index(section.capitalize().rstrip('s'))
+    def __contains__(self, date: object) -> bool:
+        return isinstance(date, date_type) and (date.year, date.month) == (self.year, self.month) and bool(self.mask >> (date.day - 1) & 1)
 
-            dates.update(
-                date_type(year, month, day)
-                for day in range(1, monthrange(year, month)[1] + 1)
-                if date_type(year, month, day).weekday() == weekday
-            )
+    ## generate the dates in order, by repeatedly taking the lowest set bit of the mask
+    def __iter__(self) -> Iterator[date_type]:
+        mask = self.mask
 
-        # if the date is a number and a weekday name (singular), we identify the date that is the nth occurrence of the given weekday in the month
-        elif VALIDATE_REGEX['n-day'].match(section):
-            n, weekday = SPLIT_REGEX['hyphen'].split(section)
+        while mask:
+            lowest_bit = mask & -mask
+            yield date_type(self.year, self.month, lowest_bit.bit_length())
+            mask ^= lowest_bit
 
-            n = int(n)
+    def __len__(self) -> int:
+        return self.mask.bit_count()
 
-            if n > 0 and n <= get_number_of_days_per_week(month, year)[WEEKDAY_NAMES.index(weekday.capitalize())]:
-                weekday = WEEKDAY_NAMES.index(weekday.capitalize())
+    def __repr__(self) -> str:
+        return f"UndeliveredDates({self.mask:#x}, {self.month}, {self.year})"
 
-                valid_dates = [
-                    date_type(year, month, day)
-                    for day in range(1, monthrange(year, month)[1] + 1)
-                    if date_type(year, month, day).weekday() == weekday
-                ]
+    ## results of set operations (like & and |) are plain sets
+    @classmethod
+    def _from_iterable(cls, iterable) -> set:
+        return set(iterable)
+
+    ## count the undelivered dates for each weekday, in the same order as WEEKDAY_NAMES
+     # each count is the number of bits the mask has in common with the mask of that weekday
+    def count_per_weekday(self) -> list[int]:
+        return [
+            (self.mask & weekday_mask).bit_count()
+            for weekday_mask in get_weekday_masks(self.month, self.year)
+        ]
 
-                dates.add(valid_dates[n - 1])
 
-        # bug report :)
-        else:
+## parse a string that specifies when a given paper was not delivered, to a day mask
+ # each CSV section states some set of dates, which are set in the mask as its token is read
+ # bit (n - 1) of the mask is set if day n of the month is mentioned in any of the CSVs
+def parse_undelivered_string_to_mask(string: str, month: int, year: int) -> int:
+    mask = 0
+
+    # these only depend on the month, so they are computed once for all sections
+    month_length = get_month_length(month, year)
+    weekday_masks = get_weekday_masks(month, year)
+
+    tokens = tokenize_undelivered_string(string)
+
+    # an empty string has no dates. any other string that can't be tokenized is a bug report :)
+    if tokens is None:
+        if string:
             print("Congratulations! You broke the program!")
             print("You managed to write a string that the program considers valid, but isn't actually.")
             print("Please report it to the developer.")
             print(f"\nThe string you wrote was: {string}")
             print("This data has not been counted.")
 
-    return dates
+            METRICS.inc('npbc_parse_failures_total')
+
+        return 0
+
+    for kind, first, second in tokens:
+
+        # if the date is simply a number, it's a single day. so we just identify that date
+        # if the date is a range of numbers, it's a range of days. we identify all the dates in that range, bounds inclusive
+        if kind == 'number' or kind == 'range':
+            if (0 < first) and (first <= second) and (second <= month_length):
+                mask |= ((1 << (second - first + 1)) - 1) << (first - 1)
+
+        # if the date is the plural of a weekday name, we identify all dates in that month which are the given weekday
+        elif kind == 'weekdays':
+            mask |= weekday_masks[first]
+
+        # if the date is a number and a weekday name (singular), we identify the date that is the nth occurrence of the given weekday in the month
+        else:
+
+            # drop the lowest set bit of the weekday's mask n - 1 times, and then the lowest bit left is the nth occurrence
+            weekday_mask = weekday_masks[second]
+
+            for _ in range(first - 1):
+                weekday_mask &= weekday_mask - 1
+
+            if first > 0 and weekday_mask:
+                mask |= weekday_mask & -weekday_mask
+
+    return mask
+
+
+## parse a string that specifies when a given paper was not delivered
+ # each CSV section states some set of dates
+ # this function will return a set of dates that uniquely identifies each date mentioned across all the CSVs
+def parse_undelivered_string(string: str, month: int, year: int) -> UndeliveredDates:
+    return UndeliveredDates(parse_undelivered_string_to_mask(string, month, year), month, year)
 
 
 ## get the cost and delivery data for a given paper from the DB
  # each of them are converted to a dictionary, whose index is the day_id
  # the two dictionaries are then returned as a tuple
-def get_cost_and_delivery_data(paper_id: int) -> tuple[dict[int, float], dict[int, bool]]:
-    cost_query = generate_sql_query(
+def get_cost_and_delivery_data(paper_id: int, connection: Connection | None = None) -> tuple[dict[int, float], dict[int, bool]]:
+    cost_query, cost_parameters = generate_parameterized_query(
         'papers_days_cost',
         columns=['day_id', 'cost'],
         conditions={'paper_id': paper_id}
     )
 
-    delivery_query = generate_sql_query(
+    delivery_query, delivery_parameters = generate_parameterized_query(
         'papers_days_delivered',
         columns=['day_id', 'delivered'],
         conditions={'paper_id': paper_id}
     )
 
-    with connect(DATABASE_PATH) as connection:
-        cost_tuple = connection.execute(cost_query).fetchall()
-        delivery_tuple = connection.execute(delivery_query).fetchall()
+    with get_connection(connection) as connection:
+        cost_tuple = connection.execute(cost_query, cost_parameters).fetchall()
+        delivery_tuple = connection.execute(delivery_query, delivery_parameters).fetchall()
 
     cost_dict = {
         day_id: cost
@@ -241,15 +1187,21 @@ def get_cost_and_delivery_data(paper_id: int) -> tuple[dict[int, float], dict[in
 
 ## calculate the cost of one paper for the full month
  # any dates when it was not delivered will be removed
-def calculate_cost_of_one_paper(number_of_days_per_week: list[int], undelivered_dates: set[date_type], cost_and_delivered_data: tuple[dict[int, float], dict[int, bool]]) -> float:
+def calculate_cost_of_one_paper(number_of_days_per_week: list[int], undelivered_dates: Set[date_type], cost_and_delivered_data: tuple[dict[int, float], dict[int, bool]]) -> float:
     cost_data, delivered_data = cost_and_delivered_data
-    
-    # initialize counters corresponding to each weekday when the paper was not delivered
-    number_of_days_per_week_not_received = [0] * len(number_of_days_per_week)
 
-    # for each date that the paper was not delivered, we increment the counter for the corresponding weekday
-    for date in undelivered_dates:
-        number_of_days_per_week_not_received[date.weekday()] += 1
+    # if the dates are stored as a mask, they can be counted for each weekday without creating any dates
+    if isinstance(undelivered_dates, UndeliveredDates):
+        number_of_days_per_week_not_received = undelivered_dates.count_per_weekday()
+
+    else:
+
+        # initialize counters corresponding to each weekday when the paper was not delivered
+        number_of_days_per_week_not_received = [0] * len(number_of_days_per_week)
+
+        # for each date that the paper was not delivered, we increment the counter for the corresponding weekday
+        for date in undelivered_dates:
+            number_of_days_per_week_not_received[date.weekday()] += 1
     
     # calculate the total number of each weekday the paper was delivered (if it is supposed to be delivered)
     number_of_days_delivered = [
@@ -264,147 +1216,670 @@ def calculate_cost_of_one_paper(number_of_days_per_week: list[int], undelivered_
     )
 
 
-## calculate the cost of all papers for the full month
+## get the cost and delivery data for all papers from the DB at once
+ # this replaces calling get_cost_and_delivery_data once per paper, which opens a connection and runs two queries for each paper
+ # the paper IDs are fetched with the same query calculate_cost_of_all_papers always used, so the order of papers does not change
+ # the cost and delivery tables are then each read in one pass, ordered by day_id within each paper
+ # the result is keyed by paper_id, and each value is exactly what get_cost_and_delivery_data would return for that paper
+ # if a (month, year) is given as unbilled_in, only papers without an up to date bill for that month are loaded
+def get_cost_and_delivery_data_of_all_papers(connection: Connection | None = None, unbilled_in: tuple[int, int] | None = None) -> dict[int, tuple[dict[int, float], dict[int, bool]]]:
+    condition = ''
+    parameters: tuple[int, ...] = ()
+
+    # only select papers that don't have an up to date bill, if asked to
+    if unbilled_in is not None:
+        month, year = unbilled_in
+        condition = " WHERE paper_id NOT IN (SELECT paper_id FROM bills WHERE year = ? AND month = ? AND stale = 0)"
+        parameters = (year, month)
+
+    with TimedStage('load papers'), get_connection(connection) as connection:
+        if unbilled_in is None:
+            papers = connection.execute(
+                *generate_parameterized_query(
+                    'papers',
+                    columns=['paper_id']
+                )
+            ).fetchall()
+
+        else:
+            papers = connection.execute(
+                f"SELECT paper_id FROM papers{condition};",
+                parameters
+            ).fetchall()
+
+        # initialize a "blank" pair of dictionaries for each paper
+        cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]] = {
+            paper_id: ({}, {})
+            for paper_id, in papers # type: ignore
+        }
+
+        # fill in the cost data for each paper
+        for paper_id, day_id, cost in connection.execute(
+            f"SELECT paper_id, day_id, cost FROM papers_days_cost{condition} ORDER BY paper_id, day_id;",
+            parameters
+        ):
+            if paper_id in cost_and_delivery_data:
+                cost_and_delivery_data[paper_id][0][day_id] = cost
+
+        # fill in the delivery data for each paper
+        for paper_id, day_id, delivered in connection.execute(
+            f"SELECT paper_id, day_id, delivered FROM papers_days_delivered{condition} ORDER BY paper_id, day_id;",
+            parameters
+        ):
+            if paper_id in cost_and_delivery_data:
+                cost_and_delivery_data[paper_id][1][day_id] = delivered
+
+    return cost_and_delivery_data
+
+
+## get the version of the papers in the DB, which changes whenever a paper, or its cost or delivery data, changes
+ # this is a single row read, so it is cheap enough to check before every use of papers kept in memory
+def get_papers_version(connection: Connection | None = None) -> int:
+    return get_connection(connection).execute("SELECT version FROM papers_version;").fetchone()[0]
+
+
+## the cost and delivery data of every paper, kept in memory between calculations by a long-running process (like the daemon)
+ # it is loaded again only when the version of the papers changes, or the DB does (see set_database_path), so a paper edited with the CLI is picked up by the next calculation
+ # the data is replaced together with its version, so a calculation never sees half of a reload
+class PapersCache:
+    def __init__(self):
+        self.lock = Lock()
+        self.papers: tuple[Path | None, int | None, dict[int, tuple[dict[int, float], dict[int, bool]]]] = (None, None, {})
+
+    ## get (the version it was loaded at, the cost and delivery data of each paper) for the DB in DATABASE_PATH, loading it again if it is out of date
+    def get(self) -> tuple[int, dict[int, tuple[dict[int, float], dict[int, bool]]]]:
+        version = get_papers_version()
+
+        if self.papers[:2] != (DATABASE_PATH, version):
+
+            # only one thread loads the papers, and any others waiting for it use what it loaded
+            with self.lock:
+                if self.papers[:2] != (DATABASE_PATH, version):
+
+                    # the version is read before the papers, so if they change while loading, the next calculation loads them again
+                    self.papers = DATABASE_PATH, version, get_cost_and_delivery_data_of_all_papers()
+
+        _, version, cost_and_delivery_data = self.papers
+
+        return version, cost_and_delivery_data  # type: ignore
+
+
+## the papers kept in memory by this process. this is None unless it was asked for (see keep_papers_warm), so a single command doesn't pay for checking the version
+PAPERS_CACHE: PapersCache | None = None
+
+
+## keep the cost and delivery data of the papers in memory between calculations, and get the cache it is kept in
+def keep_papers_warm() -> PapersCache:
+    global PAPERS_CACHE
+    PAPERS_CACHE = PapersCache()
+
+    return PAPERS_CACHE
+
+
+## get the cost and delivery data of the papers kept in memory, with the version it was loaded at, as (version, data), or (None, None) if it can't be used
+ # it is only kept for the DB of the shared connections, so a calculation on a connection of its own (like calculate_database) loads its own
+def get_warm_papers(connection: Connection | None = None) -> tuple[int | None, dict[int, tuple[dict[int, float], dict[int, bool]]] | None]:
+    if PAPERS_CACHE is None or connection is not None:
+        return None, None
+
+    return PAPERS_CACHE.get()
+
+
+## get the day masks of some undelivered string rows, using the stored masks where they are up to date
+ # each row is (entry_id, paper_id, string, mask, parser_version), all from the same month
+ # rows with no stored mask, or a mask from a different parser version, are parsed again
+ # returns {paper_id: mask} (if a paper has more than one row, the last one is used), and (mask, parser_version, entry_id) for each row that was parsed again
+def get_masks_from_rows(rows: Iterable[tuple[int, int, str, int | None, int | None]], month: int, year: int) -> tuple[dict[int, int], list[tuple[int, int, int]]]:
+    masks: dict[int, int] = {}
+    updates: list[tuple[int, int, int]] = []
+
+    for entry_id, paper_id, undelivered_string, mask, parser_version in rows:
+        if mask is None or parser_version != PARSER_VERSION:
+            with TimedStage('parse'):
+                mask = parse_undelivered_string_to_mask(undelivered_string, month, year)
+
+            updates.append((mask, PARSER_VERSION, entry_id))
+
+        masks[paper_id] = mask
+
+    return masks, updates
+
+
+## store day masks that were parsed again, as returned by get_masks_from_rows
+def save_parsed_masks(updates: list[tuple[int, int, int]], connection: Connection | None = None) -> None:
+    if updates:
+        with TimedStage('parse'), get_connection(connection) as connection:
+            connection.executemany(
+                "UPDATE undelivered_strings SET mask = ?, parser_version = ? WHERE entry_id = ?;",
+                updates
+            )
+
+
+## get the day masks of all the undelivered strings stored for a month, as {paper_id: mask}
+ # the stored masks are used, and any that are out of date are parsed again and stored
+def get_undelivered_masks(month: int, year: int, connection: Connection | None = None) -> dict[int, int]:
+    connection = get_connection(connection)
+
+    with TimedStage('fetch strings'):
+        rows = connection.execute(
+            "SELECT entry_id, paper_id, string, mask, parser_version FROM undelivered_strings WHERE year = ? AND month = ? ORDER BY entry_id;",
+            (year, month)
+        ).fetchall()
+
+    masks, updates = get_masks_from_rows(rows, month, year)
+
+    save_parsed_masks(updates, connection)
+
+    return masks
+
+
+## calculate the cost of all papers for the full month, from the day masks of when each paper was not delivered
  # return data about the cost of each paper, the total cost, and dates when each paper was not delivered
-def calculate_cost_of_all_papers(undelivered_strings: dict[int, str], month: int, year: int) -> tuple[dict[int, float], float, dict[int, set[date_type]]]:
+ # the cost and delivery data of all papers may be passed in if it was already loaded (for example, when calculating many months)
+def calculate_cost_of_all_papers_from_masks(undelivered_masks: dict[int, int], month: int, year: int, connection: Connection | None = None, cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]] | None = None) -> tuple[dict[int, float], float, dict[int, Set[date_type]]]:
     NUMBER_OF_DAYS_PER_WEEK = get_number_of_days_per_week(month, year)
 
-    # get the IDs of papers that exist
-    with connect(DATABASE_PATH) as connection:
-        papers = connection.execute(
-            generate_sql_query(
-                'papers',
-                columns=['paper_id']
+    # get the data about cost and delivery for each paper that exists
+    if cost_and_delivery_data is None:
+        cost_and_delivery_data = get_cost_and_delivery_data_of_all_papers(connection)
+
+    with TimedStage('compute'):
+
+        # initialize a "blank" dictionary that will eventually contain any dates when a paper was not delivered
+        undelivered_dates: dict[int, Set[date_type]] = {
+            paper_id: UndeliveredDates(0, month, year)
+            for paper_id in cost_and_delivery_data # type: ignore
+        }
+
+        # set the undelivered dates for each paper
+        for paper_id, mask in undelivered_masks.items():
+            undelivered_dates[paper_id] = UndeliveredDates(mask, month, year)
+
+        # calculate the cost of each paper
+        costs = {
+            paper_id: calculate_cost_of_one_paper(
+                NUMBER_OF_DAYS_PER_WEEK,
+                undelivered_dates[paper_id],
+                paper_cost_and_delivery_data
             )
-        ).fetchall()
+            for paper_id, paper_cost_and_delivery_data in cost_and_delivery_data.items()
+        }
 
-    # get the data about cost and delivery for each paper
-    cost_and_delivery_data = [
-        get_cost_and_delivery_data(paper_id)
-        for paper_id, in papers # type: ignore
-    ]
+        # calculate the total cost of all papers
+        total = sum(costs.values())
 
-    # initialize a "blank" dictionary that will eventually contain any dates when a paper was not delivered
-    undelivered_dates: dict[int, set[date_type]] = {
-        paper_id: {}
-        for paper_id, in papers # type: ignore
-    }
+    return costs, total, undelivered_dates
 
-    # calculate the undelivered dates for each paper
-    for paper_id, undelivered_string in undelivered_strings.items(): # type: ignore
-        undelivered_dates[paper_id] = parse_undelivered_string(undelivered_string, month, year)
 
-    # calculate the cost of each paper
-    costs = {
-        paper_id: calculate_cost_of_one_paper(
-            NUMBER_OF_DAYS_PER_WEEK,
-            undelivered_dates[paper_id],
-            cost_and_delivery_data[index]
+## get the stored bills of all papers for a month with one indexed query, as {paper_id: cost}, in the same order as the papers
+ # papers with no bill for the month, or a stale one, map to None
+def get_bills(month: int, year: int, connection: Connection | None = None) -> dict[int, float | None]:
+    with TimedStage('load bills'), get_connection(connection) as connection:
+        return dict(
+            connection.execute(
+                "SELECT papers.paper_id, bills.cost FROM papers LEFT JOIN bills ON bills.paper_id = papers.paper_id AND bills.year = ? AND bills.month = ? AND bills.stale = 0;",
+                (year, month)
+            ).fetchall()
         )
-        for index, (paper_id,) in enumerate(papers) # type: ignore
-    }
 
-    # calculate the total cost of all papers
-    total = sum(costs.values())
 
-    return costs, total, undelivered_dates
+## store the bills of some papers for a month, replacing any stale ones
+def save_bills(costs: dict[int, float], month: int, year: int, connection: Connection | None = None) -> None:
+    if costs:
+        with TimedStage('save bills'), get_connection(connection) as connection:
+            connection.executemany(
+                "INSERT INTO bills (paper_id, year, month, cost, stale) VALUES (?, ?, ?, ?, 0) ON CONFLICT (paper_id, year, month) DO UPDATE SET cost = excluded.cost, stale = 0;",
+                (
+                    (paper_id, year, month, cost)
+                    for paper_id, cost in costs.items()
+                )
+            )
 
 
-## save the results of undelivered dates to the DB
- # save the dates any paper was not delivered
-def save_results(undelivered_dates: dict[int, set[date_type]], month: int, year: int) -> None:
-    TIMESTAMP = datetime.now().strftime(r'%d/%m/%Y %I:%M:%S %p')
+## calculate the cost of all papers for the full month, using the bills stored in the DB
+ # bills are marked stale by triggers whenever a paper's cost or delivery data, or an undelivered string of the month, changes
+ # only papers with a missing or stale bill are calculated (and their bills stored), so repeating a month only reads the stored bills
+ # cost and delivery data kept in memory by the caller may be given, with the papers version it was loaded at (see get_papers_version)
+ # it is used for the papers that need calculating, instead of reading them from the DB, unless the papers have changed since it was loaded
+ # return data about the cost of each paper, the total cost, and dates when each paper was not delivered
+def calculate_cost_of_all_papers_from_bills(month: int, year: int, connection: Connection | None = None, cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]] | None = None, papers_version: int | None = None) -> tuple[dict[int, float], float, dict[int, Set[date_type]]]:
+    connection = get_connection(connection)
 
-    with connect(DATABASE_PATH) as connection:
-        for paper_id, undelivered_date_instances in undelivered_dates.items():
-            connection.execute(
-                "INSERT INTO undelivered_dates (timestamp, month, year, paper_id, dates) VALUES (?, ?, ?, ?, ?);",
+    # the masks are fetched first, because storing any masks that were parsed again marks the month's bills stale
+    undelivered_masks = get_undelivered_masks(month, year, connection)
+
+    costs = get_bills(month, year, connection)
+
+    if None in costs.values():
+
+        # the data in memory is checked against the version as late as possible, so that a paper edited since isn't billed at its old cost
+        if cost_and_delivery_data is not None and papers_version == get_papers_version(connection):
+            unbilled_data = {
+                paper_id: cost_and_delivery_data[paper_id]
+                for paper_id, cost in costs.items()
+                if cost is None
+            }
+
+        else:
+            unbilled_data = get_cost_and_delivery_data_of_all_papers(connection, unbilled_in=(month, year))
+
+        new_costs, _, _ = calculate_cost_of_all_papers_from_masks(
+            undelivered_masks,
+            month,
+            year,
+            connection,
+            unbilled_data
+        )
+
+        save_bills(new_costs, month, year, connection)
+        costs.update(new_costs)
+
+    with TimedStage('compute'):
+
+        # initialize a "blank" dictionary that will eventually contain any dates when a paper was not delivered
+        undelivered_dates: dict[int, Set[date_type]] = {
+            paper_id: UndeliveredDates(0, month, year)
+            for paper_id in costs
+        }
+
+        # set the undelivered dates for each paper
+        for paper_id, mask in undelivered_masks.items():
+            undelivered_dates[paper_id] = UndeliveredDates(mask, month, year)
+
+        # calculate the total cost of all papers
+        total = sum(costs.values()) # type: ignore
+
+    return costs, total, undelivered_dates # type: ignore
+
+
+## count a month of bills calculated, in the metrics
+def count_calculation(costs: dict[int, float]) -> None:
+    METRICS.inc('npbc_calculations_total')
+    METRICS.inc('npbc_papers_billed_total', len(costs))
+
+
+## calculate the cost of all papers for the full month
+ # return data about the cost of each paper, the total cost, and dates when each paper was not delivered
+ # if undelivered strings are given, they are parsed. otherwise, the day masks stored with the month's strings in the DB are used
+ # the cost and delivery data of all papers may be passed in if it was already loaded (for example, when calculating many months)
+ # if neither is given, the bills stored in the DB are used, and only missing or stale bills are calculated (from the papers kept in memory, if they are, see keep_papers_warm)
+def calculate_cost_of_all_papers(undelivered_strings: dict[int, str] | None, month: int, year: int, connection: Connection | None = None, cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]] | None = None) -> tuple[dict[int, float], float, dict[int, Set[date_type]]]:
+    if undelivered_strings is None and cost_and_delivery_data is None:
+        papers_version, warm_data = get_warm_papers(connection)
+        results = calculate_cost_of_all_papers_from_bills(month, year, connection, warm_data, papers_version)
+
+        count_calculation(results[0])
+
+        return results
+
+    if undelivered_strings is None:
+        undelivered_masks = get_undelivered_masks(month, year, connection)
+
+    else:
+        with TimedStage('parse'):
+            undelivered_masks = {
+                paper_id: parse_undelivered_string_to_mask(undelivered_string, month, year)
+                for paper_id, undelivered_string in undelivered_strings.items()
+            }
+
+    results = calculate_cost_of_all_papers_from_masks(
+        undelivered_masks,
+        month,
+        year,
+        connection,
+        cost_and_delivery_data
+    )
+
+    count_calculation(results[0])
+
+    return results
+
+
+## generate the months from the start month to the end month, both inclusive, as (month, year) tuples
+ # only the month and year of the start and end dates are used
+def get_months_in_range(start: date_type, end: date_type) -> Iterator[tuple[int, int]]:
+    for month_number in range(start.year * 12 + start.month - 1, end.year * 12 + end.month):
+        yield month_number % 12 + 1, month_number // 12
+
+
+## fetch the day masks of the undelivered strings of all months from the start month to the end month, both inclusive, with one query
+ # the rows are read from the cursor as they are needed, and grouped by month, so only one month's masks are held in memory at a time
+ # any stored masks that are out of date are parsed again, and stored once their month has been read
+ # yields ((month, year), {paper_id: mask}) for each month that has any strings, in order. if a paper has more than one string in a month, the last one is used
+ # the cursor is closed as soon as the generator is closed, so a caller that stops early doesn't leave it open on the shared connection
+def iterate_undelivered_masks(start: date_type, end: date_type, connection: Connection | None = None) -> Iterator[tuple[tuple[int, int], dict[int, int]]]:
+    connection = get_connection(connection)
+
+    rows = connection.execute(
+        "SELECT year, month, entry_id, paper_id, string, mask, parser_version FROM undelivered_strings WHERE year BETWEEN ? AND ? AND year * 12 + month BETWEEN ? AND ? ORDER BY year, month, entry_id;",
+        (start.year, end.year, start.year * 12 + start.month, end.year * 12 + end.month)
+    )
+
+    try:
+        for (year, month), month_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+
+            # one month's rows are read at a time, so that reading them can be timed apart from parsing them
+            with TimedStage('fetch strings'):
+                month_rows = [row[2:] for row in month_rows]
+
+            masks, updates = get_masks_from_rows(month_rows, month, year)
+
+            save_parsed_masks(updates, connection)
+
+            yield (month, year), masks
+
+    finally:
+        rows.close()
+
+
+## calculate the cost of all papers for every month from the start month to the end month, both inclusive
+ # the cost and delivery data is loaded once, and the undelivered strings of all the months are fetched with one query
+ # results are yielded one month at a time as (month, year, costs, total, undelivered dates), so a long range does not have to be held in memory
+ # closing the generator (or finishing it) closes the cursor the strings are read from. callers that may stop early should close it, for example with contextlib.closing
+def calculate_cost_for_range(start: date_type, end: date_type, connection: Connection | None = None) -> Iterator[tuple[int, int, dict[int, float], float, dict[int, Set[date_type]]]]:
+    _, cost_and_delivery_data = get_warm_papers(connection)
+
+    connection = get_connection(connection)
+
+    if cost_and_delivery_data is None:
+        cost_and_delivery_data = get_cost_and_delivery_data_of_all_papers(connection)
+
+    undelivered_masks_per_month = iterate_undelivered_masks(start, end, connection)
+
+    try:
+        next_month_with_masks = next(undelivered_masks_per_month, None)
+
+        for month, year in get_months_in_range(start, end):
+            undelivered_masks: dict[int, int] = {}
+
+            # the masks come in month order, so they're only used when the loop reaches their month
+            if next_month_with_masks and next_month_with_masks[0] == (month, year):
+                undelivered_masks = next_month_with_masks[1]
+                next_month_with_masks = next(undelivered_masks_per_month, None)
+
+            costs, total, undelivered_dates = calculate_cost_of_all_papers_from_masks(
+                undelivered_masks,
+                month,
+                year,
+                connection,
+                cost_and_delivery_data
+            )
+
+            count_calculation(costs)
+
+            yield month, year, costs, total, undelivered_dates
+
+    finally:
+        undelivered_masks_per_month.close()
+
+
+## save the results of undelivered dates to the DB
+ # save the dates any paper was not delivered, as a day mask, with the time they were saved (as an epoch timestamp)
+ # there is one log entry for each paper and month, which is replaced whenever the month is saved again
+def save_results(undelivered_dates: dict[int, Set[date_type]], month: int, year: int, connection: Connection | None = None) -> None:
+    TIMESTAMP = int(datetime.now().timestamp())
+
+    with TimedStage('save results'), get_connection(connection) as connection:
+        connection.executemany(
+            "INSERT INTO undelivered_dates (timestamp, month, year, paper_id, mask) VALUES (?, ?, ?, ?, ?) ON CONFLICT (paper_id, year, month) DO UPDATE SET timestamp = excluded.timestamp, mask = excluded.mask;",
+            (
                 (
                     TIMESTAMP,
                     month,
                     year,
                     paper_id,
-                    ','.join([
-                        undelivered_date_instance.strftime(r'%d')
-                        for undelivered_date_instance in undelivered_date_instances
-                    ])
+
+                    # dates that came from a day mask already have it
+                    undelivered_date_instances.mask if isinstance(undelivered_date_instances, UndeliveredDates) else sum(
+                        1 << (undelivered_date_instance.day - 1)
+                        for undelivered_date_instance in set(undelivered_date_instances)
+                    )
                 )
+                for paper_id, undelivered_date_instances in undelivered_dates.items()
             )
+        )
 
 
 ## format the output of calculating the cost of all papers
-def format_output(costs: dict[int, float], total: float, month: int, year: int) -> str:
-    papers = {
-        paper_id: name
-        for paper_id, name in query_database(
-            generate_sql_query('papers')
-        )
-    }
+def format_output(costs: dict[int, float], total: float, month: int, year: int, connection: Connection | None = None) -> str:
+    with TimedStage('format'):
+        papers = {
+            paper_id: name
+            for paper_id, name in query_database(
+                *generate_parameterized_query('papers'),
+                connection=connection
+            )
+        }
+
+        format_string = f"For {date_type(year=year, month=month, day=1).strftime(r'%B %Y')}\n\n"
+        format_string += f"**TOTAL**: {total}\n"
+
+        format_string += '\n'.join([
+            f"{papers[paper_id]}: {cost}"  # type: ignore
+            for paper_id, cost in costs.items()
+        ])
+
+        return f"{format_string}\n"
+
+
+## check if a DB file is one of npbc's, without changing it
+ # it is opened read-only (every connection from open_connection would switch it to WAL), and must have a papers table
+ # its version must be one this code knows. a DB from before versions were stored is version 0, and is migrated like any old one
+ # a file that isn't a SQLite DB at all isn't one either
+def is_npbc_database(database_path: Path) -> bool:
+    try:
+        connection = connect(f"{database_path.resolve().as_uri()}?mode=ro", uri=True)
+
+        try:
+            has_papers = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'papers';").fetchone() is not None
+            version = connection.execute("PRAGMA user_version;").fetchone()[0]
+
+        finally:
+            connection.close()
+
+    except DatabaseError:
+        return False
 
+    return has_papers and version <= SCHEMA_VERSION
 
-    format_string = f"For {date_type(year=year, month=month, day=1).strftime(r'%B %Y')}\n\n"
-    format_string += f"**TOTAL**: {total}\n"
 
-    format_string += '\n'.join([
-        f"{papers[paper_id]}: {cost}"  # type: ignore
-        for paper_id, cost in costs.items()
-    ])
+## calculate the bills of one month from a DB of its own (for example, one household's DB), and format them
+ # this is made to run in a separate process, so it opens (and closes) its own connection instead of using the shared ones
+ # the results are logged to the same DB, unless told not to
+ # returns (total, formatted output, seconds taken)
+def calculate_database(database_path: Path, month: int, year: int, log: bool = True) -> tuple[float, str, float]:
+    start = perf_counter()
+    connection = open_connection(database_path)
 
-    return f"{format_string}\n"
+    try:
+        setup_and_connect_DB(connection)
+
+        costs, total, undelivered_dates = calculate_cost_of_all_papers(None, month, year, connection)
+
+        if log:
+            save_results(undelivered_dates, month, year, connection)
+
+        formatted = format_output(costs, total, month, year, connection)
+
+    finally:
+        connection.close()
+
+    return total, formatted, perf_counter() - start
 
 
 ## add a new paper
  # do not allow if the paper already exists
-def add_new_paper(name: str, days_delivered: list[bool], days_cost: list[float]) -> tuple[bool, str]:
-    with connect(DATABASE_PATH) as connection:
+def add_new_paper(name: str, days_delivered: list[bool], days_cost: list[float], connection: Connection | None = None) -> tuple[bool, str]:
+    with get_connection(connection) as connection:
 
         # get the names of all papers that already exist
         paper = connection.execute(
-            generate_sql_query('papers', columns=['name'], conditions={'name': f"\"{name}\""})
+            *generate_parameterized_query('papers', columns=['name'], conditions={'name': name})
         ).fetchall()
 
         # if the proposed paper already exists, return an error message
         if paper:
             return False, "Paper already exists. Please try editing the paper instead."
         
-        # otherwise, add the paper name to the database
-        connection.execute(
+        # otherwise, add the paper name to the database, and get the ID of the paper that was just added
+        paper_id = connection.execute(
             "INSERT INTO papers (name) VALUES (?);",
             (name, )
+        ).lastrowid
+
+        # add the cost and delivery data for the paper
+        days = list(enumerate(zip(days_cost, days_delivered)))
+
+        connection.executemany(
+            "INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (?, ?, ?);",
+            [(paper_id, day_id, cost) for day_id, (cost, _) in days]
         )
+        connection.executemany(
+            "INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (?, ?, ?);",
+            [(paper_id, day_id, delivered) for day_id, (_, delivered) in days]
+        )
+        
+        connection.commit()
 
-        # get the ID of the paper that was just added
-        paper_id = connection.execute(
-            "SELECT paper_id FROM papers WHERE name = ?;",
-            (name, )
-        ).fetchone()[0]
+        return True, f"Paper {name} added."
 
-        # add the cost and delivery data for the paper
-        for day_id, (cost, delivered) in enumerate(zip(days_cost, days_delivered)):
-            connection.execute(
+    return False, "Something went wrong."
+
+
+## add many new papers at once, such as those read from a file
+ # papers are (name, days delivered, days cost), and are added one at a time as they are read, in one transaction
+ # the cost and delivery data of all the papers is written with one statement for each table at the end
+ # nothing is added if any paper already exists (or appears twice), or if reading the papers fails
+def add_new_papers(papers: Iterable[tuple[str, list[bool], list[float]]], connection: Connection | None = None) -> tuple[bool, str]:
+    costs: list[tuple[int, int, float]] = []
+    deliveries: list[tuple[int, int, bool]] = []
+    number_of_papers = 0
+
+    connection = get_connection(connection)
+
+    try:
+        with connection:
+            for name, days_delivered, days_cost in papers:
+
+                # the name is unique, so adding a paper that already exists fails
+                try:
+                    paper_id = connection.execute(
+                        "INSERT INTO papers (name) VALUES (?);",
+                        (name, )
+                    ).lastrowid
+
+                except IntegrityError:
+                    raise ValueError(f"Paper {name} already exists. Please try editing the paper instead.")
+
+                costs.extend((paper_id, day_id, cost) for day_id, cost in enumerate(days_cost)) # type: ignore
+                deliveries.extend((paper_id, day_id, delivered) for day_id, delivered in enumerate(days_delivered)) # type: ignore
+                number_of_papers += 1
+
+            connection.executemany(
                 "INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (?, ?, ?);",
-                (paper_id, day_id, cost)
+                costs
             )
-            connection.execute(
+            connection.executemany(
                 "INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (?, ?, ?);",
-                (paper_id, day_id, delivered)
+                deliveries
             )
-        
-        connection.commit()
 
-        return True, f"Paper {name} added."
+    # leaving the "with" block with an error rolls the whole import back
+    except ValueError as error:
+        return False, str(error)
+
+    return True, f"{number_of_papers} papers added."
+
+
+## convert a paper read from a file to (name, days delivered, days cost)
+ # the paper must have a "name", "days" like "YYNNYYN" (Monday first), and seven "costs" separated by semicolons (Monday first, including days it is not delivered)
+def get_paper_entry(entry: dict, line_number: int) -> tuple[str, list[bool], list[float]]:
+    try:
+        name = str(entry['name']).strip()
+        days = str(entry['days']).upper().strip()
+        costs = [float(cost) for cost in SPLIT_REGEX['semicolon'].split(str(entry['costs']).strip().rstrip(';'))]
+
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Invalid paper on line {line_number}.")
+
+    if not name or not VALIDATE_REGEX['delivery'].match(days) or len(costs) != len(WEEKDAY_NAMES):
+        raise ValueError(f"Invalid paper on line {line_number}.")
+
+    return name, [day == 'Y' for day in days], costs
+
+
+## read papers from the lines of a CSV file, one at a time
+ # the first row must be a header, with the columns "name", "days" and "costs". any other columns (like "paper_id") are ignored
+def read_papers_from_csv(lines: Iterable[str]) -> Iterator[tuple[str, list[bool], list[float]]]:
+    reader = DictReader(lines)
+
+    for row in reader:
+        yield get_paper_entry(row, reader.line_num)
+
+
+## read papers from the lines of a JSON lines file, one at a time
+ # each line must be an object with the keys "name", "days" and "costs". blank lines are skipped
+def read_papers_from_jsonl(lines: Iterable[str]) -> Iterator[tuple[str, list[bool], list[float]]]:
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                entry = loads(line)
+
+            except JSONDecodeError:
+                raise ValueError(f"Invalid JSON on line {line_number}.")
+
+            if not isinstance(entry, dict):
+                raise ValueError(f"Invalid paper on line {line_number}.")
+
+            yield get_paper_entry(entry, line_number)
 
-    return False, "Something went wrong."
+
+## columns of papers that get_papers can fetch
+ # days are seven 'Y's and 'N's, and costs are seven costs separated by semicolons, starting with Monday (the format read by get_paper_entry)
+PAPER_COLUMNS = ['paper_id', 'name', 'days', 'costs']
+
+
+## get papers from the DB with one query, as tuples of the given columns (all of PAPER_COLUMNS, if none are given), in order of paper_id
+ # the days of each paper are concatenated into one value with GROUP_CONCAT, in a subquery for each paper that looks them up in the unique (paper_id, day_id) index
+ # SQLite doesn't promise the order an aggregate sees its rows in, so each one concatenates a subquery ordered by day_id (which is never flattened into an aggregate, so its order is kept)
+ # papers are read in order of paper_id, and each one is finished as it is read, so nothing is sorted or grouped
+ # costs are written by SQLite, which writes any cost with up to 15 significant digits the same way Python does
+ # the rows are read from the cursor as they are needed, so the papers don't have to fit in memory
+ # raises ValueError for a column that isn't in PAPER_COLUMNS
+def get_papers(columns: list[str] | None = None, connection: Connection | None = None) -> Iterator[tuple]:
+    if columns is None:
+        columns = PAPER_COLUMNS
+
+    fields = {
+        'paper_id': "papers.paper_id",
+        'name': "papers.name",
+        'days': "(SELECT group_concat(day, '') FROM (SELECT CASE WHEN delivered THEN 'Y' ELSE 'N' END AS day FROM papers_days_delivered WHERE papers_days_delivered.paper_id = papers.paper_id ORDER BY day_id))",
+        'costs': "(SELECT group_concat(cost, ';') FROM (SELECT cost FROM papers_days_cost WHERE papers_days_cost.paper_id = papers.paper_id ORDER BY day_id))"
+    }
+
+    for column in columns:
+        if column not in fields:
+            raise ValueError(f"Unknown column of papers: {column}.")
+
+    return get_connection(connection).execute(
+        f"SELECT {', '.join(fields[column] for column in columns)} FROM papers ORDER BY papers.paper_id;"
+    )
+
+
+## get every paper from the DB, one at a time, as (paper_id, name, days, costs), in the format read by get_paper_entry
+ # the rows are read from the cursor as they are needed, so the papers don't have to fit in memory
+def iterate_papers(connection: Connection | None = None) -> Iterator[tuple[int, str, str, str]]:
+    return get_papers(PAPER_COLUMNS, connection)
 
 
 ## edit an existing paper
  # do not allow if the paper does not exist
-def edit_existing_paper(paper_id: int, name: str | None = None, days_delivered: list[bool] | None = None, days_cost: list[float] | None = None) -> tuple[bool, str]:
-    with connect(DATABASE_PATH) as connection:
+def edit_existing_paper(paper_id: int, name: str | None = None, days_delivered: list[bool] | None = None, days_cost: list[float] | None = None, connection: Connection | None = None) -> tuple[bool, str]:
+    with get_connection(connection) as connection:
 
         # get the IDs of all papers that already exist
         paper = connection.execute(
-            generate_sql_query('papers', columns=['paper_id'], conditions={'paper_id': paper_id})
+            *generate_parameterized_query('papers', columns=['paper_id'], conditions={'paper_id': paper_id})
         ).fetchone()
 
         # if the proposed paper does not exist, return an error message
@@ -443,12 +1918,12 @@ def edit_existing_paper(paper_id: int, name: str | None = None, days_delivered:
 
 ## delete an existing paper
  # do not allow if the paper does not exist
-def delete_existing_paper(paper_id: int) -> tuple[bool, str]:
-    with connect(DATABASE_PATH) as connection:
+def delete_existing_paper(paper_id: int, connection: Connection | None = None) -> tuple[bool, str]:
+    with get_connection(connection) as connection:
 
         # get the IDs of all papers that already exist
         paper = connection.execute(
-            generate_sql_query('papers', columns=['paper_id'], conditions={'paper_id': paper_id})
+            *generate_parameterized_query('papers', columns=['paper_id'], conditions={'paper_id': paper_id})
         ).fetchone()
 
         # if the proposed paper does not exist, return an error message
@@ -481,17 +1956,17 @@ def delete_existing_paper(paper_id: int) -> tuple[bool, str]:
 
 
 ## record strings for date(s) paper(s) were not delivered
-def add_undelivered_string(paper_id: int, undelivered_string: str, month: int, year: int) -> tuple[bool, str]:
+def add_undelivered_string(paper_id: int, undelivered_string: str, month: int, year: int, connection: Connection | None = None) -> tuple[bool, str]:
     
     # if the string is not valid, return an error message
     if not validate_undelivered_string(undelivered_string):
         return False, f"Invalid undelivered string."
     
-    with connect(DATABASE_PATH) as connection:
+    with get_connection(connection) as connection:
 
         # check if a string with the same month and year, for the same paper, already exists
-        (existing_string, ) = connection.execute(
-            generate_sql_query(
+        existing_string = connection.execute(
+            *generate_parameterized_query(
                 'undelivered_strings',
                 columns=['string'],
                 conditions={
@@ -503,19 +1978,20 @@ def add_undelivered_string(paper_id: int, undelivered_string: str, month: int, y
         ).fetchone()
 
         # if a string with the same month and year, for the same paper, already exists, concatenate the new string to it
+        # the day mask of the string is stored with it, so that it doesn't need to be parsed again when calculating
         if existing_string:
             new_string = f"{existing_string[0]},{undelivered_string}"
 
             connection.execute(
-                "UPDATE undelivered_strings SET string = ? WHERE paper_id = ? AND month = ? AND year = ?;",
-                (new_string, paper_id, month, year)
+                "UPDATE undelivered_strings SET string = ?, mask = ?, parser_version = ? WHERE paper_id = ? AND month = ? AND year = ?;",
+                (new_string, parse_undelivered_string_to_mask(new_string, month, year), PARSER_VERSION, paper_id, month, year)
             )
 
         # otherwise, add the new string to the database
         else:
             connection.execute(
-                "INSERT INTO undelivered_strings (string, paper_id, month, year) VALUES (?, ?, ?, ?);",
-                (undelivered_string, paper_id, month, year)
+                "INSERT INTO undelivered_strings (string, paper_id, month, year, mask, parser_version) VALUES (?, ?, ?, ?, ?, ?);",
+                (undelivered_string, paper_id, month, year, parse_undelivered_string_to_mask(undelivered_string, month, year), PARSER_VERSION)
             )
 
         connection.commit()
@@ -525,12 +2001,12 @@ def add_undelivered_string(paper_id: int, undelivered_string: str, month: int, y
 
 ## delete an existing undelivered string
  # do not allow if the string does not exist
-def delete_undelivered_string(paper_id: int, month: int, year: int) -> tuple[bool, str]:
-    with connect(DATABASE_PATH) as connection:
+def delete_undelivered_string(paper_id: int, month: int, year: int, connection: Connection | None = None) -> tuple[bool, str]:
+    with get_connection(connection) as connection:
     
         # check if a string with the same month and year, for the same paper, exists
-        (existing_string, ) = connection.execute(
-            generate_sql_query(
+        existing_string = connection.execute(
+            *generate_parameterized_query(
                 'undelivered_strings',
                 columns=['string'],
                 conditions={
@@ -558,13 +2034,120 @@ def delete_undelivered_string(paper_id: int, month: int, year: int) -> tuple[boo
     return False, "Something went wrong."
 
 
+## record many undelivered strings at once, such as those read from a file
+ # entries are (paper_id, undelivered string, month, year), and are validated one at a time as they are read
+ # entries for the same paper and month are merged in memory, and existing strings are extended like add_undelivered_string does
+ # everything is written in one transaction, and nothing is written if any entry is invalid
+def add_undelivered_strings(entries: Iterable[tuple[int, str, int, int]], connection: Connection | None = None) -> tuple[bool, str]:
+    merged_strings: dict[tuple[int, int, int], list[str]] = {}
+    number_of_entries = 0
+
+    try:
+        for paper_id, undelivered_string, month, year in entries:
+            number_of_entries += 1
+
+            # if the entry is not valid, return an error message
+            if (month is None) or (year is None) or not validate_month_and_year(month, year)[0]:
+                return False, f"Invalid month and/or year in entry {number_of_entries}."
+
+            if not validate_undelivered_string(undelivered_string):
+                return False, f"Invalid undelivered string in entry {number_of_entries}."
+
+            merged_strings.setdefault((paper_id, month, year), []).append(undelivered_string)
+
+    # the entries may come from a file, which could have errors of its own
+    except ValueError as error:
+        return False, str(error)
+
+    with get_connection(connection) as connection:
+
+        # get the first existing string for each paper, for each month with new entries
+        existing_strings: dict[tuple[int, int, int], str] = {}
+
+        for month, year in {(month, year) for _, month, year in merged_strings}:
+            for paper_id, existing_string in connection.execute(
+                "SELECT paper_id, string FROM undelivered_strings WHERE year = ? AND month = ? ORDER BY entry_id;",
+                (year, month)
+            ):
+                existing_strings.setdefault((paper_id, month, year), existing_string)
+
+        updates: list[tuple[str, int, int, int, int, int]] = []
+        inserts: list[tuple[str, int, int, int, int, int]] = []
+
+        # the day mask of each string is stored with it, so that it doesn't need to be parsed again when calculating
+        for (paper_id, month, year), undelivered_strings in merged_strings.items():
+            new_string = ','.join(undelivered_strings)
+
+            if (paper_id, month, year) in existing_strings:
+                new_string = f"{existing_strings[(paper_id, month, year)]},{new_string}"
+                updates.append((new_string, parse_undelivered_string_to_mask(new_string, month, year), PARSER_VERSION, paper_id, month, year))
+
+            else:
+                inserts.append((new_string, paper_id, month, year, parse_undelivered_string_to_mask(new_string, month, year), PARSER_VERSION))
+
+        connection.executemany(
+            "UPDATE undelivered_strings SET string = ?, mask = ?, parser_version = ? WHERE paper_id = ? AND month = ? AND year = ?;",
+            updates
+        )
+
+        connection.executemany(
+            "INSERT INTO undelivered_strings (string, paper_id, month, year, mask, parser_version) VALUES (?, ?, ?, ?, ?, ?);",
+            inserts
+        )
+
+        connection.commit()
+
+    return True, f"{number_of_entries} undelivered strings added."
+
+
+## convert an undelivered entry read from a file to (paper_id, undelivered string, month, year)
+ # the entry must have a "key" and an "undelivered" string, and may have a "month" and a "year" (None if missing or blank)
+def get_undelivered_entry(entry: dict, line_number: int) -> tuple[int, str, int | None, int | None]:
+    try:
+        return (
+            int(entry['key']),
+            str(entry['undelivered']).lower().strip(),
+            int(entry['month']) if entry.get('month') not in (None, '') else None,
+            int(entry['year']) if entry.get('year') not in (None, '') else None
+        )
+
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Invalid entry on line {line_number}.")
+
+
+## read undelivered entries from the lines of a CSV file, one at a time
+ # the first row must be a header, with the columns "key" and "undelivered", and optionally "month" and "year"
+def read_undelivered_entries_from_csv(lines: Iterable[str]) -> Iterator[tuple[int, str, int | None, int | None]]:
+    reader = DictReader(lines)
+
+    for row in reader:
+        yield get_undelivered_entry(row, reader.line_num)
+
+
+## read undelivered entries from the lines of a JSON lines file, one at a time
+ # each line must be an object with the keys "key" and "undelivered", and optionally "month" and "year". blank lines are skipped
+def read_undelivered_entries_from_jsonl(lines: Iterable[str]) -> Iterator[tuple[int, str, int | None, int | None]]:
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                entry = loads(line)
+
+            except JSONDecodeError:
+                raise ValueError(f"Invalid JSON on line {line_number}.")
+
+            if not isinstance(entry, dict):
+                raise ValueError(f"Invalid entry on line {line_number}.")
+
+            yield get_undelivered_entry(entry, line_number)
+
+
 ## get the previous month, by looking at 1 day before the first day of the current month (duh)
 def get_previous_month() -> date_type:
     return (datetime.today().replace(day=1) - timedelta(days=1)).replace(day=1)
 
 
 ## extract delivery days and costs from user input
-def extract_days_and_costs(days_delivered: str | None, prices: str | None, paper_id: int | None = None) -> tuple[list[bool], list[float]]:
+def extract_days_and_costs(days_delivered: str | None, prices: str | None, paper_id: int | None = None, connection: Connection | None = None) -> tuple[list[bool], list[float]]:
     days = []
     costs = []
 
@@ -580,13 +2163,14 @@ def extract_days_and_costs(days_delivered: str | None, prices: str | None, paper
             days = [
                 (int(day_id), bool(delivered))
                 for day_id, delivered in query_database(
-                    generate_sql_query(
+                    *generate_parameterized_query(
                         'papers_days_delivered',
                         columns=['day_id', 'delivered'],
                         conditions={
                             'paper_id': paper_id
                         }
-                    )
+                    ),
+                    connection=connection
                 )
             ]
 
@@ -615,7 +2199,7 @@ def extract_days_and_costs(days_delivered: str | None, prices: str | None, paper
 
 ## validate month and year
 def validate_month_and_year(month: int | None = None, year: int | None = None) -> tuple[bool, str]:
-    if ((month is None) or (isinstance(month, int) and (0 < month) and (month <= 12))) and ((year is None) or (isinstance(year, int) and (year >= 0))):
+    if ((month is None) or (isinstance(month, int) and (0 < month) and (month <= 12))) and ((year is None) or (isinstance(year, int) and (0 < year) and (year <= 9999))):
         return True, ""
     
     return False, "Invalid month and/or year."
\ No newline at end of file
@@ -0,0 +1,180 @@
+from json import dumps, loads
+from os import getcwd
+from os.path import expanduser
+
+## path of the socket the daemon listens on
+ # it is in the same folder as the DB (see npbc_core.DATABASE_DIR), but is defined here so that sending a command doesn't need to import npbc_core
+ # sending a command is on the path of every CLI call, so only what it needs is imported here (not even pathlib). the rest is imported by the daemon when it starts
+SOCKET_PATH = expanduser('~/.npbc/npbc.sock')
+
+
+## run one command sent to the daemon, and get the reply to send back
+ # a request is JSON with the arguments and working directory of the CLI that sent it
+ # the reply is JSON with what the command printed, and the traceback if it failed
+ # requests are handled one at a time, so changing the working directory and capturing the standard output can't affect another command
+ # the time the command took is recorded in the metrics, if they are on (see npbc_core.enable_metrics)
+def run_request(request: bytes) -> bytes:
+    from contextlib import redirect_stdout
+    from io import StringIO
+    from os import chdir
+    from time import perf_counter
+    from traceback import format_exc
+
+    import npbc_core
+    from npbc_cli import define_and_read_args
+
+    request = loads(request)
+    output = StringIO()
+    error = None
+    command = None
+    start = perf_counter()
+
+    try:
+        chdir(request['cwd'])
+
+        with redirect_stdout(output):
+            args = define_and_read_args(request['argv'])
+            command = args.func.__name__.replace('_', '-')
+            args.func(args)
+
+    # the CLI that sent the command has already checked its arguments, so this is a bug in the command, not a mistake of the user's
+    except BaseException:
+        error = format_exc()
+
+    if command is not None:
+        npbc_core.METRICS.observe('npbc_command_seconds', perf_counter() - start, command=command)
+
+    return dumps({'output': output.getvalue(), 'error': error}).encode()
+
+
+## get the user ID of the process on the other end of a Unix socket connection, or None if the platform can't tell
+ # SO_PEERCRED (Linux) gives the pid, uid and gid of the peer, as three C ints
+def get_peer_uid(connection) -> int | None:
+    from socket import SOL_SOCKET
+    from struct import calcsize, unpack
+
+    try:
+        from socket import SO_PEERCRED
+
+    except ImportError:
+        return None
+
+    _, uid, _ = unpack('3i', connection.getsockopt(SOL_SOCKET, SO_PEERCRED, calcsize('3i')))
+
+    return uid
+
+
+## create the server of the daemon, listening on the socket
+ # commands run with the permissions of the user that started the daemon, so only that user may send them
+ # the socket is made with no permissions for anyone else (in a folder that is only theirs, if it has to be made), and connections from any other user are closed without running anything
+ # a socket left behind by a daemon that has stopped is replaced, but a running daemon is not
+ # if a metrics path is given, the metrics are written to it after every command (see npbc_core.MetricsRegistry.write)
+ # raises ValueError if the daemon can't run
+def create_server(socket_path: str = SOCKET_PATH, metrics_path: str | None = None):
+    from os import chmod, getuid, makedirs, umask, unlink
+    from os.path import dirname, exists
+    from socketserver import StreamRequestHandler
+
+    # Unix sockets aren't available on every platform
+    try:
+        from socketserver import UnixStreamServer
+
+    except ImportError:
+        raise ValueError("The daemon is not supported on this platform.")
+
+    class CommandServer(UnixStreamServer):
+        def verify_request(self, request, client_address) -> bool:
+            return get_peer_uid(request) in (None, getuid())
+
+    class CommandHandler(StreamRequestHandler):
+        def handle(self) -> None:
+            request = self.rfile.readline()
+
+            # a connection that sends nothing is only checking whether the daemon is running
+            if request:
+                self.wfile.write(run_request(request))
+
+                if metrics_path is not None:
+                    import npbc_core
+
+                    npbc_core.METRICS.write(metrics_path)  # type: ignore
+
+    if exists(socket_path):
+        if run_in_daemon([], socket_path) is not None:
+            raise ValueError(f"The daemon is already running on {socket_path}.")
+
+        unlink(socket_path)
+
+    makedirs(dirname(socket_path) or '.', mode=0o700, exist_ok=True)
+
+    # the socket is created by binding it, so the umask keeps it private from the start, before it is set to owner only
+    previous_umask = umask(0o077)
+
+    try:
+        server = CommandServer(socket_path, CommandHandler)
+
+    finally:
+        umask(previous_umask)
+
+    chmod(socket_path, 0o600)
+
+    return server
+
+
+## listen for commands on the socket, and run them with the DB connection, compiled regexes, page cache and paper data kept warm between them
+ # the paper data is only loaded again when the papers change (see npbc_core.keep_papers_warm)
+ # if a metrics path is given, metrics are recorded, and written to it after every command
+def serve(socket_path: str = SOCKET_PATH, metrics_path: str | None = None) -> tuple[bool, str]:
+    from os import unlink
+
+    import npbc_core
+
+    npbc_core.setup_and_connect_DB()
+    npbc_core.keep_papers_warm()
+
+    # the metrics may already be on (see npbc_cli.run_command), in which case they are kept
+    if metrics_path is not None and not npbc_core.METRICS.enabled:
+        npbc_core.enable_metrics()
+
+    try:
+        server = create_server(socket_path, metrics_path)
+
+    except ValueError as error:
+        return False, str(error)
+
+    with server:
+        try:
+            server.serve_forever()
+
+        # the daemon runs until it is interrupted
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            unlink(socket_path)
+
+    return True, "Daemon stopped."
+
+
+## send a command to the daemon, and get its reply as (output, traceback or None)
+ # returns None if the daemon isn't running (or Unix sockets aren't supported), or doesn't answer (it only answers the user that started it), so that the command can be run in this process instead
+def run_in_daemon(arguments: list[str], socket_path: str = SOCKET_PATH) -> tuple[str, str | None] | None:
+    try:
+        from socket import AF_UNIX, SOCK_STREAM, socket
+
+        with socket(AF_UNIX, SOCK_STREAM) as client:
+            client.connect(socket_path)
+
+            # sending nothing only checks whether the daemon is running
+            if not arguments:
+                return '', None
+
+            client.sendall(f"{dumps({'argv': arguments, 'cwd': getcwd()})}\n".encode())
+
+            with client.makefile('rb') as reply:
+                response = loads(reply.read())
+
+    except (ImportError, OSError, ValueError):
+        return None
+
+    return response['output'], response['error']
@@ -0,0 +1,141 @@
+from collections.abc import Set
+from datetime import date as date_type
+from sqlite3 import Connection
+
+from numpy import array, int64, ndarray, where, zeros
+
+from npbc_core import (WEEKDAY_NAMES, UndeliveredDates,
+                       get_cost_and_delivery_data_of_all_papers,
+                       get_number_of_days_per_week, parse_undelivered_string)
+
+## number of weekdays, which is the width of every matrix used here
+NUMBER_OF_WEEKDAYS = len(WEEKDAY_NAMES)
+
+
+## convert the cost and delivery data of many papers (as returned by get_cost_and_delivery_data_of_all_papers) to matrices
+ # the cost matrix is papers×7 floats, and the delivery mask is papers×7 booleans
+ # rows are in the same order as the returned list of paper IDs. any day missing from the data is not delivered and costs nothing
+def build_cost_and_delivery_matrices(cost_and_delivery_data: dict[int, tuple[dict[int, float], dict[int, bool]]]) -> tuple[list[int], ndarray, ndarray]:
+    paper_ids = list(cost_and_delivery_data)
+
+    cost_matrix = zeros((len(paper_ids), NUMBER_OF_WEEKDAYS), dtype=float)
+    delivery_mask = zeros((len(paper_ids), NUMBER_OF_WEEKDAYS), dtype=bool)
+
+    for paper_index, paper_id in enumerate(paper_ids):
+        cost_data, delivery_data = cost_and_delivery_data[paper_id]
+
+        for day_id, cost in cost_data.items():
+            cost_matrix[paper_index, day_id] = cost
+
+        for day_id, delivered in delivery_data.items():
+            delivery_mask[paper_index, day_id] = bool(delivered)
+
+    return paper_ids, cost_matrix, delivery_mask
+
+
+## generate a months×7 matrix of the number of times each weekday occurs in each of the given months
+ # months are given as (month, year) tuples
+def get_days_per_week_matrix(months: list[tuple[int, int]]) -> ndarray:
+    return array(
+        [
+            get_number_of_days_per_week(month, year)
+            for month, year in months
+        ],
+        dtype=int64
+    ).reshape((len(months), NUMBER_OF_WEEKDAYS))
+
+
+## count the undelivered dates of each paper, for each weekday, for each month
+ # there must be one dictionary of {paper_id: undelivered dates} for each month, in the same order as the months
+ # the result is a months×papers×7 matrix, with papers in the order of paper_ids. papers that aren't in paper_ids are ignored
+def build_undelivered_counts(undelivered_dates_per_month: list[dict[int, Set[date_type]]], paper_ids: list[int]) -> ndarray:
+    paper_indices = {
+        paper_id: paper_index
+        for paper_index, paper_id in enumerate(paper_ids)
+    }
+
+    undelivered_counts = zeros((len(undelivered_dates_per_month), len(paper_ids), NUMBER_OF_WEEKDAYS), dtype=int64)
+
+    for month_index, undelivered_dates in enumerate(undelivered_dates_per_month):
+        for paper_id, dates in undelivered_dates.items():
+            if paper_id in paper_indices:
+
+                # dates stored as a mask are counted without creating any dates
+                if isinstance(dates, UndeliveredDates):
+                    undelivered_counts[month_index, paper_indices[paper_id]] = dates.count_per_weekday()
+
+                else:
+                    for date in dates:
+                        undelivered_counts[month_index, paper_indices[paper_id], date.weekday()] += 1
+
+    return undelivered_counts
+
+
+## calculate the bill of every paper for every month at once
+ # cost_matrix and delivery_mask are papers×7, days_per_week is months×7, and undelivered_counts is months×papers×7 (no undelivered dates if not given)
+ # the result is a months×papers matrix of costs
+ # the weekdays are added up one at a time, in order, so the floating point results are exactly those of calculate_cost_of_one_paper
+def calculate_bills(cost_matrix: ndarray, delivery_mask: ndarray, days_per_week: ndarray, undelivered_counts: ndarray | None = None) -> ndarray:
+    number_of_months = days_per_week.shape[0]
+    number_of_papers = cost_matrix.shape[0]
+
+    # the number of each weekday the paper was delivered, which is zero for days it is not supposed to be delivered (months×papers×7)
+    number_of_days_delivered = days_per_week[:, None, :].repeat(number_of_papers, axis=1)
+
+    if undelivered_counts is not None:
+        number_of_days_delivered = number_of_days_delivered - undelivered_counts
+
+    number_of_days_delivered = where(delivery_mask[None, :, :], number_of_days_delivered, 0)
+
+    # the cost of each weekday for each paper and month (months×papers×7)
+    daily_costs = cost_matrix[None, :, :] * number_of_days_delivered
+
+    bills = zeros((number_of_months, number_of_papers), dtype=float)
+
+    for day_id in range(NUMBER_OF_WEEKDAYS):
+        bills += daily_costs[:, :, day_id]
+
+    return bills
+
+
+## calculate the cost of all papers for many months in one go
+ # months are given as (month, year) tuples, and undelivered strings as {(month, year): {paper_id: string}}
+ # the paper data is loaded from the DB once for all the months
+ # the results are in the same format as calculate_cost_of_all_papers, one tuple per month, in the order of the months
+def calculate_cost_of_all_papers_for_months(months: list[tuple[int, int]], undelivered_strings: dict[tuple[int, int], dict[int, str]], connection: Connection | None = None) -> list[tuple[dict[int, float], float, dict[int, Set[date_type]]]]:
+    paper_ids, cost_matrix, delivery_mask = build_cost_and_delivery_matrices(
+        get_cost_and_delivery_data_of_all_papers(connection)
+    )
+
+    # parse the undelivered strings of each month, in the same way calculate_cost_of_all_papers does
+    undelivered_dates_per_month: list[dict[int, Set[date_type]]] = []
+
+    for month, year in months:
+        undelivered_dates: dict[int, Set[date_type]] = {
+            paper_id: UndeliveredDates(0, month, year)
+            for paper_id in paper_ids
+        }
+
+        for paper_id, undelivered_string in undelivered_strings.get((month, year), {}).items():
+            undelivered_dates[paper_id] = parse_undelivered_string(undelivered_string, month, year)
+
+        undelivered_dates_per_month.append(undelivered_dates)
+
+    bills = calculate_bills(
+        cost_matrix,
+        delivery_mask,
+        get_days_per_week_matrix(months),
+        build_undelivered_counts(undelivered_dates_per_month, paper_ids)
+    )
+
+    results = []
+
+    for month_index, undelivered_dates in enumerate(undelivered_dates_per_month):
+        costs = {
+            paper_id: float(cost)
+            for paper_id, cost in zip(paper_ids, bills[month_index])
+        }
+
+        results.append((costs, sum(costs.values()), undelivered_dates))
+
+    return results
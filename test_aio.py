@@ -0,0 +1,85 @@
+from asyncio import gather, run
+
+import npbc_core
+from npbc_aio import (add_new_paper, add_undelivered_string,
+                      calculate_cost_of_all_papers, query_database,
+                      save_results)
+from npbc_core import generate_parameterized_query
+
+
+def test_calculating_at_once(papers_database):
+    async def calculate_many():
+        return await gather(
+            *(calculate_cost_of_all_papers(None, 1, 2022) for _ in range(20)),
+            calculate_cost_of_all_papers(None, 2, 2022),
+            calculate_cost_of_all_papers({1: '1-5'}, 1, 2022)
+        )
+
+    results = run(calculate_many())
+
+    assert all(result == npbc_core.calculate_cost_of_all_papers(None, 1, 2022) for result in results[:20])
+    assert results[20][1] == npbc_core.calculate_cost_of_all_papers(None, 2, 2022)[1]
+    assert results[21][0][1] == 107
+
+
+def test_calculations_are_shared(papers_database, monkeypatch):
+    calls = []
+    calculate = npbc_core.calculate_cost_of_all_papers
+
+    def count_calls(*args, **kwargs):
+        calls.append(args)
+        return calculate(*args, **kwargs)
+
+    monkeypatch.setattr(npbc_core, 'calculate_cost_of_all_papers', count_calls)
+
+    async def calculate_many():
+        return await gather(*(calculate_cost_of_all_papers(None, 1, 2022) for _ in range(10)))
+
+    assert {result[1] for result in run(calculate_many())} == {167}
+    assert len(calls) == 1
+
+    # a calculation asked for after a write is not shared with one from before it
+    async def calculate_around_write():
+        return await gather(
+            calculate_cost_of_all_papers(None, 1, 2022),
+            add_undelivered_string(1, '1-5', 1, 2022),
+            calculate_cost_of_all_papers(None, 1, 2022)
+        )
+
+    _, _, after = run(calculate_around_write())
+
+    assert len(calls) == 3
+    assert after[0][1] == 107
+
+
+def test_adding_strings_in_batches(papers_database):
+    async def add_many():
+        return await gather(
+            *(add_undelivered_string(paper_id, f"{day}", 1, 2022) for day in range(1, 11) for paper_id in (1, 2)),
+            add_undelivered_string(1, 'nonsense', 1, 2022),
+            add_undelivered_string(1, '1', 13, 2022)
+        )
+
+    feedback = run(add_many())
+
+    assert feedback[:20] == [(True, "Undelivered string added.")] * 20
+    assert feedback[20:] == [(False, "Invalid undelivered string."), (False, "Invalid month and/or year.")]
+
+    # the strings are written in the order they were added
+    assert run(query_database(*generate_parameterized_query('undelivered_strings', columns=['paper_id', 'string']))) == [
+        (1, '1,2,3,4,5,6,7,8,9,10'),
+        (2, '1,2,3,4,5,6,7,8,9,10')
+    ]
+
+
+def test_adding_papers_and_saving_results(database):
+    assert run(add_new_paper('paper1', [True] * 7, [1] * 7)) == (True, "Paper paper1 added.")
+    assert run(add_new_paper('paper1', [True] * 7, [1] * 7))[0] is False
+
+    async def calculate_and_save():
+        costs, total, undelivered_dates = await calculate_cost_of_all_papers({1: '1-3'}, 1, 2022)
+        await save_results(undelivered_dates, 1, 2022)
+        return total
+
+    assert run(calculate_and_save()) == 28
+    assert npbc_core.query_database("SELECT paper_id, mask FROM undelivered_dates;") == [(1, 0b111)]
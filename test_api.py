@@ -0,0 +1,182 @@
+from datetime import date as date_type
+
+from pytest import fixture
+
+import npbc_api
+import npbc_core
+from npbc_api import WarmPapers, app
+from npbc_core import (edit_existing_paper, enable_metrics, get_papers_version,
+                       save_results, start_sql_trace, stop_sql_trace)
+
+
+## a test client for the API, with nothing kept in memory from other tests
+@fixture
+def client(papers_database, monkeypatch):
+    monkeypatch.setattr(npbc_api, 'WARM_PAPERS', WarmPapers())
+
+    return app.test_client()
+
+
+def test_calculate(client):
+    response = client.get('/calculate?month=1&year=2022')
+
+    assert response.status_code == 200
+    assert response.json['total'] == 167
+    assert [paper['cost'] for paper in response.json['papers']] == [126, 41, 0]
+    assert response.json['papers'][0]['name'] == 'paper1'
+
+    assert client.get('/calculate?month=13&year=2022').status_code == 400
+    assert client.get('/calculate?month=0&year=2022').status_code == 400
+    assert client.get('/calculate?month=1&year=0').status_code == 400
+
+
+def test_addudl(client):
+    response = client.post('/addudl', json={'key': 1, 'undelivered': '1-3', 'month': 1, 'year': 2022})
+
+    assert response.status_code == 200
+    assert response.json == {'success': True, 'message': "1 undelivered strings added."}
+
+    response = client.post('/addudl', json=[
+        {'key': 1, 'undelivered': 'mondays', 'month': 1, 'year': 2022},
+        {'key': 2, 'undelivered': '4', 'month': 1, 'year': 2022}
+    ])
+
+    assert response.json['message'] == "2 undelivered strings added."
+
+    papers = client.get('/calculate?month=1&year=2022').json['papers']
+
+    assert papers[0]['undelivered'] == [1, 2, 3, 10, 17, 24, 31]
+    assert papers[1]['undelivered'] == [4]
+
+    # nothing is added if any entry is invalid
+    response = client.post('/addudl', json=[
+        {'key': 1, 'undelivered': '5', 'month': 1, 'year': 2022},
+        {'key': 1, 'undelivered': 'nonsense', 'month': 1, 'year': 2022}
+    ])
+
+    assert response.status_code == 400
+    assert response.json == {'success': False, 'message': "Invalid undelivered string in entry 2."}
+
+    assert client.post('/addudl', json={'undelivered': '5'}).status_code == 400
+
+    # a month or year of 0 is invalid, and not taken to mean the current one
+    assert client.post('/addudl', json={'key': 1, 'undelivered': '5', 'month': 0, 'year': 2022}).status_code == 400
+    assert client.post('/addudl', json={'key': 1, 'undelivered': '5', 'month': 1, 'year': 0}).status_code == 400
+    assert client.get('/calculate?month=1&year=2022').json['papers'][0]['undelivered'] == [1, 2, 3, 10, 17, 24, 31]
+
+
+def test_getpapers_reloads_changed_papers(client):
+    papers = client.get('/getpapers').json['papers']
+
+    assert papers[1] == {
+        'paper_id': 2,
+        'name': 'paper2',
+        'days': [False, False, True, True, True, False, True],
+        'costs': [0, 0, 2, 2, 5, 0, 1]
+    }
+
+    # reading the papers again doesn't load them again, unless they change
+    version = get_papers_version()
+    client.get('/getpapers')
+    assert npbc_api.WARM_PAPERS.version == version
+
+    edit_existing_paper(2, name='paper4', days_cost=[0, 0, 2, 2, 5, 0, 7])
+    assert get_papers_version() != version
+
+    papers = client.get('/getpapers').json['papers']
+
+    assert papers[1]['name'] == 'paper4'
+    assert papers[1]['costs'][6] == 7
+    assert client.get('/calculate?month=2&year=2022').json['total'] == 112 + 64 + 0
+
+
+def test_getlogs(client):
+    save_results({1: {date_type(2022, 1, 5)}, 2: set()}, 1, 2022)
+
+    logs = client.get('/getlogs?key=1').json['logs']
+
+    assert len(logs) == 1
+    assert (logs[0]['paper_id'], logs[0]['month'], logs[0]['year'], logs[0]['undelivered']) == (1, 1, 2022, [5])
+
+    assert len(client.get('/getlogs?month=1&year=2022').json['logs']) == 2
+    assert client.get('/getlogs?month=2').json['logs'] == []
+    assert client.get('/getlogs?month=13').status_code == 400
+
+    # a filter that isn't a number is an error, instead of being left out
+    assert client.get('/getlogs?key=paper1').json == {'success': False, 'message': "Invalid key."}
+    assert client.get('/getlogs?month=january').status_code == 400
+    assert client.get('/calculate?month=1&year=last').status_code == 400
+
+
+def test_getlogs_pages(client):
+    for month in range(1, 6):
+        save_results({1: {date_type(2022, month, 1)}}, month, 2022)
+
+    # the response is written out as the log is read, instead of being built all at once
+    response = client.get('/getlogs?key=1&limit=2', buffered=False)
+    assert next(iter(response.response)) == b'{"success": true, "logs": ['
+    response.close()
+
+    first_page = client.get('/getlogs?key=1&limit=2').json['logs']
+    assert [entry['month'] for entry in first_page] == [1, 2]
+
+    second_page = client.get(f"/getlogs?key=1&limit=2&after={first_page[-1]['entry_id']}").json['logs']
+    last_page = client.get(f"/getlogs?key=1&limit=2&after={second_page[-1]['entry_id']}").json['logs']
+
+    assert [entry['month'] for entry in second_page + last_page] == [3, 4, 5]
+    assert client.get(f"/getlogs?after={last_page[-1]['entry_id']}").json == {'success': True, 'logs': []}
+
+    assert client.get('/getlogs?limit=0').json == {'success': False, 'message': "The limit must be at least 1."}
+    assert client.get('/getlogs?limit=all').status_code == 400
+    assert client.get('/getlogs?after=last').status_code == 400
+
+
+def test_calculate_uses_papers_in_memory(client, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'SQL_TRACER', None)
+
+    client.get('/getpapers')
+    client.post('/addudl', json={'key': 1, 'undelivered': '1-3', 'month': 1, 'year': 2022})
+
+    start_sql_trace()
+    response = client.get('/calculate?month=1&year=2022')
+    statements = [statement['statement'] for statement in npbc_core.SQL_TRACER.get_report()] # type: ignore
+    stop_sql_trace()
+
+    # the bill of paper 1 is stale, and is calculated without reading its cost and delivery data from the DB
+    assert response.json['total'] == 167 - 14
+    assert any('bills' in statement for statement in statements)
+    assert not any('papers_days' in statement for statement in statements)
+
+
+def test_sqltrace(client, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'SQL_TRACER', None)
+
+    assert client.get('/sqltrace').status_code == 404
+
+    start_sql_trace()
+    client.get('/getpapers')
+    response = client.get('/sqltrace')
+
+    assert response.status_code == 200
+
+    statements = [statement['statement'] for statement in response.json['statements']]
+
+    assert 'SELECT version FROM papers_version;' in statements
+    assert {'statement': 'SELECT paper_id, name FROM papers;', 'plan': ['SCAN papers'], 'full_scan': True} in response.json['plans']
+
+    stop_sql_trace()
+
+
+def test_metrics(client, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'METRICS', npbc_core.METRICS)
+
+    assert client.get('/metrics').status_code == 404
+
+    enable_metrics()
+    client.get('/calculate?month=1&year=2022')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'npbc_calculations_total 1\n' in response.text
+    assert 'npbc_command_seconds_count{command="calculate"} 1\n' in response.text
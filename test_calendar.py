@@ -0,0 +1,51 @@
+from calendar import monthcalendar, monthrange
+from datetime import date as date_type
+
+from npbc_calendar import (get_first_weekday, get_month_length, get_month_mask,
+                           get_number_of_days_per_week, get_weekday_masks,
+                           is_leap_year)
+
+## a spread of years across the whole supported range, and the usual leap year edge cases
+YEARS = [*range(1, 10000, 97), 1, 4, 100, 400, 1900, 2000, 2020, 2022, 9999]
+
+
+def test_leap_years():
+    assert is_leap_year(2020)
+    assert is_leap_year(2000)
+    assert not is_leap_year(1900)
+    assert not is_leap_year(2022)
+
+
+def test_month_lengths_and_first_weekdays():
+    for year in YEARS:
+        for month in range(1, 13):
+            assert (get_first_weekday(month, year), get_month_length(month, year)) == monthrange(year, month)
+
+
+def test_number_of_days_per_week_against_calendar():
+    for year in YEARS:
+        for month in range(1, 13):
+            main_calendar = monthcalendar(year, month)
+
+            assert get_number_of_days_per_week(month, year) == [
+                sum(1 for week in main_calendar if week[weekday])
+                for weekday in range(7)
+            ]
+
+
+def test_weekday_masks():
+    for year in YEARS:
+        for month in range(1, 13):
+            weekday_masks = get_weekday_masks(month, year)
+
+            for weekday, weekday_mask in enumerate(weekday_masks):
+                assert weekday_mask == sum(
+                    1 << (day - 1)
+                    for day in range(1, get_month_length(month, year) + 1)
+                    if date_type(year, month, day).weekday() == weekday
+                )
+
+            assert sum(weekday_masks) == get_month_mask(month, year)
+
+    # May 2017 starts on a Monday
+    assert get_weekday_masks(5, 2017)[0] == (1 << 0) | (1 << 7) | (1 << 14) | (1 << 21) | (1 << 28)
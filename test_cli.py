@@ -0,0 +1,255 @@
+from datetime import date as date_type
+from pathlib import Path
+from pstats import Stats
+from sqlite3 import connect
+from subprocess import run
+from sys import executable, stdlib_module_names
+
+from pytest import raises
+
+import npbc_core
+from npbc_cli import (COMMANDS, addudl, batch_calculate, calculate,
+                      can_run_in_daemon, define_and_read_args, getlogs,
+                      getpapers, getudl, run_command)
+from npbc_core import (add_new_paper, add_undelivered_strings, open_connection,
+                       query_database, save_results, setup_and_connect_DB)
+
+## modules that must not be imported until a command needs them
+LAZY_MODULES = ['npbc_core', 'colorama', 'pyperclip', 'csv', 'json', 'sqlite3']
+
+
+## run "python -X importtime" on some code, and get the cumulative import time of each module, in microseconds
+ # bytecode is cached in the given folder, so that compiling the source isn't counted after the first run
+def get_import_times(code: str, pycache_prefix: Path) -> dict[str, int]:
+    result = run(
+        [executable, '-X', 'importtime', '-X', f"pycache_prefix={pycache_prefix}", '-c', code],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={'PATH': ''}
+    )
+
+    import_times = {}
+
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            _, cumulative, module = line.removeprefix('import time:').split('|')
+            import_times[module.strip()] = int(cumulative)
+
+    return import_times
+
+
+def test_cli_import_is_lazy(tmp_path):
+    import_times = get_import_times('import npbc_cli', tmp_path)
+
+    for module in LAZY_MODULES:
+        assert module not in import_times
+
+
+## what the import costs is checked by what it imports, not by timing it, so a slow machine can't fail it
+ # anything the interpreter imports at startup (like hooks from site-packages) is left out
+def test_cli_imports_only_the_standard_library(tmp_path):
+    imported = get_import_times('import npbc_cli', tmp_path).keys() - get_import_times('pass', tmp_path).keys()
+
+    assert 'npbc_cli' in imported
+    assert {module.split('.')[0] for module in imported} - {'npbc_cli'} <= stdlib_module_names
+
+
+def test_parsing_one_command():
+    args = define_and_read_args(['calculate', '-m', '1', '-y', '2022', '-c'])
+
+    assert args.func is calculate
+    assert (args.month, args.year, args.nocopy, args.nolog) == (1, 2022, True, False)
+
+    assert define_and_read_args(['getpapers', '-n']).func is getpapers
+
+
+def test_help_lists_every_command(capsys):
+    with raises(SystemExit):
+        define_and_read_args(['--help'])
+
+    help_text = capsys.readouterr().out
+
+    for command in COMMANDS:
+        assert command in help_text
+
+    with raises(SystemExit):
+        define_and_read_args(['nonsense'])
+
+    assert 'calculate' in capsys.readouterr().err
+
+
+def test_choosing_a_database():
+    args = define_and_read_args(['--db', 'households/one.db', 'getpapers', '-n'])
+
+    assert args.func is getpapers
+    assert args.db == 'households/one.db'
+
+    assert define_and_read_args(['getpapers']).db is None
+
+
+def test_batch_calculate(tmp_path, capsys):
+    for household, cost in (('one', 1), ('two', 2), ('three', 3)):
+        connection = open_connection(tmp_path / f"{household}.db")
+        setup_and_connect_DB(connection)
+        add_new_paper('paper1', [True] * 7, [cost] * 7, connection)
+        connection.close()
+
+    # other SQLite files in the folder are left as they are
+    foreign = connect(tmp_path / 'foreign.db')
+    foreign.executescript("CREATE TABLE notes (text TEXT); PRAGMA user_version = 3;")
+    foreign.close()
+    (tmp_path / 'broken.db').write_text('not a database')
+
+    foreign_contents = (tmp_path / 'foreign.db').read_bytes()
+
+    batch_calculate(define_and_read_args(['batch-calculate', '--db-dir', str(tmp_path), '-m', '1', '-y', '2022', '-w', '2']))
+
+    output = capsys.readouterr().out
+
+    assert "Skipping foreign.db" in output and "Skipping broken.db" in output
+    assert (tmp_path / 'foreign.db').read_bytes() == foreign_contents
+
+    for household, total in (('one', 31), ('two', 62), ('three', 93)):
+        assert f"{household} (" in output
+        assert f"**TOTAL**: {total}\n" in output
+
+    assert "**GRAND TOTAL**: 186" in output
+    assert "3 databases calculated" in output
+
+    batch_calculate(define_and_read_args(['batch-calculate', '--db-dir', str(tmp_path / 'nothing')]))
+
+    assert "No databases found" in capsys.readouterr().out
+
+
+def test_failing_range_is_not_reported_as_success(papers_database, monkeypatch, capsys):
+    add_undelivered_strings([(1, str(month), month, 2022) for month in range(1, 7)])
+
+    def fail_to_save(*_):
+        raise OSError("Disk full.")
+
+    monkeypatch.setattr(npbc_core, 'save_results', fail_to_save)
+
+    with raises(OSError) as error:
+        calculate(define_and_read_args(['calculate', '-c', '--from', '2022-01', '--to', '2022-06']))
+
+    assert "Success!" not in capsys.readouterr().out
+
+    # while the error is still held, the range's cursor is already closed, so nothing is left reading the table
+    assert error.traceback
+    npbc_core.get_connection().execute("DROP TABLE undelivered_strings;")
+
+
+def test_month_and_year_of_zero_are_rejected(papers_database, tmp_path, capsys):
+    entries = tmp_path / 'entries.jsonl'
+    entries.write_text('{"key": 1, "undelivered": "5", "month": 0, "year": 2022}\n')
+
+    addudl(define_and_read_args(['addudl', '-f', str(entries)]))
+    addudl(define_and_read_args(['addudl', '-f', str(entries), '-m', '1', '-y', '2022']))
+    addudl(define_and_read_args(['addudl', '-k', '1', '-u', '5', '-m', '0']))
+    addudl(define_and_read_args(['addudl', '-k', '1', '-u', '5', '-y', '0']))
+    calculate(define_and_read_args(['calculate', '-m', '0', '-y', '2022']))
+
+    output = capsys.readouterr().out
+
+    assert output.count("Invalid month and/or year") == 5
+    assert query_database("SELECT COUNT(*) FROM undelivered_strings;") == [(0, )]
+
+
+def test_profiling_and_timing_a_command(papers_database, tmp_path, capsys):
+    args = define_and_read_args(['--timings', '--profile', str(tmp_path / 'calculate.prof'), 'calculate', '-c', '-l', '-m', '1', '-y', '2022'])
+
+    assert args.profile == str(tmp_path / 'calculate.prof')
+    assert not can_run_in_daemon(args)
+
+    run_command(args)
+    output = capsys.readouterr()
+
+    assert "**TOTAL**: 167" in output.out
+    assert "TIMINGS:" not in output.out
+
+    for stage in ('set up DB', 'fetch strings', 'load bills', 'compute', 'format', 'other', 'total'):
+        assert f"\n{stage} " in output.err
+
+    # the profile has the calls the command made
+    assert any(function == 'calculate_cost_of_all_papers' for _, _, function in Stats(str(tmp_path / 'calculate.prof')).stats)  # type: ignore
+
+
+def test_tracing_sql(papers_database, monkeypatch, capsys):
+    monkeypatch.setattr(npbc_core, 'SQL_TRACER', None)
+
+    args = define_and_read_args(['--trace-sql', 'getpapers', '-n'])
+
+    assert not can_run_in_daemon(args)
+
+    run_command(args)
+    output = capsys.readouterr()
+
+    assert "paper1" in output.out
+    assert "SQL TRACE:" in output.err
+    assert "1 | 1 |" in output.err
+    assert "[FULL SCAN] SELECT papers.paper_id, papers.name FROM papers ORDER BY papers.paper_id;\n    SCAN papers\n" in output.err
+    assert npbc_core.SQL_TRACER is None
+
+
+def test_writing_metrics(papers_database, tmp_path, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'METRICS', npbc_core.METRICS)
+
+    args = define_and_read_args(['--metrics', str(tmp_path / 'npbc.prom'), 'calculate', '-c', '-m', '1', '-y', '2022'])
+
+    assert not can_run_in_daemon(args)
+
+    run_command(args)
+    metrics = (tmp_path / 'npbc.prom').read_text()
+
+    assert 'npbc_calculations_total 1\n' in metrics
+    assert 'npbc_papers_billed_total 3\n' in metrics
+    assert 'npbc_command_seconds_count{command="calculate"} 1\n' in metrics
+    assert 'npbc_stage_seconds_count{stage="save results"} 1\n' in metrics
+
+
+def test_getpapers(papers_database, capsys):
+    getpapers(define_and_read_args(['getpapers', '-n', '-p']))
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert 'name' in lines[0] and 'costs' in lines[0] and 'days' not in lines[0]
+    assert lines[1:] == [
+        '1: paper1, 1;2;3;4;5;6;7',
+        '2: paper2, 0;0;2;2;5;0;1',
+        '3: paper3, 0;0;0;0;0;0;0'
+    ]
+
+    getpapers(define_and_read_args(['getpapers']))
+
+    assert capsys.readouterr().out.splitlines()[1:] == ['1: ', '2: ', '3: ']
+
+
+def test_paging_through_logs(papers_database, capsys):
+    add_undelivered_strings([(1, str(day), day, 2022) for day in range(1, 6)])
+
+    for month in range(1, 4):
+        save_results({1: {date_type(2022, month, month)}}, month, 2022)
+
+    getudl(define_and_read_args(['getudl', '-k', '1', '--limit', '2', '--after', '1']))
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert lines[3:] == ['2|2022|2|1|2', '3|2022|3|1|3', 'To get the next page, use --after 3.']
+
+    getlogs(define_and_read_args(['getlogs', '-k', '1', '--since', '2022-02', '--until', '2022-03']))
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert [line.split(' | ')[2::3] for line in lines[3:]] == [['2', '02'], ['3', '03']]
+
+    getlogs(define_and_read_args(['getlogs', '-k', '1', '--since', '2022-03', '--until', '2022-02']))
+    getudl(define_and_read_args(['getudl', '--limit', '0']))
+    getudl(define_and_read_args(['getudl', '--after', '5']))
+
+    output = capsys.readouterr().out
+
+    assert "The start of the range must not be after the end." in output
+    assert "The limit must be at least 1." in output
+    assert "No undelivered strings found." in output
@@ -1,9 +1,37 @@
 from datetime import date as date_type
+from datetime import datetime
+from sqlite3 import ProgrammingError
+from threading import Thread
 
-from npbc_core import (SPLIT_REGEX, VALIDATE_REGEX,
-                       calculate_cost_of_one_paper, extract_days_and_costs,
-                       generate_sql_query, get_number_of_days_per_week,
-                       parse_undelivered_string, validate_month_and_year)
+from pytest import raises
+
+import npbc_core
+from npbc_core import (MIGRATIONS, PARSER_VERSION, SCHEMA_VERSION, SPLIT_REGEX,
+                       VALIDATE_REGEX, ConnectionManager, MetricsRegistry,
+                       UndeliveredDates, add_new_paper, add_new_papers,
+                       add_undelivered_string, add_undelivered_strings,
+                       calculate_cost_for_range, calculate_cost_of_all_papers,
+                       calculate_cost_of_all_papers_from_bills,
+                       calculate_cost_of_one_paper, calculate_database,
+                       delete_existing_paper, delete_undelivered_string,
+                       disable_metrics, edit_existing_paper, enable_metrics,
+                       extract_days_and_costs, format_output,
+                       generate_parameterized_query, generate_sql_query,
+                       get_bills, get_connection, get_cost_and_delivery_data,
+                       get_cost_and_delivery_data_of_all_papers,
+                       get_number_of_days_per_week, get_papers,
+                       get_papers_version, get_undelivered_masks,
+                       iterate_log_entries, iterate_papers, keep_papers_warm,
+                       normalize_sql, open_connection,
+                       parse_undelivered_string,
+                       parse_undelivered_string_to_mask, query_database,
+                       read_papers_from_csv, read_papers_from_jsonl,
+                       read_undelivered_entries_from_csv,
+                       read_undelivered_entries_from_jsonl, save_results,
+                       set_database_path, setup_and_connect_DB,
+                       start_sql_trace, start_stage_timings, stop_sql_trace,
+                       stop_stage_timings, tokenize_undelivered_string,
+                       validate_month_and_year, validate_undelivered_string)
 
 
 def test_regex_number():
@@ -323,6 +351,61 @@ def test_undelivered_string_parsing():
     ])
 
 
+def test_undelivered_string_parsing_to_mask():
+    MONTH = 5
+    YEAR = 2017
+
+    assert parse_undelivered_string_to_mask('', MONTH, YEAR) == 0
+    assert parse_undelivered_string_to_mask('1', MONTH, YEAR) == 0b1
+    assert parse_undelivered_string_to_mask('1-3', MONTH, YEAR) == 0b111
+    assert parse_undelivered_string_to_mask('2-3, 5', MONTH, YEAR) == 0b10110
+    assert parse_undelivered_string_to_mask('mondays', MONTH, YEAR) == (1 << 0) | (1 << 7) | (1 << 14) | (1 << 21) | (1 << 28)
+    assert parse_undelivered_string_to_mask('2-monday', MONTH, YEAR) == 1 << 7
+    assert parse_undelivered_string_to_mask('5-monday', MONTH, YEAR) == 1 << 28
+    assert parse_undelivered_string_to_mask('6-monday', MONTH, YEAR) == 0
+    assert parse_undelivered_string_to_mask('0-monday', MONTH, YEAR) == 0
+    assert parse_undelivered_string_to_mask('31', MONTH, YEAR) == 1 << 30
+    assert parse_undelivered_string_to_mask('31', 6, YEAR) == 0
+    assert parse_undelivered_string_to_mask('1-31', MONTH, YEAR) == (1 << 31) - 1
+    assert parse_undelivered_string_to_mask('3-1', MONTH, YEAR) == 0
+
+
+def test_undelivered_dates_view():
+    undelivered_dates = parse_undelivered_string('1, 3, 2-monday', 5, 2017)
+
+    assert isinstance(undelivered_dates, UndeliveredDates)
+    assert len(undelivered_dates) == 3
+    assert list(undelivered_dates) == [date_type(2017, 5, 1), date_type(2017, 5, 3), date_type(2017, 5, 8)]
+    assert date_type(2017, 5, 3) in undelivered_dates
+    assert date_type(2017, 5, 4) not in undelivered_dates
+    assert date_type(2017, 6, 3) not in undelivered_dates
+    assert undelivered_dates == set([date_type(2017, 5, 1), date_type(2017, 5, 3), date_type(2017, 5, 8)])
+    assert undelivered_dates & set([date_type(2017, 5, 1)]) == set([date_type(2017, 5, 1)])
+    assert undelivered_dates.count_per_weekday() == [2, 0, 1, 0, 0, 0, 0]
+
+    assert not UndeliveredDates(0, 5, 2017)
+    assert UndeliveredDates(0, 5, 2017) == set()
+
+
+def test_undelivered_string_validation():
+    for string in ['1', '1,', '31', '1-2', '5-17,19-21,23', 'mondays', 'mondays, wednesdays', '2-monday', '2-monday, 3-wednesday', '1 ,2', '1 , 2,3', '0', '99', '3-1', '2-sunday']:
+        assert validate_undelivered_string(string), string
+
+    for string in ['', ' ', ',', '1,,', '1, ,2', '1 ,', ', 1', '111', '1-2-3', '1 - 2', 'monday', 'Mondays', 'mondaysx', 'xsundays', '11-monday', '1-mondays', 'tomorrow', '1;2', '1\n']:
+        assert not validate_undelivered_string(string), string
+
+
+def test_undelivered_string_tokens():
+    assert tokenize_undelivered_string('') is None
+    assert tokenize_undelivered_string('1,x') is None
+    assert tokenize_undelivered_string('15') == [('number', 15, 15)]
+    assert tokenize_undelivered_string('5-17, tuesdays,2-sunday,') == [
+        ('range', 5, 17),
+        ('weekdays', 1, 0),
+        ('n-day', 2, 6)
+    ]
+
+
 def test_sql_query():
     assert generate_sql_query(
         'test'
@@ -361,6 +444,29 @@ def test_sql_query():
     ) == "SELECT a, b FROM test WHERE a = \"b\" AND c = \"d\";"
 
 
+def test_parameterized_query():
+    assert generate_parameterized_query(
+        'test'
+    ) == ("SELECT * FROM test;", ())
+
+    assert generate_parameterized_query(
+        'test',
+        columns=['a', 'b']
+    ) == ("SELECT a, b FROM test;", ())
+
+    assert generate_parameterized_query(
+        'test',
+        conditions={
+            'a': 'b',
+            'c': 4
+        },
+        columns=['a', 'b']
+    ) == ("SELECT a, b FROM test WHERE a = ? AND c = ?;", ('b', 4))
+
+    # the SQL text does not depend on the values, so the statement can be reused
+    assert generate_parameterized_query('test', conditions={'a': 1})[0] == generate_parameterized_query('test', conditions={'a': 2})[0]
+
+
 def test_number_of_days_per_week():
     assert get_number_of_days_per_week(1, 2022) == [5, 4, 4, 4, 4, 5, 5]
     assert get_number_of_days_per_week(2, 2022) == [4, 4, 4, 4, 4, 4, 4]
@@ -517,6 +623,24 @@ def test_calculating_cost_of_one_paper():
     ) == 34
 
 
+def test_calculating_cost_of_one_paper_from_mask():
+    COST_PER_DAY: dict[int, float] = {0: 0, 1: 0, 2: 2, 3: 2, 4: 5, 5: 0, 6: 1}
+    DELIVERY_DATA: dict[int, bool] = {0: False, 1: False, 2: True, 3: True, 4: True, 5: False, 6: True}
+
+    for string in ['', '8', '8,17', '2', '6-7', '6-8', 'sundays', '1-31', '3-thursday, fridays']:
+        undelivered_dates = parse_undelivered_string(string, 1, 2022)
+
+        assert calculate_cost_of_one_paper(
+            get_number_of_days_per_week(1, 2022),
+            undelivered_dates,
+            (COST_PER_DAY, DELIVERY_DATA)
+        ) == calculate_cost_of_one_paper(
+            get_number_of_days_per_week(1, 2022),
+            set(undelivered_dates),
+            (COST_PER_DAY, DELIVERY_DATA)
+        )
+
+
 def test_extracting_days_and_costs():
     assert extract_days_and_costs(None, None) == ([], [])
     assert extract_days_and_costs('NNNNNNN', None) == (
@@ -558,7 +682,726 @@ def test_validate_month_and_year():
     assert not validate_month_and_year(45, 2020)[0]
     assert not validate_month_and_year(1, -5)[0]
     assert not validate_month_and_year(12, -5)[0]
+    assert not validate_month_and_year(1, 0)[0]
+    assert not validate_month_and_year(1, 10000)[0]
     assert not validate_month_and_year(1.6, 10)[0]  # type: ignore
     assert not validate_month_and_year(12.6, 10)[0]  # type: ignore
     assert not validate_month_and_year(1, '10')[0]  # type: ignore
     assert not validate_month_and_year(12, '10')[0]  # type: ignore
+
+
+def test_bulk_loading_cost_and_delivery_data(papers_database):
+    bulk_data = get_cost_and_delivery_data_of_all_papers()
+
+    assert list(bulk_data) == [1, 2, 3]
+
+    for paper_id, paper_data in bulk_data.items():
+        assert paper_data == get_cost_and_delivery_data(paper_id)
+
+    assert bulk_data[2] == (
+        {0: 0, 1: 0, 2: 2, 3: 2, 4: 5, 5: 0, 6: 1},
+        {0: False, 1: False, 2: True, 3: True, 4: True, 5: False, 6: True}
+    )
+
+
+def test_calculating_cost_of_all_papers(papers_database):
+    costs, total, undelivered_dates = calculate_cost_of_all_papers({2: '2'}, 1, 2022)
+
+    assert costs == {1: 126, 2: 40, 3: 0}
+    assert total == 166
+    assert undelivered_dates[2] == set([date_type(year=2022, month=1, day=2)])
+
+
+def test_connection_manager(database):
+    manager = ConnectionManager(database)
+    connection = manager.get_connection()
+
+    # the same thread always gets the same, already configured, connection
+    assert manager.get_connection() is connection
+    assert connection.execute("PRAGMA journal_mode;").fetchone() == ('wal',)
+
+    # other threads get their own connection
+    other_connections = []
+    thread = Thread(target=lambda: other_connections.append(manager.get_connection()))
+    thread.start()
+    thread.join()
+
+    assert other_connections[0] is not connection
+
+    # once that thread has exited, its connection is closed and forgotten
+    assert manager.connections == {connection}
+
+    with raises(ProgrammingError):
+        other_connections[0].execute("SELECT 1;")
+
+    # an explicit connection is used instead of the shared one
+    add_new_paper('paper1', [True] * 7, [1] * 7, connection=connection)
+    assert get_cost_and_delivery_data_of_all_papers(connection) == get_cost_and_delivery_data_of_all_papers()
+
+    manager.close()
+    assert not manager.connections
+
+
+def test_connection_manager_does_not_keep_connections_of_exited_threads(database):
+    manager = ConnectionManager(database)
+
+    for _ in range(5):
+        threads = [Thread(target=manager.get_connection) for _ in range(10)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert not manager.connections
+
+    manager.get_connection()
+    assert len(manager.connections) == 1
+
+    manager.close()
+
+
+def test_paper_names_are_not_quoted_into_sql(database):
+    assert add_new_paper('The "Daily" Paper', [True] * 7, [1] * 7)[0]
+    assert not add_new_paper('The "Daily" Paper', [True] * 7, [1] * 7)[0]
+    assert add_new_paper("Reader's Digest", [True] * 7, [1] * 7)[0]
+
+
+def test_adding_undelivered_strings(papers_database):
+    assert add_undelivered_string(1, '1-5', 1, 2022)[0]
+    assert add_undelivered_string(1, 'mondays', 1, 2022)[0]
+    assert not add_undelivered_string(1, 'tomorrow', 1, 2022)[0]
+
+    assert query_database(
+        *generate_parameterized_query(
+            'undelivered_strings',
+            columns=['string'],
+            conditions={'paper_id': 1, 'month': 1, 'year': 2022}
+        )
+    ) == [('1-5,mondays',)]
+
+
+def test_calculating_cost_for_range(papers_database):
+    add_undelivered_string(2, '2', 1, 2022)
+    add_undelivered_string(1, 'mondays', 11, 2021)
+    add_undelivered_string(1, '1-31', 3, 2022)
+
+    results = list(calculate_cost_for_range(date_type(2021, 10, 1), date_type(2022, 2, 1)))
+
+    assert [(month, year) for month, year, *_ in results] == [(10, 2021), (11, 2021), (12, 2021), (1, 2022), (2, 2022)]
+
+    for month, year, costs, total, undelivered_dates in results:
+        strings = {
+            paper_id: string
+            for paper_id, string in query_database(
+                *generate_parameterized_query(
+                    'undelivered_strings',
+                    columns=['paper_id', 'string'],
+                    conditions={'month': month, 'year': year}
+                )
+            )
+        }
+
+        assert (costs, total, undelivered_dates) == calculate_cost_of_all_papers(strings, month, year)
+
+    assert results[3][2] == {1: 126, 2: 40, 3: 0}
+
+
+def test_stored_undelivered_masks(papers_database):
+    add_undelivered_string(2, '2', 1, 2022)
+    add_undelivered_string(1, 'mondays', 1, 2022)
+    add_undelivered_string(1, '1', 1, 2022)
+
+    assert query_database(
+        "SELECT paper_id, string, mask, parser_version FROM undelivered_strings ORDER BY paper_id;"
+    ) == [
+        (1, 'mondays,1', parse_undelivered_string_to_mask('mondays,1', 1, 2022), PARSER_VERSION),
+        (2, '2', 0b10, PARSER_VERSION)
+    ]
+
+    assert get_undelivered_masks(1, 2022) == {
+        1: parse_undelivered_string_to_mask('mondays,1', 1, 2022),
+        2: 0b10
+    }
+
+    assert calculate_cost_of_all_papers(None, 1, 2022) == calculate_cost_of_all_papers({1: 'mondays,1', 2: '2'}, 1, 2022)
+
+
+def test_out_of_date_masks_are_parsed_again(papers_database):
+    with get_connection() as connection:
+        connection.execute("INSERT INTO undelivered_strings (year, month, paper_id, string) VALUES (2022, 1, 2, '2');")
+        connection.execute("INSERT INTO undelivered_strings (year, month, paper_id, string, mask, parser_version) VALUES (2022, 1, 1, '1', 1, ?);", (PARSER_VERSION - 1, ))
+
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 120, 2: 40, 3: 0}
+
+    assert query_database(
+        "SELECT paper_id, mask, parser_version FROM undelivered_strings ORDER BY paper_id;"
+    ) == [(1, 1, PARSER_VERSION), (2, 0b10, PARSER_VERSION)]
+
+
+def test_adding_columns_to_an_old_database(database):
+    with get_connection() as connection:
+        connection.executescript("""
+            DROP TABLE undelivered_strings;
+            CREATE TABLE undelivered_strings (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                paper_id INTEGER NOT NULL,
+                string TEXT NOT NULL
+            );
+            INSERT INTO undelivered_strings (year, month, paper_id, string) VALUES (2022, 1, 1, '1-3');
+            PRAGMA user_version = 0;
+        """)
+
+    setup_and_connect_DB()
+
+    assert get_undelivered_masks(1, 2022) == {1: 0b111}
+
+
+def test_bills_are_stored_and_reused(papers_database):
+    assert get_bills(1, 2022) == {1: None, 2: None, 3: None}
+
+    costs, total, undelivered_dates = calculate_cost_of_all_papers(None, 1, 2022)
+
+    assert costs == {1: 126, 2: 41, 3: 0}
+    assert total == 167
+    assert undelivered_dates == {1: set(), 2: set(), 3: set()}
+    assert get_bills(1, 2022) == costs
+
+    # a stored bill is served as it is, without calculating the paper again
+    with get_connection() as connection:
+        connection.execute("UPDATE bills SET cost = 1000 WHERE paper_id = 3;")
+
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 126, 2: 41, 3: 1000}
+
+
+def test_bills_are_calculated_from_papers_in_memory(papers_database):
+    cost_and_delivery_data = get_cost_and_delivery_data_of_all_papers()
+    version = get_papers_version()
+
+    # the data in memory is used at the version it was loaded at, so paper 1 at 2 a day shows that it was used
+    cost_and_delivery_data[1] = ({day_id: 2 for day_id in range(7)}, {day_id: True for day_id in range(7)})
+
+    assert calculate_cost_of_all_papers_from_bills(1, 2022, cost_and_delivery_data=cost_and_delivery_data, papers_version=version)[0] == {1: 62, 2: 41, 3: 0}
+
+    # once the papers change, the data in memory is out of date, and the papers are read from the DB
+    with get_connection() as connection:
+        connection.execute("UPDATE bills SET stale = 1;")
+
+    edit_existing_paper(3, name='paper4')
+
+    assert calculate_cost_of_all_papers_from_bills(1, 2022, cost_and_delivery_data=cost_and_delivery_data, papers_version=version)[0] == {1: 126, 2: 41, 3: 0}
+
+
+def test_keeping_papers_warm(papers_database, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'PAPERS_CACHE', None)
+
+    cache = keep_papers_warm()
+    version, cost_and_delivery_data = cache.get()
+
+    assert version == get_papers_version()
+    assert cost_and_delivery_data == get_cost_and_delivery_data_of_all_papers()
+
+    # the papers in memory are used while their version is current, so paper 1 at 2 a day shows that they were
+    cache.papers = (cache.papers[0], version, {**cost_and_delivery_data, 1: ({day_id: 2 for day_id in range(7)}, {day_id: True for day_id in range(7)})})
+
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 62, 2: 41, 3: 0}
+    assert next(calculate_cost_for_range(date_type(2022, 2, 1), date_type(2022, 2, 1)))[2][1] == 56
+
+    # a connection of its own (like another DB's) doesn't use them
+    with get_connection() as connection:
+        connection.execute("UPDATE bills SET stale = 1;")
+
+    assert calculate_cost_of_all_papers(None, 1, 2022, get_connection())[0] == {1: 126, 2: 41, 3: 0}
+
+    # once the papers change, they are loaded again
+    edit_existing_paper(3, name='paper4')
+
+    assert cache.get() == (get_papers_version(), get_cost_and_delivery_data_of_all_papers())
+
+
+def test_bills_are_marked_stale(papers_database):
+    calculate_cost_of_all_papers(None, 1, 2022)
+    calculate_cost_of_all_papers(None, 2, 2022)
+
+    # an undelivered string only affects its own paper and month
+    add_undelivered_string(1, '1', 1, 2022)
+    assert get_bills(1, 2022) == {1: None, 2: 41, 3: 0}
+    assert get_bills(2, 2022) == {1: 112, 2: 40, 3: 0}
+
+    costs, _, undelivered_dates = calculate_cost_of_all_papers(None, 1, 2022)
+    assert costs == {1: 120, 2: 41, 3: 0}
+    assert undelivered_dates[1] == {date_type(2022, 1, 1)}
+
+    delete_undelivered_string(1, 1, 2022)
+    assert get_bills(1, 2022)[1] is None
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 126, 2: 41, 3: 0}
+
+    # changing a paper's costs or delivery days affects all its months
+    edit_existing_paper(2, days_cost=[0, 0, 2, 2, 5, 0, 2])
+    assert get_bills(1, 2022) == {1: 126, 2: None, 3: 0}
+    assert get_bills(2, 2022) == {1: 112, 2: None, 3: 0}
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 126, 2: 46, 3: 0}
+
+    edit_existing_paper(3, days_delivered=[True, False, False, False, False, False, False])
+    assert get_bills(1, 2022)[3] is None
+
+    # deleting a paper deletes its bills
+    delete_existing_paper(1)
+    assert query_database("SELECT DISTINCT paper_id FROM bills ORDER BY paper_id;") == [(2, ), (3, )]
+
+
+def test_bills_match_calculation(papers_database):
+    strings = {1: 'mondays,1', 2: '2-5'}
+
+    for paper_id, string in strings.items():
+        add_undelivered_string(paper_id, string, 3, 2023)
+
+    # the first call calculates and stores the bills, and the second serves them
+    assert calculate_cost_of_all_papers(None, 3, 2023) == calculate_cost_of_all_papers(strings, 3, 2023)
+    assert calculate_cost_of_all_papers(None, 3, 2023) == calculate_cost_of_all_papers(strings, 3, 2023)
+
+
+def test_adding_undelivered_strings_in_bulk(papers_database):
+    add_undelivered_string(1, '1', 1, 2022)
+
+    assert add_undelivered_strings([
+        (1, '2-3', 1, 2022),
+        (2, 'mondays', 1, 2022),
+        (1, 'sundays', 1, 2022),
+        (2, '5', 2, 2022)
+    ]) == (True, "4 undelivered strings added.")
+
+    assert query_database(
+        "SELECT paper_id, month, year, string, mask, parser_version FROM undelivered_strings ORDER BY entry_id;"
+    ) == [
+        (1, 1, 2022, '1,2-3,sundays', parse_undelivered_string_to_mask('1,2-3,sundays', 1, 2022), PARSER_VERSION),
+        (2, 1, 2022, 'mondays', parse_undelivered_string_to_mask('mondays', 1, 2022), PARSER_VERSION),
+        (2, 2, 2022, '5', 0b10000, PARSER_VERSION)
+    ]
+
+
+def test_invalid_bulk_undelivered_strings_are_not_added(papers_database):
+    assert add_undelivered_strings([(1, '1', 1, 2022), (1, 'x', 1, 2022)]) == (False, "Invalid undelivered string in entry 2.")
+    assert add_undelivered_strings([(1, '1', 13, 2022)]) == (False, "Invalid month and/or year in entry 1.")
+    assert add_undelivered_strings(read_undelivered_entries_from_jsonl(['{"key": 1, "month": 1, "year": 2022, "undelivered": "1"}', '[]'])) == (False, "Invalid entry on line 2.")
+
+    assert query_database("SELECT * FROM undelivered_strings;") == []
+
+
+def test_reading_undelivered_entries():
+    assert list(read_undelivered_entries_from_csv([
+        'key,month,year,undelivered',
+        '1,1,2022,1-3',
+        '2,,,Mondays '
+    ])) == [(1, '1-3', 1, 2022), (2, 'mondays', None, None)]
+
+    assert list(read_undelivered_entries_from_jsonl([
+        '{"key": "1", "month": 1, "year": 2022, "undelivered": "1-3"}',
+        '',
+        '{"key": 2, "undelivered": "mondays"}'
+    ])) == [(1, '1-3', 1, 2022), (2, 'mondays', None, None)]
+
+    for entries in (
+        read_undelivered_entries_from_csv(['key,undelivered', 'a,1']),
+        read_undelivered_entries_from_csv(['key,month', '1,1']),
+        read_undelivered_entries_from_jsonl(['{"key": 1']),
+        read_undelivered_entries_from_jsonl(['{"undelivered": "1"}'])
+    ):
+        with raises(ValueError):
+            list(entries)
+
+
+def test_adding_papers_in_bulk(papers_database):
+    assert add_new_papers([
+        ('paper4', [True, False, True, False, True, False, True], [1, 0, 2, 0, 3, 0, 4.5]),
+        ('paper5', [False] * 7, [0] * 7)
+    ]) == (True, "2 papers added.")
+
+    assert list(iterate_papers()) == [
+        (1, 'paper1', 'YYYYYYY', '1;2;3;4;5;6;7'),
+        (2, 'paper2', 'NNYYYNY', '0;0;2;2;5;0;1'),
+        (3, 'paper3', 'NNNNNNN', '0;0;0;0;0;0;0'),
+        (4, 'paper4', 'YNYNYNY', '1;0;2;0;3;0;4.5'),
+        (5, 'paper5', 'NNNNNNN', '0;0;0;0;0;0;0')
+    ]
+
+    assert get_cost_and_delivery_data(4) == get_cost_and_delivery_data_of_all_papers()[4]
+
+
+def test_bulk_papers_are_added_all_or_nothing(papers_database):
+    assert add_new_papers([
+        ('paper4', [True] * 7, [1] * 7),
+        ('paper1', [True] * 7, [1] * 7)
+    ]) == (False, "Paper paper1 already exists. Please try editing the paper instead.")
+
+    assert add_new_papers(read_papers_from_jsonl([
+        '{"name": "paper4", "days": "YYYYYYY", "costs": "1;1;1;1;1;1;1"}',
+        '{"name": "paper5", "days": "YYYYYYY", "costs": "1;1"}'
+    ])) == (False, "Invalid paper on line 2.")
+
+    assert [name for _, name, _, _ in iterate_papers()] == ['paper1', 'paper2', 'paper3']
+    assert len(query_database("SELECT * FROM papers_days_cost;")) == 21
+
+
+def test_reading_papers():
+    papers = [
+        ('paper1', [True, True, False, False, True, True, False], [1, 2, 0, 0, 5, 6.5, 0]),
+        ('paper 2', [False] * 7, [0] * 7)
+    ]
+
+    assert list(read_papers_from_csv([
+        'paper_id,name,days,costs',
+        '1,paper1,YYNNYYN,1;2;0;0;5;6.5;0',
+        '2,paper 2,nnnnnnn,0; 0; 0; 0; 0; 0; 0;'
+    ])) == papers
+
+    assert list(read_papers_from_jsonl([
+        '{"name": "paper1", "days": "YYNNYYN", "costs": "1;2;0;0;5;6.5;0"}',
+        '',
+        '{"name": "paper 2", "days": "NNNNNNN", "costs": "0;0;0;0;0;0;0"}'
+    ])) == papers
+
+    for papers in (
+        read_papers_from_csv(['name,days,costs', 'paper1,YYY,1;2;3;4;5;6;7']),
+        read_papers_from_csv(['name,days,costs', ',YYYYYYY,1;2;3;4;5;6;7']),
+        read_papers_from_csv(['name,days,costs', 'paper1,YYYYYYY,a;2;3;4;5;6;7']),
+        read_papers_from_jsonl(['{"name": "paper1", "days": "YYYYYYY"}'])
+    ):
+        with raises(ValueError):
+            list(papers)
+
+
+def test_saving_results_replaces_the_log(papers_database):
+    save_results({1: UndeliveredDates(0b101, 1, 2022), 2: set()}, 1, 2022)
+    save_results({1: {date_type(2022, 1, 2), date_type(2022, 1, 31)}}, 1, 2022)
+    save_results({1: set()}, 2, 2022)
+
+    assert query_database(
+        "SELECT paper_id, year, month, mask FROM undelivered_dates ORDER BY paper_id, year, month;"
+    ) == [(1, 2022, 1, (1 << 30) | 0b10), (1, 2022, 2, 0), (2, 2022, 1, 0)]
+
+
+def test_migrating_an_old_undelivered_dates_log(database):
+    with get_connection() as connection:
+        connection.executescript("""
+            DROP TABLE undelivered_dates;
+            CREATE TABLE undelivered_dates (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                paper_id INTEGER NOT NULL,
+                dates TEXT NOT NULL
+            );
+            INSERT INTO undelivered_dates (timestamp, year, month, paper_id, dates) VALUES ('01/02/2022 10:00:00 AM', 2022, 1, 1, '01,02');
+            INSERT INTO undelivered_dates (timestamp, year, month, paper_id, dates) VALUES ('02/02/2022 03:30:00 PM', 2022, 1, 1, '03,01');
+            INSERT INTO undelivered_dates (timestamp, year, month, paper_id, dates) VALUES ('02/02/2022 03:30:00 PM', 2022, 1, 2, '');
+            PRAGMA user_version = 0;
+        """)
+
+    setup_and_connect_DB()
+    setup_and_connect_DB()
+
+    assert query_database(
+        "SELECT paper_id, year, month, timestamp, mask FROM undelivered_dates ORDER BY paper_id;"
+    ) == [
+        (1, 2022, 1, int(datetime(2022, 2, 2, 15, 30).timestamp()), 0b101),
+        (2, 2022, 1, int(datetime(2022, 2, 2, 15, 30).timestamp()), 0)
+    ]
+
+
+def test_setting_up_a_current_database_only_reads_the_version(database):
+    assert query_database("PRAGMA user_version;") == [(SCHEMA_VERSION, )]
+
+    statements = []
+    get_connection().set_trace_callback(statements.append)
+    setup_and_connect_DB()
+    get_connection().set_trace_callback(None)
+
+    assert statements == ["PRAGMA user_version;"]
+
+
+def test_migrating_an_unversioned_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'DATABASE_DIR', tmp_path / 'new')
+    monkeypatch.setattr(npbc_core, 'DATABASE_PATH', tmp_path / 'new' / 'npbc.db')
+    monkeypatch.setattr(npbc_core, 'CONNECTION_MANAGER', ConnectionManager())
+
+    # a DB made before versioning, with the first schema
+    (tmp_path / 'new').mkdir()
+
+    with get_connection() as connection:
+        connection.executescript(MIGRATIONS[0]) # type: ignore
+        connection.executescript("""
+            INSERT INTO papers (name) VALUES ('paper1');
+            INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (1, 0, 1), (1, 1, 1), (1, 2, 1), (1, 3, 1), (1, 4, 1), (1, 5, 1), (1, 6, 1);
+            INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (1, 0, 1), (1, 1, 1), (1, 2, 1), (1, 3, 1), (1, 4, 1), (1, 5, 1), (1, 6, 1);
+            INSERT INTO undelivered_strings (year, month, paper_id, string) VALUES (2022, 1, 1, '1-3');
+            INSERT INTO undelivered_dates (timestamp, year, month, paper_id, dates) VALUES ('01/02/2022 10:00:00 AM', 2022, 1, 1, '01,02,03');
+        """)
+
+    setup_and_connect_DB()
+
+    assert query_database("PRAGMA user_version;") == [(SCHEMA_VERSION, )]
+    assert calculate_cost_of_all_papers(None, 1, 2022)[0] == {1: 28}
+    assert query_database("SELECT paper_id, year, month, mask FROM undelivered_dates;") == [(1, 2022, 1, 0b111)]
+
+    npbc_core.CONNECTION_MANAGER.close()
+
+
+def test_failed_migrations_are_rolled_back(database, monkeypatch):
+    def failing_migration(connection):
+        connection.execute("INSERT INTO papers (name) VALUES ('paper1');")
+        raise ValueError
+
+    monkeypatch.setattr(npbc_core, 'MIGRATIONS', MIGRATIONS + ["CREATE TABLE extra (id INTEGER);", failing_migration])
+    monkeypatch.setattr(npbc_core, 'SCHEMA_VERSION', SCHEMA_VERSION + 2)
+
+    with raises(ValueError):
+        setup_and_connect_DB()
+
+    # the migration before the failed one is kept
+    assert query_database("PRAGMA user_version;") == [(SCHEMA_VERSION + 1, )]
+    assert query_database("SELECT name FROM sqlite_master WHERE name = 'extra';") == [('extra', )]
+    assert query_database("SELECT * FROM papers;") == []
+
+
+def test_using_other_databases(papers_database, tmp_path, monkeypatch):
+
+    # a call to another DB, through a connection of its own
+    connection = open_connection(tmp_path / 'other.db')
+    setup_and_connect_DB(connection)
+    add_new_paper('paper4', [True] * 7, [2] * 7, connection)
+
+    assert calculate_cost_of_all_papers(None, 1, 2022, connection)[1] == 62
+    assert calculate_cost_of_all_papers(None, 1, 2022)[1] == 167
+
+    connection.close()
+
+    # the whole session, on another DB (which is put back afterwards)
+    monkeypatch.setattr(npbc_core, 'DATABASE_DIR', npbc_core.DATABASE_DIR)
+    monkeypatch.setattr(npbc_core, 'DATABASE_PATH', npbc_core.DATABASE_PATH)
+
+    set_database_path(tmp_path / 'household' / 'npbc.db')
+    setup_and_connect_DB()
+
+    assert (tmp_path / 'household' / 'npbc.db').exists()
+    assert query_database("SELECT name FROM papers;") == []
+
+    set_database_path(tmp_path / 'other.db')
+
+    assert query_database("SELECT name FROM papers;") == [('paper4', )]
+
+
+def test_calculating_a_database(papers_database):
+    total, formatted, elapsed = calculate_database(papers_database, 1, 2022)
+
+    assert total == 167
+    assert formatted == format_output(*calculate_cost_of_all_papers(None, 1, 2022)[:2], 1, 2022)
+    assert elapsed > 0
+    assert len(query_database("SELECT * FROM undelivered_dates;")) == 3
+
+    calculate_database(papers_database, 2, 2022, log=False)
+
+    assert len(query_database("SELECT * FROM undelivered_dates;")) == 3
+
+
+def test_timing_stages(papers_database):
+    add_undelivered_string(1, '1-5', 1, 2022)
+
+    assert npbc_core.STAGE_TIMINGS is None
+
+    start_stage_timings()
+    costs, total, undelivered_dates = calculate_cost_of_all_papers(None, 1, 2022)
+    format_output(costs, total, 1, 2022)
+    save_results(undelivered_dates, 1, 2022)
+    timings = stop_stage_timings()
+
+    # the string's mask was stored when it was added, so it isn't parsed again
+    assert list(timings) == ['fetch strings', 'load bills', 'load papers', 'compute', 'save bills', 'format', 'save results']
+    assert all(seconds >= 0 for seconds in timings.values())
+
+    start_stage_timings()
+    calculate_cost_of_all_papers({1: '1-5'}, 1, 2022)
+
+    assert list(stop_stage_timings()) == ['parse', 'load papers', 'compute']
+
+    # with timing off, nothing is recorded
+    calculate_cost_of_all_papers(None, 1, 2022)
+
+    assert npbc_core.STAGE_TIMINGS is None
+    assert stop_stage_timings() == {}
+
+
+def test_normalizing_sql():
+    assert normalize_sql("SELECT * FROM bills WHERE year = 2022 AND\n    name = 'it''s' AND stale = 0;") == "SELECT * FROM bills WHERE year = ? AND name = ? AND stale = ?;"
+    assert normalize_sql("SELECT paper1 FROM papers_days_cost WHERE cost > 1.5;") == "SELECT paper1 FROM papers_days_cost WHERE cost > ?;"
+
+
+def test_tracing_sql(papers_database, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'SQL_TRACER', None)
+
+    tracer = start_sql_trace()
+    add_undelivered_strings([(1, '5', 1, 2022), (2, '6', 1, 2022)])
+    query_database(*generate_parameterized_query('papers', conditions={'paper_id': 1}))
+    query_database("SELECT * FROM papers;")
+
+    assert stop_sql_trace() is tracer
+
+    statistics = {
+        statement['statement']: statement
+        for statement in tracer.get_report()
+    }
+
+    # one call adds both strings, and SQLite reports running it for each
+    insert = statistics['INSERT INTO undelivered_strings (string, paper_id, month, year, mask, parser_version) VALUES (?, ?, ?, ?, ?, ?);']
+    assert (insert['calls'], insert['rows']) == (1, 0)
+    assert insert['runs'] >= 2
+
+    assert statistics['SELECT * FROM papers;']['rows'] == 3
+    assert statistics['SELECT * FROM papers WHERE paper_id = ?;']['rows'] == 1
+    assert all(statement['total_ms'] >= 0 for statement in statistics.values())
+
+    plans = tracer.explain_query_plans()
+
+    assert plans['SELECT * FROM papers;'] == (['SCAN papers'], True)
+    assert not plans['SELECT * FROM papers WHERE paper_id = ?;'][1]
+
+    # connections opened after the trace is stopped aren't traced
+    query_database("SELECT * FROM papers;")
+
+    assert tracer.get_report() == list(statistics.values())
+
+
+def test_formatting_metrics(tmp_path):
+    metrics = MetricsRegistry()
+    metrics.inc('npbc_calculations_total')
+    metrics.inc('npbc_calculations_total', 2)
+    metrics.observe('npbc_stage_seconds', 0.002, stage='parse')
+    metrics.observe('npbc_stage_seconds', 20, stage='parse')
+    metrics.inc('other_total', command='say "hi"')
+
+    lines = metrics.format().splitlines()
+
+    assert lines[:3] == [
+        '# HELP npbc_calculations_total Months of bills calculated.',
+        '# TYPE npbc_calculations_total counter',
+        'npbc_calculations_total 3'
+    ]
+    assert 'other_total{command="say \\"hi\\""} 1' in lines
+    assert '# TYPE npbc_stage_seconds histogram' in lines
+    assert 'npbc_stage_seconds_bucket{stage="parse",le="0.001"} 0' in lines
+    assert 'npbc_stage_seconds_bucket{stage="parse",le="0.005"} 1' in lines
+    assert 'npbc_stage_seconds_bucket{stage="parse",le="5"} 1' in lines
+    assert 'npbc_stage_seconds_bucket{stage="parse",le="+Inf"} 2' in lines
+    assert 'npbc_stage_seconds_sum{stage="parse"} 20.002' in lines
+    assert 'npbc_stage_seconds_count{stage="parse"} 2' in lines
+
+    metrics.write(tmp_path / 'npbc.prom')
+
+    assert (tmp_path / 'npbc.prom').read_text() == metrics.format()
+    assert MetricsRegistry().format() == ''
+
+
+def test_recording_metrics(papers_database, monkeypatch, capsys):
+    monkeypatch.setattr(npbc_core, 'METRICS', npbc_core.METRICS)
+
+    assert not npbc_core.METRICS.enabled
+
+    # nothing is recorded while metrics are off
+    calculate_cost_of_all_papers(None, 1, 2022)
+
+    metrics = enable_metrics()
+    calculate_cost_of_all_papers(None, 1, 2022)
+    list(calculate_cost_for_range(date_type(2022, 1, 1), date_type(2022, 3, 1)))
+    parse_undelivered_string_to_mask('5-', 1, 2022)
+
+    assert "Congratulations!" in capsys.readouterr().out
+
+    disable_metrics()
+    calculate_cost_of_all_papers(None, 1, 2022)
+
+    assert metrics.counters == {
+        ('npbc_calculations_total', ()): 4,
+        ('npbc_papers_billed_total', ()): 12,
+        ('npbc_parse_failures_total', ()): 1
+    }
+    assert ('npbc_stage_seconds', (('stage', 'load bills'), )) in metrics.histograms
+    assert metrics.histograms[('npbc_stage_seconds', (('stage', 'compute'), ))][2] == 4
+
+
+def test_getting_papers(papers_database):
+    edit_existing_paper(2, days_cost=[0, 0, 2.5, 2, 5, 0, 1])
+
+    assert list(get_papers()) == list(iterate_papers())
+    assert list(get_papers(['costs', 'paper_id'])) == [('1;2;3;4;5;6;7', 1), ('0;0;2.5;2;5;0;1', 2), ('0;0;0;0;0;0;0', 3)]
+    assert list(get_papers(['days'])) == [('YYYYYYY', ), ('NNYYYNY', ), ('NNNNNNN', )]
+    assert list(get_papers(['name'])) == [('paper1', ), ('paper2', ), ('paper3', )]
+
+    with raises(ValueError):
+        get_papers(['paper_id', 'price'])
+
+
+def test_getting_papers_with_days_stored_out_of_order(papers_database):
+    with get_connection() as connection:
+        connection.execute("INSERT INTO papers (name) VALUES ('paper4');")
+
+        # the days are stored from Sunday back to Monday, so the order they are read in can't come from the order they were written in
+        for day_id in reversed(range(7)):
+            connection.execute("INSERT INTO papers_days_delivered (paper_id, day_id, delivered) VALUES (4, ?, ?);", (day_id, int(day_id >= 5)))
+            connection.execute("INSERT INTO papers_days_cost (paper_id, day_id, cost) VALUES (4, ?, ?);", (day_id, day_id + 1))
+
+    assert list(get_papers())[3] == (4, 'paper4', 'NNNNNYY', '1;2;3;4;5;6;7')
+    assert list(get_papers(['costs']))[3] == ('1;2;3;4;5;6;7', )
+
+
+def test_paging_through_logs(papers_database):
+    add_undelivered_strings([
+        (1, '1', 11, 2021),
+        (2, '2', 12, 2021),
+        (1, '3', 1, 2022),
+        (1, '4', 2, 2022),
+        (1, '5', 3, 2022)
+    ])
+
+    columns = ['entry_id', 'paper_id', 'string']
+
+    assert [entry for _, *entry in iterate_log_entries('undelivered_strings', columns)] == [
+        [1, '1'], [2, '2'], [1, '3'], [1, '4'], [1, '5']
+    ]
+
+    # pages of two, one after the other
+    first_page = list(iterate_log_entries('undelivered_strings', columns, conditions={'paper_id': 1}, limit=2))
+    second_page = list(iterate_log_entries('undelivered_strings', columns, conditions={'paper_id': 1}, after=first_page[-1][0], limit=2))
+
+    assert [string for *_, string in first_page + second_page] == ['1', '3', '4', '5']
+
+    # the range of months is inclusive, and crosses the end of a year
+    assert [
+        string
+        for *_, string in iterate_log_entries('undelivered_strings', columns, since=date_type(2021, 12, 1), until=date_type(2022, 2, 1))
+    ] == ['2', '3', '4']
+    assert [
+        string
+        for *_, string in iterate_log_entries('undelivered_strings', columns, conditions={'paper_id': 1}, since=date_type(2022, 2, 1))
+    ] == ['4', '5']
+
+    # on both logs, the entries of a paper in a range of months are found with an index,
+    # and a page (of all entries, or those of a paper) starts with a lookup of the last entry_id, and needs no sorting
+    for table_name in ('undelivered_strings', 'undelivered_dates'):
+        months_plan = query_database(
+            f"EXPLAIN QUERY PLAN SELECT entry_id FROM {table_name} WHERE paper_id = ? AND year >= ? AND year * 12 + month >= ? ORDER BY entry_id;",
+            (1, 2022, 2022 * 12 + 1)
+        )
+        page_plan = query_database(f"EXPLAIN QUERY PLAN SELECT entry_id FROM {table_name} WHERE entry_id > ? ORDER BY entry_id LIMIT ?;", (0, 10))
+        paper_page_plan = query_database(
+            f"EXPLAIN QUERY PLAN SELECT entry_id FROM {table_name} WHERE paper_id = ? AND entry_id > ? ORDER BY entry_id LIMIT ?;",
+            (1, 0, 10)
+        )
+
+        assert 'INDEX' in months_plan[0][3] and '(paper_id=? AND year>?)' in months_plan[0][3]
+        assert page_plan == [(page_plan[0][0], 0, 0, f"SEARCH {table_name} USING INTEGER PRIMARY KEY (rowid>?)")]
+        assert len(paper_page_plan) == 1
+        assert 'INDEX' in paper_page_plan[0][3] and '(paper_id=? AND rowid>?)' in paper_page_plan[0][3]
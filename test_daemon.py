@@ -0,0 +1,89 @@
+from os import getuid, stat
+from stat import S_IMODE
+from threading import Thread
+
+from pytest import fixture, raises
+
+import npbc_core
+import npbc_daemon
+from npbc_cli import can_run_in_daemon, define_and_read_args, getpapers
+from npbc_core import enable_metrics
+from npbc_daemon import create_server, run_in_daemon
+
+
+## a daemon running in the background, on a DB with a few papers in it
+@fixture
+def socket_path(papers_database, tmp_path):
+    socket_path = str(tmp_path / 'npbc.sock')
+    server = create_server(socket_path)
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+
+    yield socket_path
+
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_commands_run_in_daemon(socket_path, papers_database, capsys, monkeypatch):
+    output, error = run_in_daemon(['getpapers', '-n'], socket_path) # type: ignore
+
+    getpapers(define_and_read_args(['getpapers', '-n']))
+
+    assert error is None
+    assert output == capsys.readouterr().out
+    assert 'paper2' in output
+
+    # files are relative to the directory of the CLI that sent the command
+    monkeypatch.chdir(papers_database.parent)
+    output, error = run_in_daemon(['exportpapers', '-f', 'papers.csv'], socket_path) # type: ignore
+
+    assert error is None
+    assert (papers_database.parent / 'papers.csv').read_text().startswith('paper_id,name,days,costs')
+
+
+def test_only_the_owner_can_send_commands(socket_path, monkeypatch):
+    assert S_IMODE(stat(socket_path).st_mode) == 0o600
+
+    # a connection from any other user is closed without running anything, so the CLI runs the command itself
+    monkeypatch.setattr(npbc_daemon, 'get_peer_uid', lambda _: getuid() + 1)
+
+    assert run_in_daemon(['getpapers', '-n'], socket_path) is None
+
+
+def test_only_one_daemon_runs(socket_path):
+    assert run_in_daemon([], socket_path) == ('', None)
+
+    with raises(ValueError, match="already running"):
+        create_server(socket_path)
+
+
+def test_falling_back_without_daemon(tmp_path):
+    assert run_in_daemon(['getpapers'], str(tmp_path / 'npbc.sock')) is None
+
+    assert can_run_in_daemon(define_and_read_args(['getpapers']))
+    assert not can_run_in_daemon(define_and_read_args(['addudl', '-f', '-']))
+    assert not can_run_in_daemon(define_and_read_args(['exportpapers']))
+    assert not can_run_in_daemon(define_and_read_args(['daemon']))
+
+
+def test_daemon_writes_metrics(papers_database, tmp_path, monkeypatch):
+    monkeypatch.setattr(npbc_core, 'METRICS', npbc_core.METRICS)
+    enable_metrics()
+
+    socket_path = str(tmp_path / 'metrics.sock')
+    server = create_server(socket_path, str(tmp_path / 'npbc.prom'))
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        run_in_daemon(['getpapers', '-n'], socket_path)
+        run_in_daemon(['getpapers', '-n'], socket_path)
+
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+    assert 'npbc_command_seconds_count{command="getpapers"} 2\n' in (tmp_path / 'npbc.prom').read_text()
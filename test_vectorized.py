@@ -0,0 +1,91 @@
+from datetime import date as date_type
+
+from pytest import mark
+
+from npbc_core import (calculate_cost_of_all_papers,
+                       calculate_cost_of_one_paper,
+                       get_cost_and_delivery_data_of_all_papers,
+                       get_number_of_days_per_week)
+from npbc_vectorized import (build_cost_and_delivery_matrices,
+                             build_undelivered_counts, calculate_bills,
+                             calculate_cost_of_all_papers_for_months,
+                             get_days_per_week_matrix)
+
+## the same fixtures as test_calculating_cost_of_one_paper in test_core.py
+DAYS_PER_WEEK = [5, 4, 4, 4, 4, 5, 5]
+COST_PER_DAY: dict[int, float] = {0: 0, 1: 0, 2: 2, 3: 2, 4: 5, 5: 0, 6: 1}
+DELIVERY_DATA: dict[int, bool] = {0: False, 1: False, 2: True, 3: True, 4: True, 5: False, 6: True}
+DELIVERY_DATA_NO_SUNDAYS: dict[int, bool] = {0: False, 1: False, 2: True, 3: True, 4: True, 5: False, 6: False}
+
+CASES = [
+    (set([]), DELIVERY_DATA, 41),
+    (set([]), DELIVERY_DATA_NO_SUNDAYS, 36),
+    (set([date_type(year=2022, month=1, day=8)]), DELIVERY_DATA, 41),
+    (set([date_type(year=2022, month=1, day=8), date_type(year=2022, month=1, day=17)]), DELIVERY_DATA, 41),
+    (set([date_type(year=2022, month=1, day=2)]), DELIVERY_DATA, 40),
+    (set([date_type(year=2022, month=1, day=6), date_type(year=2022, month=1, day=7)]), DELIVERY_DATA, 34),
+    (set([date_type(year=2022, month=1, day=6), date_type(year=2022, month=1, day=7), date_type(year=2022, month=1, day=8)]), DELIVERY_DATA, 34)
+]
+
+
+@mark.parametrize('undelivered_dates, delivery_data, expected', CASES)
+def test_vectorized_cost_of_one_paper(undelivered_dates, delivery_data, expected):
+    paper_ids, cost_matrix, delivery_mask = build_cost_and_delivery_matrices({1: (COST_PER_DAY, delivery_data)})
+
+    bills = calculate_bills(
+        cost_matrix,
+        delivery_mask,
+        get_days_per_week_matrix([(1, 2022)]),
+        build_undelivered_counts([{1: undelivered_dates}], paper_ids)
+    )
+
+    assert bills.shape == (1, 1)
+    assert bills[0, 0] == expected
+    assert bills[0, 0] == calculate_cost_of_one_paper(DAYS_PER_WEEK, undelivered_dates, (COST_PER_DAY, delivery_data))
+
+
+def test_vectorized_cost_of_all_cases_at_once():
+    cost_and_delivery_data = {
+        paper_id: (COST_PER_DAY, delivery_data)
+        for paper_id, (_, delivery_data, _) in enumerate(CASES)
+    }
+
+    paper_ids, cost_matrix, delivery_mask = build_cost_and_delivery_matrices(cost_and_delivery_data)
+
+    bills = calculate_bills(
+        cost_matrix,
+        delivery_mask,
+        get_days_per_week_matrix([(1, 2022)]),
+        build_undelivered_counts([{paper_id: undelivered_dates for paper_id, (undelivered_dates, _, _) in enumerate(CASES)}], paper_ids)
+    )
+
+    assert list(bills[0]) == [expected for _, _, expected in CASES]
+
+
+def test_days_per_week_matrix():
+    months = [(month, year) for year in range(1990, 2030) for month in range(1, 13)]
+
+    assert get_days_per_week_matrix(months).tolist() == [
+        get_number_of_days_per_week(month, year)
+        for month, year in months
+    ]
+
+
+def test_vectorized_cost_for_many_months(papers_database):
+    months = [(month, year) for year in range(2020, 2023) for month in range(1, 13)]
+    undelivered_strings = {
+        (1, 2022): {2: '2'},
+        (5, 2021): {1: 'mondays, 3-wednesday', 3: '1-31'}
+    }
+
+    assert calculate_cost_of_all_papers_for_months(months, undelivered_strings) == [
+        calculate_cost_of_all_papers(undelivered_strings.get((month, year), {}), month, year)
+        for month, year in months
+    ]
+
+    # papers with no undelivered dates and no delivery at all cost nothing in every month
+    paper_ids, cost_matrix, delivery_mask = build_cost_and_delivery_matrices(get_cost_and_delivery_data_of_all_papers())
+    bills = calculate_bills(cost_matrix, delivery_mask, get_days_per_week_matrix(months))
+
+    assert bills.shape == (len(months), 3)
+    assert not bills[:, paper_ids.index(3)].any()